@@ -0,0 +1,245 @@
+"""不依赖真实桌面的 pyautogui（和 pyperclip）替身，用于在无显示器的环境中运行工具和基准测试
+
+    from benchmarks.fake_backends import install_fake_gui
+    screen = install_fake_gui()          # 必须在导入 tools.mouse_keyboard_tools / tools.visual_tools 之前调用
+    template = screen.add_icon(200, 150)  # 在屏幕上放置一个图标，返回图标图像路径
+"""
+import os
+import sys
+import time
+import types
+import threading
+import tempfile
+import collections
+import numpy as np
+from typing import Optional
+from PIL import Image
+
+Box = collections.namedtuple('Box', 'left top width height')
+Point = collections.namedtuple('Point', 'x y')
+
+class ImageNotFoundException(Exception):
+    pass
+
+class FakeScreen:
+    """模拟的屏幕和输入设备：屏幕内容是内存中的像素数组，鼠标键盘操作只记录到事件列表
+
+    参数:
+        width: 屏幕宽度
+        height: 屏幕高度
+        action_latency: 每次输入操作额外的耗时（秒），模拟系统处理输入事件的延迟
+        capture_latency: 每次截图额外的耗时（秒）
+        response_latency: 点击后经过多少秒在点击位置弹出菜单（改变屏幕内容），模拟界面响应的延迟；为None时点击不改变屏幕
+    """
+
+    def __init__(self, width: int = 1920, height: int = 1080, action_latency: float = 0.0, capture_latency: float = 0.0,
+                 response_latency: Optional[float] = None):
+        self.width = width
+        self.height = height
+        self.action_latency = action_latency
+        self.capture_latency = capture_latency
+        self.response_latency = response_latency
+        self.menus = 0
+        rng = np.random.default_rng(0)
+        # 随机像素背景，保证图标不会在其他位置被误匹配
+        self.pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        self.mouse = Point(width // 2, height // 2)
+        self.events = []
+        self.icon_dir = tempfile.mkdtemp(prefix='fake_screen_')
+        self.icon_count = 0
+        # 输入到当前焦点窗口的文本和剪贴板内容，文本框的位置（最后一次点击的位置，没有点击过时为鼠标位置）
+        self.typed = ''
+        self.caret = None
+        self.clipboard = ''
+
+    def add_icon(self, x: int, y: int, width: int = 48, height: int = 48) -> str:
+        """在指定位置绘制一个图标并保存为PNG，返回图标文件路径"""
+        rng = np.random.default_rng(self.icon_count + 1)
+        icon = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        self.pixels[y:y + height, x:x + width] = icon
+        self.icon_count += 1
+        path = os.path.join(self.icon_dir, f"icon_{self.icon_count}.png")
+        Image.fromarray(icon).save(path)
+        return path
+
+    def record(self, action: str, *args) -> None:
+        self.events.append((action,) + args)
+        if self.action_latency:
+            time.sleep(self.action_latency)
+
+    def respond(self, x: int, y: int) -> None:
+        """设置了 response_latency 时，延迟后在点击位置右下方绘制一个菜单"""
+        if self.response_latency is None:
+            return
+
+        def open_menu():
+            top, left = min(y, self.height - 120), min(x, self.width - 120)
+            self.pixels[top:top + 120, left:left + 120] = 255 - self.pixels[top:top + 120, left:left + 120]
+            self.menus += 1
+        threading.Timer(self.response_latency, open_menu).start()
+
+    def type_into(self, text: str) -> None:
+        """模拟文本框显示输入的文字：在文本框位置右侧反色一小块像素"""
+        self.typed += text
+        caret = self.caret or self.mouse
+        x = min(caret.x + len(self.typed) % 40 * 8, self.width - 8)
+        y = min(caret.y, self.height - 8)
+        self.pixels[y:y + 8, x:x + 8] = 255 - self.pixels[y:y + 8, x:x + 8]
+
+    def capture(self, region=None) -> Image.Image:
+        if self.capture_latency:
+            time.sleep(self.capture_latency)
+        if region:
+            x, y, width, height = region
+            return Image.fromarray(self.pixels[y:y + height, x:x + width].copy())
+        return Image.fromarray(self.pixels.copy())
+
+    def find(self, image, grayscale: bool = False, limit: int = 0):
+        """在屏幕上精确匹配图像，返回匹配位置列表"""
+        needle = np.asarray(Image.open(image).convert('RGB') if isinstance(image, str) else image.convert('RGB'))
+        haystack = self.pixels
+        if grayscale:
+            needle = needle.mean(axis=2).astype(np.uint8)
+            haystack = haystack.mean(axis=2).astype(np.uint8)
+        height, width = needle.shape[:2]
+        # 先用左上角像素筛选候选位置，再逐个比较整个图像
+        first = needle[0, 0]
+        candidates = np.all(haystack[:self.height - height + 1, :self.width - width + 1] == first, axis=-1) \
+            if haystack.ndim == 3 else haystack[:self.height - height + 1, :self.width - width + 1] == first
+        boxes = []
+        for top, left in zip(*np.nonzero(candidates)):
+            if np.array_equal(haystack[top:top + height, left:left + width], needle):
+                boxes.append(Box(int(left), int(top), width, height))
+                if limit and len(boxes) >= limit:
+                    break
+        return boxes
+
+def _make_module(screen: FakeScreen) -> types.ModuleType:
+    module = types.ModuleType('pyautogui')
+    module.PAUSE = 0.1
+    module.FAILSAFE = True
+    module.ImageNotFoundException = ImageNotFoundException
+    module.Box = Box
+    module.Point = Point
+    module.screen = screen
+
+    def pause():
+        # 与真实 pyautogui 一样，每个输入操作结束后暂停 PAUSE 秒
+        if module.PAUSE:
+            time.sleep(module.PAUSE)
+
+    def move(x, y, duration=0.0):
+        if duration:
+            time.sleep(duration)
+        screen.mouse = Point(int(x), int(y))
+
+    def size():
+        return screen.width, screen.height
+
+    def position():
+        return screen.mouse
+
+    def moveTo(x=None, y=None, duration=0.0, **kwargs):
+        move(screen.mouse.x if x is None else x, screen.mouse.y if y is None else y, duration)
+        screen.record('moveTo', x, y)
+        pause()
+
+    def moveRel(xOffset=0, yOffset=0, duration=0.0, **kwargs):
+        move(screen.mouse.x + xOffset, screen.mouse.y + yOffset, duration)
+        screen.record('moveRel', xOffset, yOffset)
+        pause()
+
+    def click(x=None, y=None, clicks=1, interval=0.0, button='left', **kwargs):
+        if x is not None and y is not None:
+            move(x, y)
+        screen.record('click', screen.mouse.x, screen.mouse.y, clicks, button)
+        screen.caret = screen.mouse
+        screen.respond(screen.mouse.x, screen.mouse.y)
+        pause()
+
+    def dragTo(x=None, y=None, duration=0.0, button='left', **kwargs):
+        move(x, y, duration)
+        screen.record('dragTo', x, y, button)
+        pause()
+
+    def typewrite(message, interval=0.0, **kwargs):
+        for char in message:
+            screen.record('key', char)
+            if interval:
+                time.sleep(interval)
+        screen.type_into(message)
+        pause()
+
+    def press(keys, presses=1, interval=0.0, **kwargs):
+        for key in [keys] if isinstance(keys, str) else keys:
+            screen.record('press', key)
+        pause()
+
+    def hotkey(*keys, **kwargs):
+        screen.record('hotkey', *keys)
+        if tuple(keys) in (('ctrl', 'v'), ('command', 'v')):
+            screen.type_into(screen.clipboard)
+        pause()
+
+    def scroll(clicks, x=None, y=None, **kwargs):
+        screen.record('scroll', clicks)
+        pause()
+
+    def screenshot(imageFilename=None, region=None):
+        image = screen.capture(region)
+        if imageFilename:
+            image.save(imageFilename)
+        return image
+
+    def pixel(x, y):
+        return tuple(int(value) for value in screen.pixels[y, x])
+
+    def locateOnScreen(image, confidence=None, grayscale=False, region=None, **kwargs):
+        if screen.capture_latency:
+            time.sleep(screen.capture_latency)
+        boxes = screen.find(image, grayscale=grayscale)
+        if region:
+            left, top, width, height = region
+            boxes = [box for box in boxes if left <= box.left and top <= box.top
+                     and box.left + box.width <= left + width and box.top + box.height <= top + height]
+        if not boxes:
+            raise ImageNotFoundException(f"未找到图像 {image}")
+        return boxes[0]
+
+    def locateAllOnScreen(image, confidence=None, grayscale=False, **kwargs):
+        if screen.capture_latency:
+            time.sleep(screen.capture_latency)
+        return iter(screen.find(image, grayscale=grayscale))
+
+    def center(box):
+        return Point(box.left + box.width // 2, box.top + box.height // 2)
+
+    for function in (size, position, moveTo, moveRel, click, dragTo, typewrite, press, hotkey, scroll,
+                     screenshot, pixel, locateOnScreen, locateAllOnScreen, center):
+        setattr(module, function.__name__, function)
+    module.write = typewrite
+    return module
+
+def _make_clipboard_module(screen: FakeScreen) -> types.ModuleType:
+    module = types.ModuleType('pyperclip')
+
+    def copy(text):
+        screen.clipboard = str(text)
+
+    def paste():
+        return screen.clipboard
+
+    module.copy = copy
+    module.paste = paste
+    return module
+
+def fake_modules(screen: FakeScreen) -> dict:
+    """返回使用该屏幕的替身模块 {'pyautogui': ..., 'pyperclip': ...}，由调用方放入 sys.modules"""
+    return {'pyautogui': _make_module(screen), 'pyperclip': _make_clipboard_module(screen)}
+
+def install_fake_gui(width: int = 1920, height: int = 1080, action_latency: float = 0.0,
+                     capture_latency: float = 0.0, response_latency: Optional[float] = None) -> FakeScreen:
+    """用替身替换 pyautogui 模块，返回可用于放置图标和查看操作记录的 FakeScreen"""
+    screen = FakeScreen(width, height, action_latency, capture_latency, response_latency)
+    sys.modules.update(fake_modules(screen))
+    return screen
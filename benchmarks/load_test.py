@@ -0,0 +1,169 @@
+"""服务模式负载测试：多个会话并发提问，报告吞吐量和延迟分位数
+
+默认在本进程中启动替身LLM服务、替身 pyautogui 和会话服务，不需要API密钥和真实桌面：
+
+    python -m benchmarks.load_test --sessions 20 --turns 5 --first-token-delay 0.2 --token-delay 0.01
+
+也可以对已经运行的服务（python computer_expert_agent.py --serve）施压：
+
+    python -m benchmarks.load_test --url http://127.0.0.1:8080 --sessions 10
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import functools
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+import httpx
+from benchmarks.run_benchmarks import DEFAULT_SCENARIOS, percentile, load_agent
+from benchmarks.stand_in_llm import StandInLLMServer, load_scenarios
+
+DEFAULT_OUTPUT = os.path.join(PROJECT_DIR, '.cache', 'benchmarks', 'load_test.json')
+
+async def ask(client: httpx.AsyncClient, base_url: str, session_id: str, prompt: str) -> dict:
+    """提交一个问题并读取事件流，返回耗时、首个输出时间和结果状态"""
+    start = time.perf_counter()
+    first_delta = None
+    event = None
+    result = {'status': 'error', 'error': '事件流意外结束'}
+    async with client.stream('POST', f"{base_url}/sessions/{session_id}/messages", json={'message': prompt}) as response:
+        if response.status_code != 200:
+            body = json.loads(await response.aread() or b'{}')
+            return {'status': 'rejected' if response.status_code in (429, 503) else 'error',
+                    'http_status': response.status_code, 'error': body.get('error'),
+                    'seconds': time.perf_counter() - start, 'ttft': None}
+        async for line in response.aiter_lines():
+            if line.startswith('event:'):
+                event = line[6:].strip()
+            elif line.startswith('data:'):
+                payload = json.loads(line[5:])
+                if event == 'delta' and first_delta is None:
+                    first_delta = time.perf_counter() - start
+                elif event == 'done':
+                    result = {'status': 'ok', 'queue_seconds': payload.get('queue_seconds')}
+                elif event == 'error':
+                    result = {'status': 'error', 'error': payload.get('error'), 'http_status': payload.get('status')}
+    result.update(seconds=time.perf_counter() - start, ttft=first_delta)
+    return result
+
+async def run_session(client: httpx.AsyncClient, base_url: str, index: int, scenarios: list, turns: int) -> list:
+    """创建一个会话并按顺序提问，不同会话从不同的场景开始"""
+    response = await client.post(f"{base_url}/sessions")
+    if response.status_code != 201:
+        return [{'status': 'rejected', 'http_status': response.status_code, 'seconds': 0.0, 'ttft': None}] * turns
+    session_id = response.json()['session_id']
+    results = []
+    for turn in range(turns):
+        scenario = scenarios[(index + turn) % len(scenarios)]
+        result = await ask(client, base_url, session_id, scenario['prompt'])
+        result['scenario'] = scenario['name']
+        results.append(result)
+    await client.delete(f"{base_url}/sessions/{session_id}")
+    return results
+
+def latency_summary(values: list) -> dict:
+    return {
+        'count': len(values),
+        'mean_seconds': round(sum(values) / len(values), 4) if values else 0.0,
+        'p50_seconds': round(percentile(values, 50), 4),
+        'p95_seconds': round(percentile(values, 95), 4),
+        'p99_seconds': round(percentile(values, 99), 4),
+        'max_seconds': round(max(values, default=0.0), 4),
+    }
+
+async def run_load(base_url: str, scenarios: list, sessions: int, turns: int) -> dict:
+    limits = httpx.Limits(max_connections=sessions + 4, max_keepalive_connections=sessions + 4)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600.0), limits=limits) as client:
+        start = time.perf_counter()
+        per_session = await asyncio.gather(*(run_session(client, base_url, index, scenarios, turns)
+                                             for index in range(sessions)))
+        wall = time.perf_counter() - start
+        server_stats = (await client.get(f"{base_url}/stats")).json()
+    results = [result for session in per_session for result in session]
+    ok = [result for result in results if result['status'] == 'ok']
+    errors = [result for result in results if result['status'] == 'error']
+    return {
+        'sessions': sessions,
+        'turns': len(results),
+        'ok': len(ok),
+        'errors': len(errors),
+        'rejected': sum(1 for result in results if result['status'] == 'rejected'),
+        'error_samples': sorted({str(result.get('error')) for result in errors})[:5],
+        'wall_seconds': round(wall, 4),
+        'throughput_turns_per_second': round(len(ok) / wall, 4) if wall else 0.0,
+        'latency': latency_summary([result['seconds'] for result in ok]),
+        'ttft': latency_summary([result['ttft'] for result in ok if result['ttft'] is not None]),
+        'queue': latency_summary([result['queue_seconds'] for result in ok if result.get('queue_seconds') is not None]),
+        'server': server_stats,
+    }
+
+async def run_in_process(args, scenarios: list) -> dict:
+    """在本进程中启动替身LLM服务、替身GUI和会话服务后施压"""
+    from benchmarks.fake_backends import install_fake_gui
+    from core.session_server import SessionServer
+    screen = install_fake_gui(action_latency=args.action_latency)
+    icon = screen.add_icon(640, 360)
+    temp_dir = tempfile.mkdtemp(prefix='agent_load_')
+    llm_server = StandInLLMServer(scenarios, first_token_delay=args.first_token_delay, token_delay=args.token_delay).start()
+    llm_server.variables = {'tmp': temp_dir.replace('\\', '/'), 'icon': icon.replace('\\', '/')}
+    try:
+        agent, _startup = load_agent(llm_server)
+        manager = agent.create_session_manager()
+        if args.no_cache:
+            manager.run_turn_function = functools.partial(agent.run_computer_expert_agent_stream, use_cache=False)
+        server = await SessionServer(manager, port=0, extra_stats=agent.server_stats).start()
+        try:
+            results = await run_load(server.base_url, scenarios, args.sessions, args.turns)
+        finally:
+            await server.stop()
+        results['llm_server'] = dict(llm_server.stats)
+        return results
+    finally:
+        llm_server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="服务模式负载测试")
+    parser.add_argument('--url', help="已运行的服务地址；不指定时在本进程中启动替身服务")
+    parser.add_argument('--sessions', type=int, default=20, help="并发会话数")
+    parser.add_argument('--turns', type=int, default=5, help="每个会话的提问轮数")
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS, help="提问使用的场景文件")
+    parser.add_argument('--first-token-delay', type=float, default=0.2, help="替身LLM首个token的延迟（秒）")
+    parser.add_argument('--token-delay', type=float, default=0.01, help="替身LLM每个数据块之间的延迟（秒）")
+    parser.add_argument('--action-latency', type=float, default=0.0, help="替身鼠标键盘每次操作的额外耗时（秒）")
+    parser.add_argument('--no-cache', action='store_true', help="不使用回答缓存（仅本进程模式）")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="结果JSON文件路径")
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.scenarios)
+    if args.url:
+        results = asyncio.run(run_load(args.url.rstrip('/'), scenarios, args.sessions, args.turns))
+    else:
+        results = asyncio.run(run_in_process(args, scenarios))
+    results['config'] = vars(args)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    latency = results['latency']
+    print(f"{results['sessions']} 个会话, 共 {results['turns']} 轮: 成功 {results['ok']}, 出错 {results['errors']}, "
+          f"被拒绝 {results['rejected']}")
+    print(f"吞吐量 {results['throughput_turns_per_second']:.2f} 轮/秒 (总耗时 {results['wall_seconds']:.2f}s)")
+    print(f"整轮耗时 p50 {latency['p50_seconds'] * 1000:.0f}ms, p95 {latency['p95_seconds'] * 1000:.0f}ms, "
+          f"p99 {latency['p99_seconds'] * 1000:.0f}ms; 首个输出 p99 {results['ttft']['p99_seconds'] * 1000:.0f}ms; "
+          f"排队 p99 {results['queue']['p99_seconds'] * 1000:.0f}ms")
+    gui = results['server'].get('gui_lock')
+    if gui:
+        print(f"GUI工具: 调用 {gui['calls']} 次, 排队 {gui['contended']} 次, 最长等待 {gui['max_wait_seconds'] * 1000:.0f}ms")
+    for sample in results['error_samples']:
+        print(f"  错误: {sample}")
+    print(f"结果已写入: {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,497 @@
+"""离线基准测试：用替身LLM服务和替身 pyautogui 运行完整的对话循环，不需要API密钥和真实桌面
+
+    python -m benchmarks.run_benchmarks --turns 30 --output .cache/benchmarks/latest.json
+    python -m benchmarks.run_benchmarks --baseline .cache/benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --soak 1000 --soak-trace   # 长时间运行测试，检查内存是否持续增长
+
+测量内容：每轮对话的端到端耗时、首个token时间、智能体循环自身的开销（总耗时减去LLM和工具耗时）、
+各工具的延迟、截图和图像匹配的吞吐量，以及多轮对话后的内存增长。结果写入JSON文件；
+指定 --baseline 时逐项对比，耗时或内存变差超过阈值的指标视为退化，退出码为1。
+"""
+import os
+import io
+import gc
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from benchmarks.fake_backends import install_fake_gui
+from benchmarks.stand_in_llm import StandInLLMServer, load_scenarios
+from tools.action_pacing import PACER
+from core.memory_monitor import current_rss_bytes
+
+DEFAULT_SCENARIOS = os.path.join(PROJECT_DIR, 'benchmarks', 'scenarios.json')
+DEFAULT_OUTPUT = os.path.join(PROJECT_DIR, '.cache', 'benchmarks', 'latest.json')
+DEFAULT_SOAK_OUTPUT = os.path.join(PROJECT_DIR, '.cache', 'benchmarks', 'soak.json')
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+def summarize(values) -> dict:
+    """汇总一组耗时（秒）"""
+    return {
+        'count': len(values),
+        'mean_seconds': round(sum(values) / len(values), 6) if values else 0.0,
+        'p50_seconds': round(percentile(values, 50), 6),
+        'p95_seconds': round(percentile(values, 95), 6),
+        'max_seconds': round(max(values, default=0.0), 6),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def use_offline_tokenizer_if_needed():
+    """tiktoken 无法下载编码文件时（离线环境），改用估算的token数计算记忆长度"""
+    from llama_index.core import set_global_tokenizer
+    from llama_index.core.utils import get_tokenizer
+    try:
+        get_tokenizer()('test')
+    except Exception:
+        from tools.text_search import estimate_tokens
+        set_global_tokenizer(lambda text: [0] * estimate_tokens(text))
+
+def measure_help_seconds() -> float:
+    """在新进程中运行 --help 的耗时，反映命令行启动速度"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(PROJECT_DIR, 'computer_expert_agent.py'), '--help'],
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=PROJECT_DIR)
+    return time.perf_counter() - start
+
+def load_agent(server):
+    """安装替身后台并导入智能体模块，返回 (模块, 启动耗时)"""
+    os.environ['QIANWEN_API_KEY'] = 'stand-in'
+    os.environ['QIANWEN_API_BASE'] = server.base_url
+    start = time.perf_counter()
+    import computer_expert_agent as agent
+    import_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    agent.prepare_agent()
+    startup = {
+        'help_seconds': round(measure_help_seconds(), 4),
+        'import_seconds': round(import_seconds, 4),
+        'agent_ready_seconds': round(time.perf_counter() - start, 4),
+    }
+    from core.instrumentation import StreamMetrics
+
+    class RecordingMetrics(StreamMetrics):
+        """保留每轮记录，不写入 .cache/metrics"""
+        def __init__(self):
+            super().__init__(jsonl_path=None, prometheus_path=None)
+            self.records = []
+
+        def finish_turn(self, trace, status='ok'):
+            record = super().finish_turn(trace, status)
+            self.records.append(record)
+            return record
+
+    agent.stream_metrics = RecordingMetrics()
+    agent.tool_profiler.dump_path = None
+    agent.prefetcher.history_path = None
+    use_offline_tokenizer_if_needed()
+    return agent, startup
+
+async def run_turns(agent, scenarios, server, turns: int, on_turn=None) -> list:
+    """在同一个会话中按顺序循环提问，返回每轮的测量结果"""
+    from llama_index.core.workflow import Context
+    ctx = Context(agent.get_agent())
+    results = []
+    for index in range(turns):
+        scenario = scenarios[index % len(scenarios)]
+        server_seconds = server.stats['seconds']
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            await agent.run_computer_expert_agent_stream(scenario['prompt'], ctx=ctx, use_cache=False)
+        wall = time.perf_counter() - start
+        record = agent.stream_metrics.records[-1]
+        results.append({
+            'scenario': scenario['name'],
+            'status': record['status'],
+            'total': wall,
+            'ttft': record['ttft_seconds'],
+            'llm': record['llm_seconds'],
+            'tool': record['tool_seconds'],
+            'server': server.stats['seconds'] - server_seconds,
+        })
+        if on_turn:
+            on_turn(index)
+    return results
+
+def summarize_turns(results: list) -> dict:
+    def section(rows):
+        return {
+            'turns': len(rows),
+            'errors': sum(row['status'] != 'ok' for row in rows),
+            'total': summarize([row['total'] for row in rows]),
+            'ttft': summarize([row['ttft'] for row in rows if row['ttft'] is not None]),
+            'llm': summarize([row['llm'] for row in rows]),
+            'tool': summarize([row['tool'] for row in rows]),
+            # 智能体循环的开销：工作流调度、工具选择、上下文压缩等，不含LLM和工具本身的耗时
+            'agent_overhead': summarize([max(0.0, row['total'] - row['llm'] - row['tool']) for row in rows]),
+            # LLM客户端的开销：客户端观测到的LLM耗时减去替身服务端的处理时间
+            'llm_client_overhead': summarize([max(0.0, row['llm'] - row['server']) for row in rows]),
+        }
+    summary = {'overall': section(results), 'scenarios': {}}
+    for name in dict.fromkeys(row['scenario'] for row in results):
+        summary['scenarios'][name] = section([row for row in results if row['scenario'] == name])
+    return summary
+
+def time_calls(function, kwargs: dict, iterations: int) -> dict:
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function(**kwargs)
+        durations.append(time.perf_counter() - start)
+    result = summarize(durations)
+    result['ops_per_second'] = round(iterations / sum(durations), 3) if sum(durations) else 0.0
+    return result
+
+def run_tool_benchmarks(screen, icon: str, temp_dir: str, iterations: int) -> dict:
+    """直接调用工具函数（不经过LLM），测量每次调用的延迟"""
+    from tools import mouse_keyboard_tools, visual_tools, file_operations, knowledge_base
+    cases = {
+        'get_mouse_position': (mouse_keyboard_tools.get_mouse_position, {}),
+        'move_mouse': (mouse_keyboard_tools.move_mouse, {'x': 100, 'y': 100}),
+        'click_mouse': (mouse_keyboard_tools.click_mouse, {'x': 120, 'y': 120}),
+        'type_text': (mouse_keyboard_tools.type_text, {'text': 'hello world'}),
+        'safe_click_sequence': (mouse_keyboard_tools.safe_click_sequence, {'clicks': [(120, 120, 'left')] * 5}),
+        'get_screen_color_at': (visual_tools.get_screen_color_at, {'x': 10, 'y': 10}),
+        'locate_on_screen': (visual_tools.locate_on_screen, {'image_path': icon}),
+        'read_tutorial': (file_operations.read_tutorial, {'query': '磁盘清理'}),
+        'search_knowledge_base': (knowledge_base.search_knowledge_base, {'query': '磁盘空间不足'}),
+        'list_directory': (file_operations.list_directory, {'directory_path': temp_dir}),
+    }
+    return {name: time_calls(function, kwargs, iterations) for name, (function, kwargs) in cases.items()}
+
+def run_capture_match_benchmarks(screen, icon: str, iterations: int) -> dict:
+    """截图和图像匹配的吞吐量"""
+    from tools import visual_tools
+    megapixels = screen.width * screen.height / 1e6
+    results = {
+        'full_screenshot': time_calls(visual_tools.take_screenshot, {}, iterations),
+        'region_capture': time_calls(visual_tools.capture_screen_region, {'x': 0, 'y': 0, 'width': 400, 'height': 300}, iterations),
+        'locate_color': time_calls(visual_tools.locate_on_screen, {'image_path': icon}, iterations),
+        'locate_grayscale': time_calls(visual_tools.locate_on_screen, {'image_path': icon, 'grayscale': True}, iterations),
+    }
+    for name in ('full_screenshot', 'locate_color', 'locate_grayscale'):
+        results[name]['megapixels_per_second'] = round(results[name]['ops_per_second'] * megapixels, 3)
+    return results
+
+def run_text_entry_benchmarks(screen, iterations: int) -> dict:
+    """不同长度和字符的文本用各种输入方式的吞吐量；legacy_seconds 为原来逐字输入（每个字符间隔0.05秒）的估算耗时"""
+    from tools import text_entry
+    long_text = ("for i in range(10):\n    print(i)\n" * 80)[:2000]
+    cases = {
+        'short_auto': ('hello world 123', 'auto'),
+        'long_paste': (long_text, 'paste'),
+        'long_keys': (long_text, 'keys'),
+        'long_auto': (long_text, 'auto'),
+        'chinese_auto': ('打开控制面板并检查磁盘空间，' * 36, 'auto'),
+    }
+    results = {}
+    for name, (text, method) in cases.items():
+        durations = []
+        content_ok = True
+        for _ in range(iterations):
+            screen.typed = ''
+            start = time.perf_counter()
+            result = text_entry.enter_text(text, method=method)
+            durations.append(time.perf_counter() - start)
+            content_ok = content_ok and screen.typed == text
+        summary = summarize(durations)
+        summary.update(chars=len(text), method=result['method'], content_ok=content_ok,
+                       chars_per_second=round(len(text) * iterations / sum(durations), 1) if sum(durations) else 0.0,
+                       legacy_seconds=round(len(text) * 0.05 + 0.1, 2) if text_entry.is_typeable(text) else None)
+        results[name] = summary
+    return results
+
+async def run_work_unit_benchmarks(agent, server, collect_seconds: float = 0.2) -> dict:
+    """诊断工作流（core/diagnosis.py）：收集单元是否并发执行，重复诊断时分析单元是否使用缓存
+
+    收集工具换成固定耗时、固定输出的替身（真实工具依赖wmic），分析单元通过替身LLM执行。
+    """
+    from core.diagnosis import COLLECTORS, run_diagnosis
+    from core.work_units import WorkUnitEngine
+    question = '基准测试：电脑运行很慢'
+    analysis = {'causes': ['内存占用过高'], 'steps': ['关闭占用内存最多的进程']}
+    server.scenarios.append({'name': 'work_units', 'prompt': question,
+                             'steps': [{'content': json.dumps(analysis, ensure_ascii=False)}]})
+
+    def resolve_tool(name):
+        def tool():
+            time.sleep(collect_seconds)
+            return f"{name} 的替身输出"
+        return tool
+
+    cache_dir = tempfile.mkdtemp(prefix='agent_work_units_')
+    engine = WorkUnitEngine(agent.get_component('llm'), cache_dir=cache_dir)
+    runs = []
+    try:
+        for _ in range(2):
+            requests_before = server.stats['requests']
+            start = time.perf_counter()
+            results = await run_diagnosis(engine, question, resolve_tool)
+            runs.append({
+                'seconds': round(time.perf_counter() - start, 4),
+                'collect_seconds': round(max(results[name].duration for name in COLLECTORS), 4),
+                'statuses': {name: result.status for name, result in results.items()},
+                'llm_requests': server.stats['requests'] - requests_before,
+            })
+    finally:
+        server.scenarios.pop()
+    return {'collectors': len(COLLECTORS), 'serial_collect_seconds': round(collect_seconds * len(COLLECTORS), 4),
+            'first_run': runs[0], 'second_run': runs[1]}
+
+async def run_memory_benchmark(agent, scenarios, server, turns: int) -> dict:
+    """多轮对话中的内存增长（tracemalloc会拖慢运行，因此与延迟测量分开进行）"""
+    gc.collect()
+    rss_start = current_rss_bytes()
+    tracemalloc.start()
+    samples = []
+
+    def sample(_index):
+        samples.append(tracemalloc.get_traced_memory()[0])
+
+    await run_turns(agent, scenarios, server, turns, on_turn=sample)
+    gc.collect()
+    end_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # 用后一半样本估计每轮的增长，排除首次导入和缓存预热的影响
+    tail = samples[len(samples) // 2:]
+    growth = (tail[-1] - tail[0]) / (len(tail) - 1) if len(tail) > 1 else 0.0
+    rss_end = current_rss_bytes()
+    return {
+        'turns': turns,
+        'traced_start_bytes': samples[0] if samples else 0,
+        'traced_end_bytes': end_bytes,
+        'traced_peak_bytes': peak_bytes,
+        'growth_bytes_per_turn': round(growth, 1),
+        'rss_start_bytes': rss_start,
+        'rss_end_bytes': rss_end,
+        'context_tokens': agent.context_manager.turn_tokens[-1][1] if agent.context_manager.turn_tokens else 0,
+    }
+
+async def run_soak(agent, scenarios, server, turns: int, trace: bool = False) -> dict:
+    """长时间运行测试：在同一个会话中连续进行 turns 轮对话，每轮记录内存统计（MemoryMonitor 在每轮结束后记录）"""
+    monitor = agent.get_component('memory_monitor')
+    if trace:
+        tracemalloc.start()
+        monitor.trace_allocations = True
+    samples = []
+
+    def on_turn(index):
+        if not monitor.samples:
+            return
+        sample = monitor.samples[-1]
+        samples.append({
+            'turn': index + 1,
+            'rss_bytes': sample['rss_bytes'],
+            'traced_bytes': sample.get('traced_bytes'),
+            'messages': sample['context']['messages'],
+            'message_bytes': sample['context']['message_bytes'],
+            'cache_bytes': sum(sample['caches'].values()),
+        })
+
+    start = time.perf_counter()
+    results = await run_turns(agent, scenarios, server, turns, on_turn=on_turn)
+    last = monitor.samples[-1] if monitor.samples else {}
+    if trace:
+        tracemalloc.stop()
+        monitor.trace_allocations = False
+
+    def growth(key):
+        # 用后一半样本估计每轮的增长，排除缓存预热的影响
+        tail = [sample[key] for sample in samples[len(samples) // 2:] if sample[key] is not None]
+        return round((tail[-1] - tail[0]) / (len(tail) - 1), 1) if len(tail) > 1 else None
+
+    return {
+        'turns': turns,
+        'errors': sum(result['status'] != 'ok' for result in results),
+        'seconds': round(time.perf_counter() - start, 3),
+        'rss_start_bytes': samples[0]['rss_bytes'] if samples else None,
+        'rss_end_bytes': samples[-1]['rss_bytes'] if samples else None,
+        'rss_growth_bytes_per_turn': growth('rss_bytes'),
+        'traced_growth_bytes_per_turn': growth('traced_bytes') if trace else None,
+        'max_messages': max((sample['messages'] for sample in samples), default=0),
+        'max_message_bytes': max((sample['message_bytes'] for sample in samples), default=0),
+        'top_allocations': last.get('top_allocations', []),
+        'monitor': dict(monitor.stats),
+        'samples': samples,
+    }
+
+def flatten(data: dict, prefix: str = '') -> dict:
+    items = {}
+    for key, value in data.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            items.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items[name] = value
+    return items
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> list:
+    """逐项对比耗时、吞吐量和内存指标，返回退化超过阈值的指标说明"""
+    regressions = []
+    base_metrics = flatten({key: baseline.get(key, {}) for key in ('turns', 'tools', 'capture_match', 'memory')})
+    current_metrics = flatten({key: current.get(key, {}) for key in ('turns', 'tools', 'capture_match', 'memory')})
+    for name, value in current_metrics.items():
+        base = base_metrics.get(name)
+        higher_is_better = name.endswith('per_second')
+        if base is None or not base or not (higher_is_better or name.endswith('_seconds') or name.endswith('_bytes')):
+            continue
+        change = (value - base) / abs(base)
+        worse = -change if higher_is_better else change
+        if worse > threshold:
+            regressions.append(f"{name}: {base} -> {value} ({change:+.1%})")
+    return regressions
+
+async def run_all(args) -> dict:
+    scenarios = load_scenarios(args.scenarios)
+    screen = install_fake_gui(action_latency=args.action_latency, capture_latency=args.capture_latency)
+    icon = screen.add_icon(640, 360)
+    temp_dir = tempfile.mkdtemp(prefix='agent_bench_')
+    server = StandInLLMServer(scenarios, first_token_delay=args.first_token_delay, token_delay=args.token_delay,
+                              failure_rate=args.failure_rate, stall_rate=args.stall_rate,
+                              stall_seconds=args.stall_seconds).start()
+    server.variables = {'tmp': temp_dir.replace('\\', '/'), 'icon': icon.replace('\\', '/')}
+    fast_server = None
+    if args.fast_first_token_delay is not None:
+        # 快速模型使用单独的替身服务，以区分两条路由的延迟
+        fast_server = StandInLLMServer(scenarios, first_token_delay=args.fast_first_token_delay,
+                                       token_delay=args.token_delay).start()
+        fast_server.variables = server.variables
+        os.environ['LLM_FAST_API_BASE'] = fast_server.base_url
+    try:
+        agent, startup = load_agent(server)
+        startup['llm_prewarm_seconds'] = await agent.llm.aprewarm()
+        if args.soak:
+            return {'soak': await run_soak(agent, scenarios, server, args.soak, trace=args.soak_trace)}
+        # 预热一轮：建立连接、构建教程和知识库索引
+        await run_turns(agent, scenarios, server, len(scenarios))
+        agent.tool_profiler.tools.clear()
+        turn_results = await run_turns(agent, scenarios, server, args.turns)
+        results = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'config': vars(args),
+            },
+            'startup': startup,
+            'turns': summarize_turns(turn_results),
+            'tools_in_turns': agent.tool_profiler.snapshot(),
+            'tool_output': agent.output_governor.snapshot(),
+            'prefetch': agent.prefetcher.snapshot(),
+            'tools': run_tool_benchmarks(screen, icon, temp_dir, args.tool_iterations),
+            'capture_match': run_capture_match_benchmarks(screen, icon, args.tool_iterations),
+            'text_entry': run_text_entry_benchmarks(screen, max(1, args.tool_iterations // 4)),
+            'work_units': await run_work_unit_benchmarks(agent, server),
+            'llm_requests': dict(server.stats),
+            'llm_transport': dict(agent.llm.transport_stats),
+            'llm_routes': getattr(agent.llm, 'route_stats', None),
+            'action_pacing': dict(PACER.stats),
+        }
+        if args.memory_turns:
+            results['memory'] = await run_memory_benchmark(agent, scenarios, server, args.memory_turns)
+        return results
+    finally:
+        server.stop()
+        if fast_server is not None:
+            fast_server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试（替身LLM服务 + 替身 pyautogui）")
+    parser.add_argument('--turns', type=int, default=30, help="测量延迟的对话轮数")
+    parser.add_argument('--memory-turns', type=int, default=100, help="测量内存增长的对话轮数，0表示跳过")
+    parser.add_argument('--tool-iterations', type=int, default=20, help="每个工具直接调用的次数")
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS, help="替身LLM回放的场景文件")
+    parser.add_argument('--first-token-delay', type=float, default=0.0, help="替身LLM首个token的延迟（秒）")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="替身LLM每个数据块之间的延迟（秒）")
+    parser.add_argument('--fast-first-token-delay', type=float, default=None,
+                        help="为快速模型单独启动替身LLM服务并设置其首个token延迟（秒）；不指定时两个模型共用一个替身服务")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="替身LLM返回503错误的请求比例")
+    parser.add_argument('--stall-rate', type=float, default=0.0, help="替身LLM在首个数据块前停顿的请求比例")
+    parser.add_argument('--stall-seconds', type=float, default=60.0, help="替身LLM停顿的时间（秒）")
+    parser.add_argument('--action-latency', type=float, default=0.0, help="替身鼠标键盘每次操作的额外耗时（秒）")
+    parser.add_argument('--capture-latency', type=float, default=0.0, help="替身截图每次的额外耗时（秒）")
+    parser.add_argument('--soak', type=int, default=0, help="只运行长时间运行测试：连续对话的轮数")
+    parser.add_argument('--soak-trace', action='store_true', help="长时间运行测试中用tracemalloc记录分配内存最多的代码位置")
+    parser.add_argument('--soak-max-growth-kb', type=float, default=64.0, help="长时间运行测试允许的每轮内存增长（KB），超过时退出码为1")
+    parser.add_argument('--output', help="结果JSON文件路径（默认 .cache/benchmarks/latest.json，长时间运行测试为 soak.json）")
+    parser.add_argument('--baseline', help="用于对比的历史结果JSON文件")
+    parser.add_argument('--threshold', type=float, default=0.2, help="视为退化的变差比例")
+    args = parser.parse_args()
+    args.output = args.output or (DEFAULT_SOAK_OUTPUT if args.soak else DEFAULT_OUTPUT)
+
+    results = asyncio.run(run_all(args))
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if 'soak' in results:
+        soak = results['soak']
+        growth = soak['traced_growth_bytes_per_turn'] if soak['traced_growth_bytes_per_turn'] is not None \
+            else soak['rss_growth_bytes_per_turn']
+        print(f"长时间运行 {soak['turns']} 轮 ({soak['seconds']:.1f}s), 出错 {soak['errors']} 轮; "
+              f"上下文最多 {soak['max_messages']} 条消息 / {soak['max_message_bytes'] / 1024:.1f}KB; "
+              f"清理事件日志 {soak['monitor']['event_log_released']} 条, 淘汰缓存 {soak['monitor']['evictions']} 次")
+        for allocation in soak['top_allocations']:
+            print(f"  {allocation['where']}: {allocation['bytes'] / 1024:.1f}KB ({allocation['count']} 个对象)")
+        print(f"结果已写入: {args.output}")
+        if growth is None:
+            print("样本不足，无法估计内存增长")
+        elif growth > args.soak_max_growth_kb * 1024:
+            print(f"内存持续增长: 每轮约 {growth / 1024:.1f}KB，超过 {args.soak_max_growth_kb}KB")
+            sys.exit(1)
+        else:
+            print(f"内存增长: 每轮约 {growth / 1024:.1f}KB")
+        return
+
+    overall = results['turns']['overall']
+    print(f"对话 {overall['turns']} 轮, 出错 {overall['errors']} 轮")
+    print(f"整轮耗时 p50 {overall['total']['p50_seconds'] * 1000:.1f}ms, p95 {overall['total']['p95_seconds'] * 1000:.1f}ms; "
+          f"智能体循环开销 p50 {overall['agent_overhead']['p50_seconds'] * 1000:.1f}ms")
+    long_text = results['text_entry']['long_auto']
+    print(f"输入 {long_text['chars']} 个字符: {long_text['mean_seconds']:.2f}s ({long_text['method']}), "
+          f"原逐字输入约 {long_text['legacy_seconds']:.0f}s")
+    prefetch = results['prefetch']
+    if prefetch['predictions']:
+        print(f"提前执行工具: 预测 {prefetch['predictions']} 次, 命中率 {prefetch['hit_rate']:.0%}, 浪费 {prefetch['wasted']} 次")
+    work_units = results['work_units']
+    print(f"诊断工作流: {work_units['collectors']} 个收集单元耗时 {work_units['first_run']['collect_seconds']:.2f}s "
+          f"(顺序执行约 {work_units['serial_collect_seconds']:.2f}s); 重复诊断时分析单元 "
+          f"{work_units['second_run']['statuses']['analyze']}, 模型请求 {work_units['second_run']['llm_requests']} 次")
+    if 'memory' in results:
+        print(f"内存增长: 每轮约 {results['memory']['growth_bytes_per_turn'] / 1024:.1f} KB")
+    print(f"结果已写入: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_results(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"发现 {len(regressions)} 项退化（超过 {args.threshold:.0%}）：")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("与基准结果相比没有退化")
+
+if __name__ == '__main__':
+    main()
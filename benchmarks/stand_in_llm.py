@@ -0,0 +1,270 @@
+"""本地OpenAI兼容的替身LLM服务，按脚本回放工具调用记录，用于离线基准测试
+
+每个场景包含一个用户问题和若干步回复，每一步要么是工具调用，要么是文本回答：
+
+    {"name": "disk", "prompt": "帮我看看磁盘空间",
+     "steps": [{"tool_calls": [{"name": "check_disk_space", "arguments": {}}]},
+               {"content": "C盘剩余 20GB。"}]}
+
+服务根据请求中最后一条用户消息匹配场景，根据其后的助手消息数量决定回放哪一步。
+
+单独运行：
+    python -m benchmarks.stand_in_llm --port 8765 --scenarios benchmarks/scenarios.json
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+DEFAULT_ANSWER = "这是替身模型的回答。"
+
+def _substitute(value, variables: dict):
+    """把参数中的 {变量名} 替换为实际值，例如临时目录"""
+    if isinstance(value, str):
+        for name, replacement in variables.items():
+            value = value.replace('{' + name + '}', replacement)
+        return value
+    if isinstance(value, list):
+        return [_substitute(item, variables) for item in value]
+    if isinstance(value, dict):
+        return {key: _substitute(item, variables) for key, item in value.items()}
+    return value
+
+class StandInLLMServer:
+    """回放脚本的OpenAI兼容服务（/v1/chat/completions），支持流式和非流式响应
+
+    参数:
+        scenarios: 场景列表，格式见模块说明
+        first_token_delay: 每次请求返回第一个数据块前的等待时间（秒），模拟模型首个token延迟
+        token_delay: 流式输出中每个数据块之间的等待时间（秒）
+        chunk_chars: 文本回答每个数据块包含的字符数
+        host: 监听地址
+        port: 监听端口，0表示自动选择空闲端口
+        failure_rate: 返回503错误的请求比例，用于测试重试
+        stall_rate: 在第一个数据块之前停顿 stall_seconds 秒的请求比例，用于测试首个token超时
+        idle_stall_rate: 在流式输出中途停顿 stall_seconds 秒的请求比例，用于测试输出中断超时
+        stall_seconds: 停顿时间（秒）
+        seed: 随机数种子
+    """
+
+    def __init__(self, scenarios: Optional[List[dict]] = None, first_token_delay: float = 0.0, token_delay: float = 0.0,
+                 chunk_chars: int = 4, host: str = '127.0.0.1', port: int = 0, failure_rate: float = 0.0,
+                 stall_rate: float = 0.0, idle_stall_rate: float = 0.0, stall_seconds: float = 60.0, seed: int = 0):
+        self.scenarios = scenarios or []
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.chunk_chars = chunk_chars
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.idle_stall_rate = idle_stall_rate
+        self.stall_seconds = stall_seconds
+        self.random = random.Random(seed)
+        self.variables = {}
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'request_bytes': 0, 'tool_schemas': 0, 'seconds': 0.0, 'connections': 0,
+                      'failures': 0, 'stalls': 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'StandInLLMServer':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _find_scenario(self, question: str) -> Optional[dict]:
+        for scenario in self.scenarios:
+            if scenario.get('prompt') == question:
+                return scenario
+        for scenario in self.scenarios:
+            if scenario.get('prompt') and scenario['prompt'] in question:
+                return scenario
+        return None
+
+    def next_step(self, messages: List[dict]) -> dict:
+        """根据对话内容决定本次请求回放的步骤"""
+        last_user = max((i for i, m in enumerate(messages) if m.get('role') == 'user'), default=-1)
+        question = messages[last_user].get('content') or '' if last_user >= 0 else ''
+        if isinstance(question, list):
+            question = ''.join(part.get('text', '') for part in question if isinstance(part, dict))
+        step_index = sum(1 for m in messages[last_user + 1:] if m.get('role') == 'assistant')
+        scenario = self._find_scenario(question)
+        steps = scenario['steps'] if scenario else []
+        if step_index < len(steps):
+            return _substitute(steps[step_index], self.variables)
+        return {'content': steps[-1].get('content', DEFAULT_ANSWER) if steps and 'content' in steps[-1] else DEFAULT_ANSWER}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                # 每个TCP连接调用一次，用于确认客户端是否复用连接
+                with server.lock:
+                    server.stats['connections'] += 1
+
+            def _draw(self, rate):
+                with server.lock:
+                    return rate > 0 and server.random.random() < rate
+
+            def do_GET(self):
+                # 客户端预热连接时请求模型列表
+                if not self.path.rstrip('/').endswith('/models'):
+                    self.send_error(404)
+                    return
+                data = b'{"object": "list", "data": [{"id": "stand-in", "object": "model"}]}'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self.send_error(404)
+                    return
+                start = time.perf_counter()
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                request = json.loads(body or b'{}')
+                step = server.next_step(request.get('messages', []))
+                with server.lock:
+                    server.stats['requests'] += 1
+                    server.stats['request_bytes'] += len(body)
+                    server.stats['tool_schemas'] += len(request.get('tools') or [])
+                if self._draw(server.failure_rate):
+                    with server.lock:
+                        server.stats['failures'] += 1
+                    data = b'{"error": {"message": "stand-in overloaded", "type": "server_error"}}'
+                    self.send_response(503)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+                try:
+                    if request.get('stream'):
+                        self._stream(request, step)
+                    else:
+                        self._complete(request, step)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端因超时断开连接
+                    self.close_connection = True
+                    return
+                with server.lock:
+                    server.stats['seconds'] += time.perf_counter() - start
+
+            def _base(self, request, kind):
+                return {'id': f"chatcmpl-{uuid.uuid4().hex[:12]}", 'object': kind, 'created': int(time.time()),
+                        'model': request.get('model', 'stand-in')}
+
+            def _tool_calls(self, step):
+                return [{'index': i, 'id': f"call_{uuid.uuid4().hex[:8]}", 'type': 'function',
+                         'function': {'name': call['name'], 'arguments': json.dumps(call.get('arguments', {}), ensure_ascii=False)}}
+                        for i, call in enumerate(step.get('tool_calls', []))]
+
+            def _complete(self, request, step):
+                time.sleep(server.first_token_delay)
+                message = {'role': 'assistant', 'content': step.get('content')}
+                if step.get('tool_calls'):
+                    message['tool_calls'] = self._tool_calls(step)
+                payload = self._base(request, 'chat.completion')
+                payload['choices'] = [{'index': 0, 'message': message,
+                                       'finish_reason': 'tool_calls' if step.get('tool_calls') else 'stop'}]
+                payload['usage'] = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_chunk(self, request, delta, finish_reason=None):
+                payload = self._base(request, 'chat.completion.chunk')
+                payload['choices'] = [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+                data = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, request, step):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                time.sleep(server.first_token_delay)
+                if self._draw(server.stall_rate):
+                    with server.lock:
+                        server.stats['stalls'] += 1
+                    time.sleep(server.stall_seconds)
+                idle_stall = self._draw(server.idle_stall_rate)
+                if step.get('tool_calls'):
+                    self._send_chunk(request, {'role': 'assistant', 'content': None, 'tool_calls': self._tool_calls(step)})
+                    self._send_chunk(request, {}, 'tool_calls')
+                else:
+                    content = step.get('content') or ''
+                    for i in range(0, len(content), server.chunk_chars):
+                        if i:
+                            time.sleep(server.token_delay)
+                        if i and idle_stall:
+                            idle_stall = False
+                            with server.lock:
+                                server.stats['stalls'] += 1
+                            time.sleep(server.stall_seconds)
+                        self._send_chunk(request, {'role': 'assistant', 'content': content[i:i + server.chunk_chars]})
+                    self._send_chunk(request, {}, 'stop')
+                data = b"data: [DONE]\n\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+def load_scenarios(path: str) -> List[dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容的替身LLM服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--scenarios', help="场景文件（JSON）")
+    parser.add_argument('--first-token-delay', type=float, default=0.0)
+    parser.add_argument('--token-delay', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--stall-rate', type=float, default=0.0)
+    parser.add_argument('--stall-seconds', type=float, default=60.0)
+    args = parser.parse_args()
+    server = StandInLLMServer(load_scenarios(args.scenarios) if args.scenarios else [], args.first_token_delay,
+                              args.token_delay, host=args.host, port=args.port, failure_rate=args.failure_rate,
+                              stall_rate=args.stall_rate, stall_seconds=args.stall_seconds)
+    print(f"替身LLM服务已启动: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,14 @@
 import os
-import asyncio
 import sys
+import time
+import uuid
+import asyncio
+import threading
 from dotenv import load_dotenv
-from llama_index.llms.openai import OpenAI
-from llama_index.core.agent.workflow import FunctionAgent, AgentStream
-from llama_index.core.workflow import Context
+
+# 启动计时：从导入本模块开始
+STARTUP_BEGIN = time.perf_counter()
+STARTUP_TIMINGS = {}
 
 # 全局调试开关，默认关闭调试信息
 DEBUG_MODE = False
@@ -14,129 +18,55 @@ def debug_print(message):
     if DEBUG_MODE:
         print(f"[调试] {message}")
 
-from tools.windows_tools import (
-    get_system_info,
-    open_windows_tool,
-    get_running_processes,
-    check_disk_space,
-    find_file,
-    show_windows_version
-)
-from tools.file_operations import (
-    create_folder,
-    delete_file,
-    copy_file,
-    move_file,
-    read_text_file as read_file,
-    create_text_file as write_file,
-    list_directory
-)
-from tools.mouse_keyboard_tools import (
-    get_mouse_position,
-    move_mouse,
-    move_mouse_relative,
-    click_mouse,
-    right_click_mouse,
-    double_click_mouse,
-    drag_mouse,
-    press_key,
-    type_text,
-    hotkey,
-    scroll_mouse,
-    safe_click_sequence,
-    safe_type_and_click
-)
-from tools.visual_tools import (
-    get_screen_size,
-    take_screenshot,
-    locate_on_screen,
-    locate_all_on_screen,
-    wait_for_image,
-    click_on_image,
-    wait_and_click_image,
-    capture_screen_region,
-    find_text_on_screen,
-    get_screen_color_at,
-    wait_for_color_change
-)
-
 # 加载环境变量
 load_dotenv()
 
 # 定义大模型
 DASHSCOPE_API_KEY = os.environ.get("QIANWEN_API_KEY")  # 注意这里使用QIANWEN_API_KEY而不是DASHSCOPE_API_KEY
 QWEN_API_BASE = os.environ.get("QIANWEN_API_BASE")  # 注意这里使用QIANWEN_API_BASE
+# 单轮对话（包括多次模型请求和工具调用）的最长时间（秒）
+TURN_TIMEOUT = float(os.environ.get("TURN_TIMEOUT", "300"))
 
-# 确保API密钥和基础URL存在
-if not DASHSCOPE_API_KEY or not QWEN_API_BASE:
-    raise EnvironmentError("请确保.env文件中包含QIANWEN_API_KEY和QIANWEN_API_BASE环境变量")
-
-llm = OpenAI(
-    model="qwen-max", 
-    api_key=DASHSCOPE_API_KEY, 
-    api_base=QWEN_API_BASE,
-)
-
-# 导入工具函数
-from tools.file_operations import read_tutorial, get_desktop_path
-
-# 创建电脑操作专家智能体
-computer_expert_agent = FunctionAgent(
-    name="computer_expert_agent",
-    description="电脑操作专家，擅长指导用户按照步骤完成各种电脑操作任务，可调用Windows工具和教程。",
-    tools=[
-        # 文件操作工具（包括实用工具）
-        get_desktop_path,
-        # Windows系统工具
-        get_system_info,
-        open_windows_tool,
-        get_running_processes,
-        check_disk_space,
-        find_file,
-        show_windows_version,
-        
-        # 文件操作工具
-        create_folder,
-        delete_file,
-        copy_file,
-        move_file,
-        read_file,
-        write_file,
-        list_directory,
-        
-        # 教程工具
-        read_tutorial,
-        
-        # 鼠标键盘控制工具
-        get_mouse_position,
-        move_mouse,
-        move_mouse_relative,
-        click_mouse,
-        right_click_mouse,
-        double_click_mouse,
-        drag_mouse,
-        press_key,
-        type_text,
-        hotkey,
-        scroll_mouse,
-        safe_click_sequence,
-        safe_type_and_click,
-        
-        # 视觉工具
-        get_screen_size,
-        take_screenshot,
-        locate_on_screen,
-        locate_all_on_screen,
-        wait_for_image,
-        click_on_image,
-        wait_and_click_image,
-        capture_screen_region,
-        find_text_on_screen,
-        get_screen_color_at,
-        wait_for_color_change
-    ],
-    llm=llm,
-    system_prompt="""你是一位电脑操作专家，擅长指导用户按照步骤完成各种电脑操作任务。
+# 按用途分组的工具声明 {工具组: {模块: [函数名]}}，由工具路由按问题选择需要提供给模型的工具组。
+# 工具描述从源码中静态读取，模块在其中的工具第一次被使用时才导入
+TOOL_GROUPS = {
+    # 教程和实用工具（每次请求都会提供）
+    'knowledge': {
+        'tools.file_operations': ['get_desktop_path', 'read_tutorial'],
+        'tools.knowledge_base': ['search_knowledge_base'],
+        'tools.result_format': ['read_tool_output'],
+    },
+    # Windows系统工具
+    'system': {
+        'tools.windows_tools': ['get_system_info', 'open_windows_tool', 'get_running_processes', 'check_disk_space',
+                                'find_file', 'show_windows_version'],
+        'tools.disk_tools': ['analyze_disk_usage'],
+    },
+    # 文件操作工具
+    'file': {
+        'tools.file_operations': ['create_folder', 'delete_file', 'copy_file', 'move_file', 'read_text_file',
+                                  'create_text_file', 'list_directory', 'batch_file_ops'],
+        'tools.disk_tools': ['find_duplicates'],
+        'tools.file_watcher': ['wait_for_file_event'],
+    },
+    # 鼠标键盘控制工具
+    'input': {
+        'tools.mouse_keyboard_tools': ['get_mouse_position', 'move_mouse', 'move_mouse_relative', 'click_mouse',
+                                       'right_click_mouse', 'double_click_mouse', 'drag_mouse', 'press_key', 'type_text',
+                                       'hotkey', 'scroll_mouse', 'safe_click_sequence', 'safe_type_and_click'],
+    },
+    # 视觉工具
+    'visual': {
+        'tools.visual_tools': ['get_screen_size', 'take_screenshot', 'locate_on_screen', 'locate_all_on_screen',
+                               'wait_for_image', 'click_on_image', 'wait_and_click_image', 'capture_screen_region',
+                               'find_text_on_screen', 'get_screen_color_at', 'wait_for_color_change'],
+    },
+}
+
+# 使用唯一一套鼠标、键盘和屏幕的工具组，多个会话同时使用时按顺序执行
+GUI_TOOL_GROUPS = ('input', 'visual')
+
+SYSTEM_PROMPT = """你是一位电脑操作专家，擅长指导用户按照步骤完成各种电脑操作任务。
 
 ## 技能
 ### 技能 1: 指导用户进行电脑操作
@@ -164,83 +94,507 @@ computer_expert_agent = FunctionAgent(
 - 提供的步骤应尽可能详细且易于理解，避免使用过于专业的术语。
 
 ## 重要提示
-- 当需要回答与Windows系统操作、故障排除或文件操作相关的问题时，请调用read_tutorial工具获取教程内容作为参考。
+- 当需要回答与Windows系统操作、故障排除或文件操作相关的问题时，请调用read_tutorial工具并在query参数中传入问题关键词，获取相关教程章节作为参考。
+- 当问题涉及公司内部的运维手册或操作规范时，请调用search_knowledge_base工具检索知识库。
 - 根据问题的具体需求，合理使用提供的工具函数。
+- 如果当前提供的工具不足以完成用户要求的操作，请先调用request_tool_groups工具申请需要的工具组。
+- 工具输出过长时会被截断，只有确实需要被截断的内容时才调用read_tool_output读取剩余部分。
 - 回答应当基于教程内容和工具执行结果，保持专业性和准确性。
 - 执行鼠标和键盘操作时，请确保操作的安全性，避免可能的误操作。
 - 控制鼠标移动时，请注意坐标范围，避免超出屏幕边界。
 """
-)
+
+def create_llm():
+    """创建LLM客户端；缺少环境变量时在这里报错，而不是在导入模块时"""
+    # 确保API密钥和基础URL存在
+    if not DASHSCOPE_API_KEY or not QWEN_API_BASE:
+        raise EnvironmentError("请确保.env文件中包含QIANWEN_API_KEY和QIANWEN_API_BASE环境变量")
+    from core.llm_client import DashScopeOpenAI, RoutingLLM, TransportSettings
+    # 连接池、分阶段超时和重试参数可通过 LLM_* 环境变量调整
+    transport = TransportSettings.from_env()
+    llm = DashScopeOpenAI(
+        model="qwen-max", 
+        api_key=DASHSCOPE_API_KEY, 
+        api_base=QWEN_API_BASE,
+        transport=transport,
+    )
+    # 简单的教程类问题使用快速模型，设置 LLM_FAST_MODEL 为空时全部使用 qwen-max
+    fast_model = os.environ.get("LLM_FAST_MODEL", "qwen-turbo")
+    if not fast_model:
+        return llm
+    fast_llm = DashScopeOpenAI(
+        model=fast_model,
+        api_key=os.environ.get("LLM_FAST_API_KEY") or DASHSCOPE_API_KEY,
+        api_base=os.environ.get("LLM_FAST_API_BASE") or QWEN_API_BASE,
+        transport=transport,
+    )
+    return RoutingLLM(strong_llm=llm, fast_llm=fast_llm,
+                      fast_max_chars=int(os.environ.get("LLM_FAST_MAX_CHARS", "200")))
+
+def create_tool_registry():
+    from core.tool_registry import LazyToolRegistry
+    return LazyToolRegistry(TOOL_GROUPS)
+
+def create_tool_profiler():
+    # 工具性能统计：记录每个工具的耗时、错误和输出大小，退出时写入 .cache/metrics/tool_profile.json
+    # 设置 TOOL_CPROFILE_THRESHOLD（秒）后，超过该耗时的调用会保存cProfile结果
+    from core.tool_profiler import ToolProfiler
+    cprofile_threshold = os.environ.get("TOOL_CPROFILE_THRESHOLD")
+    return ToolProfiler(cprofile_threshold=float(cprofile_threshold) if cprofile_threshold else None)
+
+def create_output_governor():
+    # 工具输出预算：超出预算的输出截断后交给模型，全文可通过 read_tool_output 分段读取
+    from core.output_governor import OutputGovernor
+    return OutputGovernor(default_budget=int(os.environ.get("TOOL_OUTPUT_BUDGET", "2000")))
+
+def create_prefetcher():
+    # 提前执行：收到问题后立即在后台执行很可能被调用的只读工具（系统信息、磁盘空间等），PREFETCH=0 关闭
+    from core.prefetch import Prefetcher, PREFETCHABLE_TOOLS
+    enabled = os.environ.get("PREFETCH", "1") != "0"
+    return Prefetcher(get_component("tool_registry").get_function, tools=PREFETCHABLE_TOOLS if enabled else (),
+                      max_age=float(os.environ.get("PREFETCH_MAX_AGE", "30")))
+
+def create_gui_lock():
+    from core.gui_lock import GuiLock
+    return GuiLock()
+
+def create_tool_router():
+    from core.tool_router import ToolRouter
+    registry = get_component("tool_registry")
+    profiler = get_component("tool_profiler")
+    output_governor = get_component("output_governor")
+    prefetcher = get_component("prefetcher")
+    gui_lock = get_component("gui_lock")
+    macro_recorder = get_component("macro_recorder")
+    tool_groups = {}
+    for group, tools in registry.build_tool_groups().items():
+        # 性能统计记录的输出大小是截断后实际交给模型的大小，耗时包括等待提前执行结果的时间；
+        # 所有工具都经过 prefetcher，调用可能改变系统状态的工具时丢弃提前执行的结果
+        tools = [profiler.profile(output_governor.wrap(prefetcher.wrap(tool))) for tool in tools]
+        if group in GUI_TOOL_GROUPS:
+            # 在性能统计之外等待GUI锁，排队时间不计入工具耗时；宏录制在锁内截取前置条件，保证与执行时的屏幕一致
+            tools = [gui_lock.wrap(macro_recorder.wrap(tool)) for tool in tools]
+        tool_groups[group] = tools
+    # 选定工具组后在后台导入对应的工具模块
+    return ToolRouter(tool_groups, on_select=registry.preload)
+
+def create_agent():
+    """创建电脑操作专家智能体"""
+    from llama_index.core.agent.workflow import FunctionAgent
+    return FunctionAgent(
+        name="computer_expert_agent",
+        description="电脑操作专家，擅长指导用户按照步骤完成各种电脑操作任务，可调用Windows工具和教程。",
+        tools=[],
+        tool_retriever=get_component("tool_router"),
+        llm=get_component("llm"),
+        system_prompt=SYSTEM_PROMPT,
+    )
+
+def create_answer_cache():
+    # 回答缓存：重复的常见问题直接复用之前的回答
+    from core.answer_cache import AnswerCache
+    return AnswerCache()
+
+def create_context_manager():
+    # 上下文管理：按token预算压缩对话历史，保留桌面路径等固定信息
+    from core.context_manager import ContextManager
+    return ContextManager(token_budget=int(os.environ.get("CONTEXT_TOKEN_BUDGET", "6000")))
+
+def create_macro_store():
+    # 操作宏：录制的GUI工具调用序列，保存在 .cache/macros/
+    from core.macros import MacroStore
+    return MacroStore()
+
+def create_macro_recorder():
+    from core.macros import MacroRecorder
+    return MacroRecorder(get_component("macro_store"))
+
+def create_session_store():
+    # 会话保存：对话记忆和固定信息保存在 .cache/sessions/，下次启动时恢复
+    from core.session_store import SessionStore
+    return SessionStore(max_age=float(os.environ.get("SESSION_MAX_AGE", str(7 * 86400))))
+
+def create_memory_monitor():
+    # 内存统计：每轮记录进程内存、上下文大小和缓存大小，缓存超过上限时淘汰
+    from core.memory_monitor import MemoryMonitor
+    monitor = MemoryMonitor.from_env()
+    output_store = get_component("output_governor").store
+    monitor.register_cache("tool_outputs", output_store.memory_bytes, output_store.trim,
+                           max_bytes=int(float(os.environ.get("MEMORY_TOOL_OUTPUT_MB", "8")) * 1024 * 1024))
+    answer_cache = get_component("answer_cache")
+    monitor.register_cache("answer_cache", answer_cache.memory_bytes, answer_cache.unload)
+    return monitor
+
+def create_stream_metrics():
+    # 延迟统计：首个token时间、生成速度、LLM与工具耗时，导出到 .cache/metrics/；
+    # 默认只记录问题的哈希和长度，METRICS_LOG_PROMPTS=1 时记录问题原文
+    from core.instrumentation import StreamMetrics
+    return StreamMetrics(max_jsonl_bytes=int(float(os.environ.get("METRICS_MAX_MB", "5")) * 1024 * 1024),
+                         include_prompts=os.environ.get("METRICS_LOG_PROMPTS", "0") == "1")
+
+# 按需创建的组件；第一次使用时创建，之后作为模块属性保存（也可以在外部直接替换，例如基准测试）
+COMPONENT_FACTORIES = {
+    "llm": create_llm,
+    "tool_registry": create_tool_registry,
+    "tool_profiler": create_tool_profiler,
+    "output_governor": create_output_governor,
+    "prefetcher": create_prefetcher,
+    "gui_lock": create_gui_lock,
+    "tool_router": create_tool_router,
+    "computer_expert_agent": create_agent,
+    "answer_cache": create_answer_cache,
+    "context_manager": create_context_manager,
+    "stream_metrics": create_stream_metrics,
+    "memory_monitor": create_memory_monitor,
+    "session_store": create_session_store,
+    "macro_store": create_macro_store,
+    "macro_recorder": create_macro_recorder,
+}
+_component_lock = threading.RLock()
+
+def get_component(name):
+    """返回指定组件，不存在时创建"""
+    component = globals().get(name)
+    if component is None:
+        with _component_lock:
+            component = globals().get(name)
+            if component is None:
+                start = time.perf_counter()
+                component = COMPONENT_FACTORIES[name]()
+                globals()[name] = component
+                STARTUP_TIMINGS[f"create_{name}"] = time.perf_counter() - start
+    return component
+
+def __getattr__(name):
+    # 外部以模块属性方式访问组件时按需创建，例如 computer_expert_agent.tool_router
+    if name in COMPONENT_FACTORIES:
+        return get_component(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_agent():
+    return get_component("computer_expert_agent")
+
+def format_startup_timings():
+    """返回启动各阶段的耗时"""
+    lines = [f"{name}: {seconds * 1000:.0f}ms" for name, seconds in STARTUP_TIMINGS.items()]
+    if "tool_registry" in globals():
+        lines.append(get_component("tool_registry").format_stats())
+    return "启动耗时:\n" + "\n".join(f"  {line}" for line in lines)
 
 # 异步运行工作流（普通输出）
-async def run_computer_expert_agent(prompt):
+async def run_computer_expert_agent(prompt, verbose=True):
+    """运行一个问题（不流式输出），返回智能体的最终输出
+
+    参数:
+        prompt: 用户问题
+        verbose: 为True时打印回答，出错时打印错误并返回None；为False时不打印，出错时抛出异常由调用方处理（例如批量运行）
+    """
     try:
+        from llama_index.core.workflow import Context
         # 创建上下文以保持对话状态
-        ctx = Context(computer_expert_agent)
-        response = await computer_expert_agent.run(prompt, ctx=ctx)
-        print("\nAI助手回复：")
-        print(response)
+        agent = get_agent()
+        ctx = Context(agent)
+        response = await agent.run(prompt, ctx=ctx)
+        if verbose:
+            print("\nAI助手回复：")
+            print(response)
         return response
     except Exception as e:
+        if not verbose:
+            raise
         print(f"工作流执行错误：{e}")
         return None
 
+def print_stream_delta(delta):
+    """实时打印一段流式输出"""
+    print(delta, end="", flush=True)
+
+async def remember_cached_turn(ctx, prompt, answer):
+    """把缓存命中的问答写入上下文记忆，保证后续追问仍有上下文"""
+    from llama_index.core.llms import ChatMessage
+    from llama_index.core.memory import ChatMemoryBuffer
+    memory = await ctx.get("memory", default=None)
+    if memory is None:
+        memory = ChatMemoryBuffer.from_defaults(llm=get_agent().llm)
+        await ctx.set("memory", memory)
+    await memory.aput_messages([
+        ChatMessage(role="user", content=prompt),
+        ChatMessage(role="assistant", content=answer),
+    ])
+
+async def replay_macro(macro):
+    """不经过大模型重放操作宏；重放期间独占鼠标键盘，其他会话的GUI工具排队等待"""
+    from core.macros import MacroPlayer
+    player = MacroPlayer(get_component("macro_store"), get_component("tool_registry").get_function)
+    result = await asyncio.to_thread(get_component("gui_lock").call, f"宏 {macro['name']}", player.replay, macro)
+    if isinstance(result, str):
+        # 等待GUI锁超时
+        return {'ok': False, 'completed': 0, 'total': len(macro['steps']), 'reason': result, 'outputs': [],
+                'seconds': 0.0}
+    return result
+
+async def confirm_macro_replay(macro):
+    """提示问题与操作宏录制时的问题相同，由用户确认是否直接重放"""
+    answer = await asyncio.to_thread(
+        input, f"[提示] 这个问题与操作宏 '{macro['name']}' 录制时的问题相同，是否直接重放录制的 {len(macro['steps'])} 步操作"
+               f"（不经过大模型）？(y/N) ")
+    return answer.strip().lower() in ("y", "yes", "是")
+
 # 异步运行工作流（流式输出）
-async def run_computer_expert_agent_stream(prompt, ctx=None):
+async def run_computer_expert_agent_stream(prompt, ctx=None, use_cache=True, on_delta=None):
+    """运行一轮对话并流式输出回答
+
+    参数:
+        prompt: 用户问题
+        ctx: 会话上下文，为None时创建新的上下文
+        use_cache: 是否使用回答缓存
+        on_delta: 接收每段输出文本的回调，为None时打印到终端（服务模式下写入会话的事件流）
+    """
+    from llama_index.core.agent.workflow import AgentStream, ToolCall, ToolCallResult
+    from llama_index.core.workflow import Context
+    stream_metrics = get_component("stream_metrics")
+    trace = stream_metrics.start_turn(prompt)
+    # 被取消（例如外层超时）时状态保持为cancelled
+    status = "cancelled"
     try:
+        agent = get_agent()
+        answer_cache = get_component("answer_cache")
+        context_manager = get_component("context_manager")
         debug_print(f"开始处理问题: {prompt}")
         # 如果没有提供上下文，创建一个新的上下文
         if ctx is None:
-            ctx = Context(computer_expert_agent)
+            ctx = Context(agent)
             debug_print("创建了新的上下文")
         else:
             debug_print("使用现有上下文")
         
-        print("\nAI助手回复：")
+        console = on_delta is None
+        if console:
+            on_delta = print_stream_delta
+            print("\nAI助手回复：")
+        # 先查找回答缓存，命中时按相同的流式方式输出
+        cached_answer = answer_cache.lookup(prompt) if use_cache else None
+        if cached_answer is not None:
+            debug_print("命中回答缓存")
+            trace.cache_hit = True
+            trace.mark_first_token()
+            for i in range(0, len(cached_answer), 16):
+                on_delta(cached_answer[i:i + 16])
+            if console:
+                print()
+            await remember_cached_turn(ctx, prompt, cached_answer)
+            await context_manager.after_turn(ctx)
+            status = "ok"
+            return cached_answer
+        
+        # 录制过相同问题的操作宏时询问是否直接重放（只在终端对话中询问，服务模式不自动操作鼠标键盘）；
+        # 屏幕与录制时不一致时把已完成的步骤告诉智能体，由它接着完成
+        macro_recorder = get_component("macro_recorder")
+        macro_recorder.note_prompt(prompt)
+        macro = get_component("macro_store").match(prompt) if use_cache and console and not macro_recorder.recording else None
+        if macro is not None and not await confirm_macro_replay(macro):
+            macro = None
+        if macro is not None:
+            from core.macros import format_replay_report
+            debug_print(f"重放操作宏: {macro['name']}")
+            result = await replay_macro(macro)
+            report = format_replay_report(macro['name'], result)
+            debug_print(report)
+            if result['ok']:
+                trace.mark_first_token()
+                on_delta(report)
+                if console:
+                    print()
+                await remember_cached_turn(ctx, prompt, report)
+                await context_manager.after_turn(ctx)
+                status = "ok"
+                return report
+            prompt = (f"{prompt}\n（已自动执行录制的操作宏 '{macro['name']}' 的前 {result['completed']} 步，"
+                      f"之后停止：{result['reason']}。请从当前屏幕状态继续完成任务。）")
+
+        # 工具路由和提前执行的结果按会话区分，服务模式下各会话互不影响
+        from core.tool_router import set_scope
+        scope = await ctx.get("tool_scope", default=None)
+        if scope is None:
+            scope = uuid.uuid4().hex
+            await ctx.set("tool_scope", scope)
+        set_scope(scope)
+
+        # 在模型生成工具调用的同时提前执行很可能被调用的只读工具；结果已作为固定信息保存在上下文中的工具不再执行
+        from core.context_manager import PINNED_TOOL_FACTS
+        prefetcher = get_component("prefetcher")
+        # 过期的固定信息（例如超过1小时的磁盘空间）从上下文开头删除，相应的工具照常提前执行
+        await context_manager.expire_facts(ctx)
+        pinned = await ctx.get("pinned_facts", default={})
+        prefetched = prefetcher.start(prompt, skip=[tool for tool, label in PINNED_TOOL_FACTS.items() if label in pinned])
+        if prefetched:
+            debug_print(f"提前执行工具: {prefetched}")
+
+        # 只缓存对话中第一个问题的回答，追问的回答依赖上下文；恢复的固定信息（上下文开头的已知信息）不算对话
+        is_first_turn = not await context_manager.conversation_messages(ctx)
+        
         # 获取流式处理器
         debug_print("调用computer_expert_agent.run")
-        handler = computer_expert_agent.run(prompt, ctx=ctx)
+        handler = agent.run(prompt, ctx=ctx)
         debug_print("获取到handler，开始stream_events")
         
         # 收集完整响应以便返回
         full_response = ""
         event_count = 0
+        tools_used = set()
+        tool_results = []
+        stream_completed = False
         
         try:
             # 异步迭代流式事件
             async for event in handler.stream_events():
                 event_count += 1
+                trace.on_event(event)
                 debug_print(f"收到事件 #{event_count}: {type(event).__name__}")
                 if isinstance(event, AgentStream):
-                    # 实时打印每个token
-                    print(event.delta, end="", flush=True)
+                    # 实时输出每个token
+                    on_delta(event.delta)
                     full_response += event.delta
                     # 每10个事件强制刷新一次
                     if event_count % 10 == 0:
                         debug_print(f"已处理 {event_count} 个事件")
+                elif isinstance(event, ToolCallResult):
+                    tool_results.append((event.tool_name, str(event.tool_output.content)))
+                elif isinstance(event, ToolCall):
+                    tools_used.add(event.tool_name)
+            # 等待工作流完全结束后再复用上下文，否则下一轮开始时上一轮的任务可能还在清理
+            await handler
+            stream_completed = True
         except asyncio.TimeoutError:
             debug_print("流式处理超时")
         except StopAsyncIteration:
             debug_print("流式处理正常结束")
+            stream_completed = True
         except Exception as stream_e:
             debug_print(f"流式处理异常: {stream_e}")
+        status = "ok" if stream_completed else "error"
         
-        print()  # 添加一个换行符
+        if console:
+            print()  # 添加一个换行符
         debug_print(f"完整响应长度: {len(full_response)} 字符")
+        debug_print(get_component("tool_router").last_report)
+        if use_cache and stream_completed and is_first_turn:
+            if answer_cache.store(prompt, full_response, tools_used):
+                debug_print("回答已写入缓存")
+        prefetcher.finish_turn(prompt, tools_used)
+        # 记录固定信息并把上下文压缩到预算内
+        await context_manager.after_turn(ctx, tool_results)
+        debug_print(context_manager.format_stats())
         return full_response
     except Exception as e:
+        status = "error"
         debug_print(f"工作流执行错误：{e}")
         import traceback
         traceback.print_exc()
         return None
+    finally:
+        # 本轮录制到操作时把问题保存为宏的触发问题
+        recorder = globals().get("macro_recorder")
+        if recorder is not None:
+            recorder.finish_prompt()
+        if status != "cancelled" and ctx is not None:
+            # 清理工作流事件日志、记录内存，超过上限时淘汰缓存
+            try:
+                sample = await get_component("memory_monitor").after_turn(ctx)
+                if sample["evicted"]:
+                    debug_print(f"内存超过上限，已淘汰缓存: {sample['evicted']}")
+            except Exception as e:
+                debug_print(f"记录内存时出错: {e}")
+        record = stream_metrics.finish_turn(trace, status)
+        debug_print(f"本轮耗时 {record['total_seconds']:.2f}s, 首个token {record['ttft_seconds']}s, "
+                    f"LLM {record['llm_seconds']:.2f}s, 工具 {record['tool_seconds']:.2f}s")
+
+def prepare_agent():
+    """创建智能体和会话需要的组件，并提前导入每次请求都会用到的工具模块"""
+    agent = get_agent()
+    for name in ("answer_cache", "context_manager", "stream_metrics", "memory_monitor"):
+        get_component(name)
+    get_component("tool_registry").preload(["knowledge"])
+    STARTUP_TIMINGS["agent_ready"] = time.perf_counter() - STARTUP_BEGIN
+    return agent
+
+async def prepare_agent_async():
+    """在后台创建智能体，并预先建立到模型服务的连接，使第一个问题不必等待TCP和TLS握手"""
+    agent = await asyncio.to_thread(prepare_agent)
+    prewarm_seconds = await get_component("llm").aprewarm()
+    if prewarm_seconds is not None:
+        STARTUP_TIMINGS["llm_prewarm"] = prewarm_seconds
+    return agent
+
+async def handle_macro_command(args):
+    """处理 /macro 命令：record <名称>、stop、list、run <名称>、delete <名称>"""
+    from core.macros import format_replay_report
+    store = get_component("macro_store")
+    recorder = get_component("macro_recorder")
+    command = args[0].lower() if args else "list"
+    name = " ".join(args[1:])
+    if command == "record" and name:
+        print(f"[提示] {recorder.start(name)}")
+    elif command == "stop":
+        print(f"[提示] {recorder.stop()}")
+    elif command == "list":
+        print(store.format_list())
+    elif command == "run" and name:
+        macro = store.get(name)
+        if macro is None:
+            print(f"[提示] 宏 '{name}' 不存在")
+        else:
+            print(format_replay_report(name, await replay_macro(macro)))
+    elif command == "delete" and name:
+        print(f"[提示] 已删除宏 '{name}'" if store.delete(name) else f"[提示] 宏 '{name}' 不存在")
+    else:
+        print("[提示] 用法: /macro record <名称> | /macro stop | /macro list | /macro run <名称> | /macro delete <名称>")
+
+async def handle_diagnose_command(question):
+    """处理 /diagnose 命令：并发收集系统信息、磁盘空间和进程列表，再在独立上下文中分析原因"""
+    from core.work_units import WorkUnitEngine, format_work_unit_results
+    from core.diagnosis import run_diagnosis, format_diagnosis
+    engine = WorkUnitEngine(get_component("llm"))
+    results = await run_diagnosis(engine, question, get_component("tool_registry").get_function)
+    print(format_diagnosis(results))
+    if DEBUG_MODE:
+        print(format_work_unit_results(results))
 
 # 交互式对话函数（使用流式输出）
-async def interactive_chat():
+async def restore_session(session_id):
+    """创建上下文并恢复保存的会话（以及所有会话共用的固定信息）"""
+    from llama_index.core.workflow import Context
+    agent = get_agent()
+    ctx = Context(agent)
+    info = await get_component("session_store").restore(ctx, session_id, llm=agent.llm,
+                                                        context_manager=get_component("context_manager"))
+    if info['resumed']:
+        print(f"[提示] 已恢复会话 {session_id}（{info['messages']} 条消息，{info['facts']} 条已知信息）")
+    elif info['facts']:
+        debug_print(f"已载入 {info['facts']} 条已知信息，{info['expired_facts']} 条已过期")
+    return ctx
+
+async def save_session(session_id, ctx):
+    """每轮对话结束后保存会话，保存失败不影响对话"""
+    try:
+        size = await get_component("session_store").save(session_id, ctx)
+        debug_print(f"会话 {session_id} 已保存（{size} 字节）")
+    except Exception as e:
+        debug_print(f"保存会话时出错: {e}")
+
+async def interactive_chat(session_id=None):
+    """交互式对话
+
+    参数:
+        session_id: 要恢复的会话ID；为None时恢复最近保存的会话，没有则开始新会话
+    """
+    from core.session_store import new_session_id
     print("欢迎使用电脑操作专家AI助手！请输入您的电脑操作问题")
-    messages = []
+    # 在用户输入第一个问题的同时，在后台创建智能体
+    agent_ready = asyncio.ensure_future(prepare_agent_async())
+    # 会话在第一个问题时才恢复（读取文件、重建对话记忆），不拖慢启动
+    session_id = session_id or get_component("session_store").latest_session_id() or new_session_id()
     ctx = None
-    conversation_count = 0
-    MAX_CONVERSATIONS = 3  # 每3轮对话后重置上下文，避免内存泄漏
 
     try:
         # 声明全局变量
@@ -251,14 +605,6 @@ async def interactive_chat():
             print("[提示] 调试模式已开启")
         
         while True:
-            # 检查是否需要重置上下文
-            if conversation_count % MAX_CONVERSATIONS == 0 or ctx is None:
-                print(f"\n创建新的对话上下文")
-                ctx = Context(computer_expert_agent)
-                # 只保留最近的消息
-                if len(messages) > 2:
-                    messages = messages[-2:]
-            
             # 获取用户输入
             try:
                 user_input = await asyncio.to_thread(input, "\n您的问题：")
@@ -267,6 +613,8 @@ async def interactive_chat():
                 if user_input.lower() in ["exit", "quit", "退出", "结束"]:
                     print("感谢使用，再见！")
                     break
+
+                answer_cache = get_component("answer_cache")
                 
                 # 处理调试模式切换命令
                 if user_input.lower() == "/debug on":
@@ -281,28 +629,91 @@ async def interactive_chat():
                     status = "开启" if DEBUG_MODE else "关闭"
                     print(f"[提示] 当前调试模式：{status}")
                     continue
+                elif user_input.lower() == "/cache":
+                    print(f"[提示] {answer_cache.format_stats()}")
+                    continue
+                elif user_input.lower().startswith("/stats tools"):
+                    # 可指定排序字段，例如 /stats tools output_tokens
+                    parts = user_input.split()
+                    print(get_component("tool_profiler").format_stats(sort_by=parts[2] if len(parts) > 2 else "total_seconds"))
+                    continue
+                elif user_input.lower() == "/stats":
+                    print(get_component("stream_metrics").format_stats())
+                    print(get_component("llm").format_transport_stats())
+                    if hasattr(get_component("llm"), "format_route_stats"):
+                        print(get_component("llm").format_route_stats())
+                    print(get_component("tool_router").format_stats())
+                    print(get_component("output_governor").format_stats())
+                    print(get_component("prefetcher").format_stats())
+                    from tools.action_pacing import PACER
+                    if PACER.stats['actions']:
+                        print(PACER.format_stats())
+                    print(answer_cache.format_stats())
+                    print(get_component("context_manager").format_stats())
+                    print(get_component("memory_monitor").format_stats())
+                    print(format_startup_timings())
+                    continue
+                elif user_input.lower() == "/cache clear":
+                    print(f"[提示] 已清空回答缓存（{answer_cache.clear()} 条）")
+                    continue
+                elif user_input.lower().startswith("/macro"):
+                    await handle_macro_command(user_input.split()[1:])
+                    continue
+                elif user_input.lower().startswith("/diagnose"):
+                    question = user_input[len("/diagnose"):].strip()
+                    if not question:
+                        print("[提示] 用法: /diagnose <问题描述>，例如 /diagnose 电脑运行很慢")
+                    else:
+                        await handle_diagnose_command(question)
+                    continue
+                elif user_input.lower().startswith("/session"):
+                    args = user_input.split()[1:]
+                    session_store = get_component("session_store")
+                    if not args:
+                        print(f"[提示] 当前会话: {session_id}")
+                    elif args[0] == "list":
+                        print(session_store.format_list(current=session_id))
+                    elif args[0] == "new":
+                        session_id, ctx = new_session_id(), None
+                        print(f"[提示] 已开始新会话 {session_id}")
+                    elif args[0] == "resume" and len(args) > 1:
+                        session_id, ctx = args[1], None
+                        print(f"[提示] 将在下一个问题时恢复会话 {session_id}")
+                    elif args[0] == "delete" and len(args) > 1:
+                        deleted = session_store.delete(args[1])
+                        print(f"[提示] 已删除会话 {args[1]}" if deleted else f"[提示] 会话 {args[1]} 不存在")
+                    else:
+                        print("[提示] 用法: /session | /session list | /session new | /session resume <ID> | /session delete <ID>")
+                    continue
 
-                # 添加用户消息到消息列表
-                messages.append({"role": "user", "content": user_input})
-                conversation_count += 1
+                if ctx is None:
+                    # 等待后台创建智能体完成；整个会话共用一个上下文，由context_manager在每轮结束后压缩，不再定期重置
+                    try:
+                        await agent_ready
+                    except EnvironmentError as e:
+                        print(f"[错误] {e}")
+                        break
+                    ctx = await restore_session(session_id)
 
                 # 使用超时控制来防止卡住
                 print("\nAI助手回复：")
                 try:
-                    # 调用智能体处理用户请求并流式输出，设置60秒超时
+                    # 调用智能体处理用户请求并流式输出；模型请求的超时和重试由LLM客户端处理，
+                    # 这里只是防止整轮对话（包括多次工具调用）无限卡住的兜底
                     await asyncio.wait_for(
                         run_computer_expert_agent_stream(user_input, ctx=ctx), 
-                        timeout=60.0
+                        timeout=TURN_TIMEOUT
                     )
                 except asyncio.TimeoutError:
                     print("\n\n[错误] 对话处理超时！请尝试简化问题。")
-                    # 强制重置上下文
-                    ctx = Context(computer_expert_agent)
-                    print("上下文已重置，可以继续提问。")
+                    # 中断的工作流状态无法继续使用，重建上下文但保留对话记忆和固定信息
+                    from llama_index.core.workflow import Context
+                    new_ctx = Context(get_agent())
+                    await get_component("context_manager").carry_over(ctx, new_ctx)
+                    ctx = new_ctx
+                    print("上下文已重建，可以继续提问。")
                     continue
-
-                # 添加助手回复到消息列表
-                messages.append({"role": "assistant", "content": "[助手回复内容]"})
+                await save_session(session_id, ctx)
 
             except Exception as e:
                 print(f"\n[错误] 处理输入时发生错误: {str(e)}")
@@ -318,10 +729,87 @@ async def interactive_chat():
         traceback.print_exc()
     finally:
         print("\n清理资源...")
+        if "tool_router" in globals() and tool_router.stats['requests']:
+            print(tool_router.format_stats())
         # 确保资源被释放
         if ctx:
             del ctx
 
+def create_session_manager():
+    """创建服务模式的会话管理器：所有会话共用智能体和LLM连接池，每个会话有自己的上下文"""
+    from llama_index.core.workflow import Context
+    from core.session_server import SessionManager
+    agent = get_agent()
+    context_manager = get_component("context_manager")
+    return SessionManager(
+        create_context=lambda: Context(agent),
+        run_turn=run_computer_expert_agent_stream,
+        carry_over=context_manager.carry_over,
+        max_sessions=int(os.environ.get("SERVER_MAX_SESSIONS", "100")),
+        max_pending_per_session=int(os.environ.get("SERVER_MAX_PENDING_PER_SESSION", "1")),
+        # 同时执行的对话轮数不超过LLM连接池大小，多余的请求排队
+        max_concurrent_turns=int(os.environ.get("SERVER_MAX_CONCURRENT_TURNS", os.environ.get("LLM_POOL_SIZE", "10"))),
+        turn_timeout=TURN_TIMEOUT,
+        idle_expiry=float(os.environ.get("SERVER_SESSION_EXPIRY", "1800")),
+    )
+
+def server_stats():
+    """服务模式 /stats 中的附加统计"""
+    return {
+        "llm_transport": get_component("llm").transport_stats,
+        "llm_routes": getattr(get_component("llm"), "route_stats", None),
+        "gui_lock": get_component("gui_lock").stats,
+        "tool_router": get_component("tool_router").stats,
+        "tool_output": get_component("output_governor").snapshot(),
+        "prefetch": get_component("prefetcher").snapshot(),
+        "answer_cache": get_component("answer_cache").format_stats(),
+        "memory": get_component("memory_monitor").snapshot(),
+    }
+
+async def serve(host="127.0.0.1", port=8080):
+    """以服务模式运行，通过HTTP接口同时服务多个会话"""
+    from core.session_server import SessionServer
+    await prepare_agent_async()
+    server = SessionServer(create_session_manager(), host=host, port=port, extra_stats=server_stats)
+    await server.start()
+    print(f"服务已启动: {server.base_url}（POST /sessions 创建会话，POST /sessions/{{id}}/messages 提问）")
+    await server.serve_forever()
+
+async def run_batch(input_path, output_path, concurrency=4, rate=None, fill_cache=False, question_fields=None):
+    """批量运行JSONL文件中的问题，结果逐条追加到输出文件；中断后重新运行会跳过已成功的问题"""
+    from core.batch_runner import BatchRunner, DEFAULT_QUESTION_FIELDS, read_questions
+    items = list(read_questions(input_path, question_fields or DEFAULT_QUESTION_FIELDS))
+    await prepare_agent_async()
+    answer_cache = get_component("answer_cache")
+
+    async def run_question(question):
+        response = await run_computer_expert_agent(question, verbose=False)
+        answer = str(response)
+        tools = [call.tool_name for call in getattr(response, "tool_calls", []) if hasattr(call, "tool_name")]
+        # 预先生成常见问题的回答：写入回答缓存，命令行和服务模式中相同的问题可以直接回答
+        if fill_cache:
+            answer_cache.store(question, answer, tools)
+        return {"answer": answer, "tools": tools}
+
+    def on_result(record, finished, total):
+        detail = f"{record['seconds']:.1f}s" if record["status"] == "ok" else record["error"]
+        print(f"[{finished}/{total}] {record['id']}: {record['status']} ({detail})")
+
+    runner = BatchRunner(run_question, output_path, concurrency=concurrency, rate=rate, timeout=TURN_TIMEOUT,
+                         on_result=on_result)
+    print(f"读取到 {len(items)} 个问题，结果写入 {output_path}")
+    await runner.run(items)
+    print(runner.format_stats())
+    return runner.stats
+
+def get_option(name, default):
+    """读取命令行参数 --name value"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
 # 主函数
 async def main():
     # 检查命令行参数是否包含调试模式
@@ -332,9 +820,37 @@ async def main():
             print("[提示] 调试模式已开启")
         elif '--help' in sys.argv:
             print("使用方法：")
-            print("  python computer_expert_agent.py              # 正常模式启动")
-            print("  python computer_expert_agent.py --debug      # 开启调试模式启动")
-            print("  python computer_expert_agent.py --help       # 显示帮助信息")
+            print("  python computer_expert_agent.py                    # 正常模式启动")
+            print("  python computer_expert_agent.py --debug            # 开启调试模式启动")
+            print("  python computer_expert_agent.py --session <ID>     # 恢复指定的会话（默认恢复最近的会话）")
+            print("  python computer_expert_agent.py --new-session      # 开始新会话，不恢复之前的对话")
+            print("  python computer_expert_agent.py --measure-startup  # 测量启动各阶段耗时后退出")
+            print("  python computer_expert_agent.py --serve [--host 127.0.0.1] [--port 8080]  # 以多会话HTTP服务模式运行")
+            print("  python computer_expert_agent.py --batch questions.jsonl [--output answers.jsonl] [--concurrency 4] [--rate 2]")
+            print("                                 [--fields question,title,body] [--fill-cache]  # 批量运行问题")
+            print("  python computer_expert_agent.py --help             # 显示帮助信息")
+            return
+        elif '--measure-startup' in sys.argv:
+            STARTUP_TIMINGS["main"] = time.perf_counter() - STARTUP_BEGIN
+            prepare_agent()
+            print(format_startup_timings())
+            return
+        elif '--serve' in sys.argv:
+            await serve(get_option('--host', '127.0.0.1'), int(get_option('--port', '8080')))
+            return
+        elif '--batch' in sys.argv:
+            input_path = get_option('--batch', None)
+            if not input_path:
+                print("请指定问题文件，例如 --batch questions.jsonl")
+                return
+            from core.batch_runner import default_output_path
+            rate = get_option('--rate', None)
+            fields = get_option('--fields', None)
+            await run_batch(input_path, get_option('--output', default_output_path(input_path)),
+                            concurrency=int(get_option('--concurrency', '4')),
+                            rate=float(rate) if rate else None,
+                            fill_cache='--fill-cache' in sys.argv,
+                            question_fields=fields.split(',') if fields else None)
             return
     
     print("=== 电脑操作专家AI助手 ===")
@@ -342,10 +858,20 @@ async def main():
     print("注意：本助手仅支持Windows系统操作")
     print("输入 'exit'、'quit' 或 '退出' 结束对话")
     print("输入 '/debug on' 开启调试模式，输入 '/debug off' 关闭调试模式")
+    print("输入 '/cache' 查看回答缓存统计，输入 '/cache clear' 清空回答缓存")
+    print("输入 '/stats' 查看本次会话的延迟统计（首个token时间、生成速度、LLM与工具耗时）")
+    print("输入 '/stats tools [排序字段]' 查看各工具的调用次数、耗时和输出大小，例如 '/stats tools output_tokens'")
+    print("输入 '/macro' 录制和重放操作宏，输入 '/session' 查看、切换或新建会话")
+    print("输入 '/diagnose <问题描述>' 自动收集系统状态并分析故障原因")
     print("=" * 50)
+    STARTUP_TIMINGS["banner"] = time.perf_counter() - STARTUP_BEGIN
     
     # 运行交互式对话（默认使用流式输出）
-    await interactive_chat()
+    if '--new-session' in sys.argv:
+        from core.session_store import new_session_id
+        await interactive_chat(new_session_id())
+    else:
+        await interactive_chat(get_option('--session', None))
 
 if __name__ == "__main__":
     try:
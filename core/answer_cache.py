@@ -0,0 +1,175 @@
+import os
+import re
+import sys
+import json
+import time
+import threading
+import unicodedata
+from collections import Counter
+from typing import Iterable, Optional
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANSWER_CACHE_FILE = os.path.join(PROJECT_DIR, '.cache', 'answer_cache.json')
+
+# 只使用了这些工具（或没有使用工具）的回答才会被缓存；其他工具要么有副作用，要么返回实时状态
+CACHEABLE_TOOLS = {'read_tutorial', 'search_knowledge_base', 'request_tool_groups', 'read_tool_output'}
+
+# 过短的问题（例如“继续”、“好的”）依赖上下文，不参与缓存
+MIN_QUESTION_LENGTH = 4
+
+_PUNCTUATION_PATTERN = re.compile(r'[\s\W_]+', re.UNICODE)
+
+def normalize_question(question: str) -> str:
+    """规范化问题文本：统一全角半角和大小写，去掉空白和标点"""
+    text = unicodedata.normalize('NFKC', question).lower()
+    return _PUNCTUATION_PATTERN.sub('', text)
+
+# 相似匹配时比较的字符片段长度
+NGRAM_SIZE = 3
+_ASCII_RUN_PATTERN = re.compile(r'[a-z0-9]+')
+# 否定词和意思相反的操作词：只差其中一个词的两个问题需要相反的操作步骤，例如“显示隐藏的文件”和“不显示隐藏的文件”
+POLARITY_WORDS = ('不', '没', '无', '别', '禁止', '禁用', '启用', '打开', '开启', '关闭', '取消', '显示', '隐藏',
+                  '添加', '删除', '安装', '卸载', '启动', '停止', '增加', '减少', '允许', '阻止', '加密', '解密')
+_POLARITY_PATTERN = re.compile('|'.join(sorted(POLARITY_WORDS, key=len, reverse=True)))
+
+def _ngrams(key: str) -> Counter:
+    """规范化问题中按顺序相邻的字符片段（包括字母和数字），交换词语的位置会得到不同的片段"""
+    if len(key) <= NGRAM_SIZE:
+        return Counter([key])
+    return Counter(key[i:i + NGRAM_SIZE] for i in range(len(key) - NGRAM_SIZE + 1))
+
+def _similarity(key_a: str, key_b: str) -> float:
+    """两个规范化问题的相似度：字符片段多重集合的Jaccard相似度
+
+    问题中的字母和数字（盘符、数值、程序名等）以及否定词和相反的操作词按出现顺序必须完全相同，否则相似度为0，
+    例如“把C盘的文件移动到D盘”和“把D盘的文件移动到C盘”、“如何显示隐藏的文件”和“如何不显示隐藏的文件”不会匹配。
+    """
+    if not key_a or not key_b:
+        return 0.0
+    for pattern in (_ASCII_RUN_PATTERN, _POLARITY_PATTERN):
+        if pattern.findall(key_a) != pattern.findall(key_b):
+            return 0.0
+    grams_a, grams_b = _ngrams(key_a), _ngrams(key_b)
+    return sum((grams_a & grams_b).values()) / sum((grams_a | grams_b).values())
+
+class AnswerCache:
+    """按规范化问题缓存回答的磁盘缓存，按条目数、总大小和存活时间淘汰"""
+
+    def __init__(self, path: str = ANSWER_CACHE_FILE, max_entries: int = 500, max_bytes: int = 2 * 1024 * 1024,
+                 max_age_days: float = 30.0, similarity_threshold: Optional[float] = 0.85):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 3600
+        # 为None时只做规范化后的精确匹配
+        self.similarity_threshold = similarity_threshold
+        self.lock = threading.Lock()
+        self.entries = None
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'bypassed': 0}
+
+    def _load(self) -> dict:
+        if self.entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_file = self.path + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_file, self.path)
+
+    def _evict(self) -> None:
+        """删除过期条目，再按最近使用时间淘汰，直到满足条目数和大小限制"""
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if now - entry['created'] > self.max_age]:
+            del self.entries[key]
+        total_bytes = sum(len(entry['answer'].encode('utf-8')) for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda k: self.entries[k]['last_used']):
+            if len(self.entries) <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            total_bytes -= len(self.entries[key]['answer'].encode('utf-8'))
+            del self.entries[key]
+
+    def lookup(self, question: str) -> Optional[str]:
+        """查找缓存的回答，未命中时返回None"""
+        key = normalize_question(question)
+        if len(key) < MIN_QUESTION_LENGTH:
+            return None
+        with self.lock:
+            entries = self._load()
+            entry = entries.get(key)
+            if entry is None and self.similarity_threshold is not None:
+                best_score = 0.0
+                for candidate in entries.values():
+                    score = _similarity(key, candidate['key'])
+                    if score > best_score:
+                        best_score, entry = score, candidate
+                if best_score < self.similarity_threshold:
+                    entry = None
+            if entry is None or time.time() - entry['created'] > self.max_age:
+                self.stats['misses'] += 1
+                return None
+            entry['last_used'] = time.time()
+            entry['hits'] += 1
+            self.stats['hits'] += 1
+            return entry['answer']
+
+    def store(self, question: str, answer: str, tools_used: Iterable[str] = ()) -> bool:
+        """缓存回答；使用了有副作用或实时状态工具的回答不会被缓存，返回是否已缓存"""
+        key = normalize_question(question)
+        if not answer or len(key) < MIN_QUESTION_LENGTH:
+            return False
+        if any(tool not in CACHEABLE_TOOLS for tool in tools_used):
+            self.stats['bypassed'] += 1
+            return False
+        with self.lock:
+            entries = self._load()
+            now = time.time()
+            entries[key] = {'key': key, 'question': question, 'answer': answer,
+                            'created': now, 'last_used': now, 'hits': 0}
+            self._evict()
+            self._save()
+            self.stats['stores'] += 1
+        return True
+
+    def memory_bytes(self) -> int:
+        """已载入内存的缓存条目占用的内存（字节，只计算问题和回答文本），未载入时为0"""
+        with self.lock:
+            if self.entries is None:
+                return 0
+            return sum(sys.getsizeof(entry['answer']) + sys.getsizeof(entry['question'])
+                       for entry in self.entries.values())
+
+    def unload(self, max_bytes: int = 0) -> int:
+        """保存后释放内存中的缓存条目，下次查找时重新从磁盘读取；返回释放的字节数
+
+        参数:
+            max_bytes: 占用的内存不超过该值时不释放
+        """
+        size = self.memory_bytes()
+        if size <= max_bytes:
+            return 0
+        with self.lock:
+            if self.entries is not None:
+                # 保存查找时更新的使用时间和命中次数
+                self._save()
+                self.entries = None
+        return size
+
+    def clear(self) -> int:
+        """清空缓存，返回删除的条目数"""
+        with self.lock:
+            count = len(self._load())
+            self.entries = {}
+            self._save()
+        return count
+
+    def format_stats(self) -> str:
+        stats = self.stats
+        return (f"回答缓存: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次, "
+                f"新增 {stats['stores']} 条, 因使用操作类工具未缓存 {stats['bypassed']} 次")
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import asyncio
+from typing import Awaitable, Callable, Iterator, List, Optional, Sequence
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH_OUTPUT_DIR = os.path.join(PROJECT_DIR, '.cache', 'batch')
+
+# 依次查找的问题字段；同一条记录中存在多个字段时（例如 title 和 body）按顺序换行拼接
+DEFAULT_QUESTION_FIELDS = ('question', 'prompt', 'message', 'title', 'body')
+# 依次查找的编号字段，都不存在时使用行号
+DEFAULT_ID_FIELDS = ('id', 'request_id', 'question_id')
+
+def read_questions(path: str, question_fields: Sequence[str] = DEFAULT_QUESTION_FIELDS,
+                   id_fields: Sequence[str] = DEFAULT_ID_FIELDS) -> Iterator[dict]:
+    """逐行读取JSONL文件中的问题，返回 {'id', 'question'}；每行也可以是纯文本问题"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = line
+            if isinstance(record, str):
+                yield {'id': str(line_number), 'question': record}
+                continue
+            question = '\n'.join(str(record[field]).strip() for field in question_fields if record.get(field))
+            if not question:
+                continue
+            item_id = next((str(record[field]) for field in id_fields if record.get(field) is not None), str(line_number))
+            yield {'id': item_id, 'question': question}
+
+def default_output_path(input_path: str) -> str:
+    """默认的输出文件：.cache/batch/<输入文件名>.answers.jsonl"""
+    return os.path.join(BATCH_OUTPUT_DIR, os.path.splitext(os.path.basename(input_path))[0] + '.answers.jsonl')
+
+def read_checkpoint(path: str) -> dict:
+    """读取已有的输出文件，返回 {编号: 最后一条结果}；忽略崩溃时写了一半的行"""
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and 'id' in record:
+                results[str(record['id'])] = record
+    return results
+
+class RateLimiter:
+    """令牌桶限速：平均每秒最多 rate 次，允许 burst 次突发
+
+    参数:
+        rate: 每秒允许的次数，None或0表示不限速
+        burst: 令牌桶容量
+    """
+
+    def __init__(self, rate: Optional[float], burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.rate:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class BatchRunner:
+    """批量运行问题：限制并发数和速率，每完成一个问题就追加写入输出文件
+
+    输出文件同时作为断点：重新运行时跳过已经成功的问题，之前出错的问题会重新运行（以最后一条结果为准）。
+
+    参数:
+        run_question: 运行一个问题的协程函数，返回 {'answer': 回答, 'tools': [使用的工具]}，出错时抛出异常
+        output_path: 输出JSONL文件路径
+        concurrency: 同时运行的问题数
+        rate: 每秒最多开始的问题数，None表示不限速
+        timeout: 每个问题的最长运行时间（秒）
+        on_result: 每完成一个问题调用的回调，参数为 (结果, 已完成数, 总数)
+    """
+
+    def __init__(self, run_question: Callable[[str], Awaitable[dict]], output_path: str, concurrency: int = 4,
+                 rate: Optional[float] = None, timeout: float = 300.0,
+                 on_result: Optional[Callable[[dict, int, int], None]] = None):
+        self.run_question = run_question
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = RateLimiter(rate, burst=self.concurrency)
+        self.timeout = timeout
+        self.on_result = on_result
+        self.stats = {'total': 0, 'skipped': 0, 'ok': 0, 'errors': 0, 'seconds': []}
+
+    def _open_output(self):
+        directory = os.path.dirname(os.path.abspath(self.output_path))
+        os.makedirs(directory, exist_ok=True)
+        # 上次崩溃时最后一行可能没有写完，换行后再追加，避免新结果接在残缺的行后面
+        incomplete = False
+        if os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0:
+            with open(self.output_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                incomplete = f.read(1) != b'\n'
+        output = open(self.output_path, 'a', encoding='utf-8')
+        if incomplete:
+            output.write('\n')
+        return output
+
+    async def _run_one(self, item: dict) -> dict:
+        await self.rate_limiter.acquire()
+        started_at = time.time()
+        start = time.perf_counter()
+        record = {'id': item['id'], 'question': item['question']}
+        try:
+            result = await asyncio.wait_for(self.run_question(item['question']), timeout=self.timeout)
+            record.update(status='ok', answer=result.get('answer', ''), tools=result.get('tools', []))
+        except asyncio.TimeoutError:
+            record.update(status='error', error=f"运行超过 {self.timeout:.0f} 秒")
+        except Exception as e:
+            record.update(status='error', error=f"运行问题时出错: {str(e)}")
+        record.update(seconds=round(time.perf_counter() - start, 4), started_at=started_at, finished_at=time.time())
+        return record
+
+    async def run(self, items: List[dict]) -> dict:
+        """运行所有未完成的问题，返回统计信息"""
+        done = {item_id for item_id, record in read_checkpoint(self.output_path).items() if record.get('status') == 'ok'}
+        pending = [item for item in items if item['id'] not in done]
+        self.stats.update(total=len(items), skipped=len(items) - len(pending))
+        queue = asyncio.Queue()
+        for item in pending:
+            queue.put_nowait(item)
+        finished = self.stats['skipped']
+        start = time.perf_counter()
+
+        with self._open_output() as output:
+            async def worker():
+                nonlocal finished
+                while True:
+                    try:
+                        item = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    record = await self._run_one(item)
+                    # 每条结果写完立即刷新到磁盘，崩溃后最多丢失正在运行的问题
+                    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    output.flush()
+                    finished += 1
+                    self.stats['ok' if record['status'] == 'ok' else 'errors'] += 1
+                    self.stats['seconds'].append(record['seconds'])
+                    if self.on_result is not None:
+                        self.on_result(record, finished, len(items))
+
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(pending)))))
+        self.stats['wall_seconds'] = time.perf_counter() - start
+        return self.stats
+
+    def format_stats(self) -> str:
+        stats = self.stats
+        seconds = sorted(stats['seconds'])
+        ran = stats['ok'] + stats['errors']
+        wall = stats.get('wall_seconds', 0.0)
+        p50 = seconds[len(seconds) // 2] if seconds else 0.0
+        p95 = seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))] if seconds else 0.0
+        return (f"共 {stats['total']} 个问题: 跳过已完成 {stats['skipped']} 个, 成功 {stats['ok']} 个, 出错 {stats['errors']} 个; "
+                f"耗时 {wall:.1f}s, 吞吐量 {ran / wall if wall else 0:.2f} 个/秒, 单个问题 p50 {p50:.2f}s, p95 {p95:.2f}s")
@@ -0,0 +1,195 @@
+import time
+from typing import Iterable, List, Optional, Tuple
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.workflow import Context
+from tools.text_search import estimate_tokens
+
+# 由上下文管理器插入的开头消息的内容保存在上下文状态的这个键中，用于在压缩时识别并重新生成该消息。
+# 不在消息本身上做标记：additional_kwargs 会原样发送给模型服务，非标准字段可能被拒绝
+CONTEXT_HEADER_KEY = 'context_header'
+
+# 这些工具的结果会作为固定信息保留在上下文中，不会被压缩掉
+PINNED_TOOL_FACTS = {
+    'get_desktop_path': '桌面路径',
+    'get_system_info': '系统信息',
+    'show_windows_version': 'Windows版本',
+    'check_disk_space': '磁盘空间',
+    'get_screen_size': '屏幕尺寸',
+}
+MAX_PINNED_FACT_CHARS = 400
+# 固定信息的有效期（秒）；生成上下文开头和每轮开始时丢弃过期的信息，让模型重新调用工具获取
+PINNED_FACT_TTLS = {
+    '桌面路径': 30 * 86400,
+    '系统信息': 7 * 86400,
+    'Windows版本': 7 * 86400,
+    '屏幕尺寸': 86400,
+    '磁盘空间': 3600,
+}
+DEFAULT_FACT_TTL = 86400
+
+def _truncate_middle(text: str, max_chars: int) -> str:
+    """保留文本开头和结尾，截掉中间部分"""
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    return f"{text[:head]}\n[...已截断 {len(text) - max_chars} 字符...]\n{text[-tail:]}"
+
+def _message_tokens(message: ChatMessage) -> int:
+    return estimate_tokens(message.content or '') + 4
+
+def _split_turns(messages: List[ChatMessage]) -> List[List[ChatMessage]]:
+    """按用户消息把对话切分为轮次，工具调用和工具结果始终留在同一轮中"""
+    turns = []
+    for message in messages:
+        if message.role == MessageRole.USER or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+def _summarize_turn(turn: List[ChatMessage]) -> str:
+    """把一轮对话压缩为一行摘要：用户问题和助手的最终回答"""
+    question = next((m.content for m in turn if m.role == MessageRole.USER and m.content), '')
+    answer = next((m.content for m in reversed(turn) if m.role == MessageRole.ASSISTANT and m.content), '')
+    question = ' '.join(question.split())[:80]
+    answer = ' '.join(answer.split())[:120]
+    return f"- 用户: {question} -> 助手: {answer}"
+
+class ContextManager:
+    """按token预算压缩对话上下文，代替定期丢弃整个上下文
+
+    每轮对话结束后：截断旧轮次中过长的工具输出；超出预算时把最早的轮次替换为一行摘要；
+    桌面路径、系统信息等固定信息始终保留在上下文开头。
+    """
+
+    def __init__(self, token_budget: int = 6000, keep_recent_turns: int = 2, max_tool_output_chars: int = 800,
+                 max_summary_lines: int = 20):
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.max_tool_output_chars = max_tool_output_chars
+        self.max_summary_lines = max_summary_lines
+        # 每轮的 (压缩前token数, 压缩后token数)
+        self.turn_tokens = []
+
+    async def pin_tool_results(self, ctx: Context, tool_results: Iterable[Tuple[str, str]]) -> None:
+        """从本轮的工具结果中提取需要固定保留的信息"""
+        pinned = dict(await ctx.get('pinned_facts', default={}))
+        fact_times = dict(await ctx.get('pinned_fact_times', default={}))
+        for tool_name, output in tool_results:
+            label = PINNED_TOOL_FACTS.get(tool_name)
+            if label and output and '出错' not in output:
+                pinned[label] = output[:MAX_PINNED_FACT_CHARS]
+                fact_times[label] = time.time()
+        await ctx.set('pinned_facts', pinned)
+        await ctx.set('pinned_fact_times', fact_times)
+
+    @staticmethod
+    def fresh_facts(pinned: dict, fact_times: dict, now: Optional[float] = None) -> dict:
+        """返回未过期的固定信息；没有记录时间的信息视为过期"""
+        now = time.time() if now is None else now
+        return {label: value for label, value in pinned.items()
+                if now - fact_times.get(label, 0) <= PINNED_FACT_TTLS.get(label, DEFAULT_FACT_TTL)}
+
+    async def _drop_expired_facts(self, ctx: Context) -> int:
+        """从上下文状态中删除过期的固定信息，返回删除的数量"""
+        pinned = await ctx.get('pinned_facts', default={})
+        fact_times = await ctx.get('pinned_fact_times', default={})
+        fresh = self.fresh_facts(pinned, fact_times)
+        if len(fresh) < len(pinned):
+            await ctx.set('pinned_facts', fresh)
+            await ctx.set('pinned_fact_times', {label: fact_times[label] for label in fresh})
+        return len(pinned) - len(fresh)
+
+    async def expire_facts(self, ctx: Context) -> int:
+        """每轮开始前调用：丢弃过期的固定信息（例如超过1小时的磁盘空间），有过期时重新生成上下文开头；返回丢弃的数量"""
+        expired = await self._drop_expired_facts(ctx)
+        if expired:
+            await self.compact(ctx)
+        return expired
+
+    @staticmethod
+    async def conversation_messages(ctx: Context) -> List[ChatMessage]:
+        """上下文记忆中的对话消息，不包括上下文管理器插入的开头消息"""
+        memory = await ctx.get('memory', default=None)
+        if memory is None:
+            return []
+        header = await ctx.get(CONTEXT_HEADER_KEY, default=None)
+        return [m for m in await memory.aget_all()
+                if not (header is not None and m.role == MessageRole.SYSTEM and m.content == header)]
+
+    async def compact(self, ctx: Context) -> None:
+        """压缩上下文记忆，使其保持在token预算内；上下文开头只包含未过期的固定信息"""
+        await self._drop_expired_facts(ctx)
+        memory = await ctx.get('memory', default=None)
+        if memory is None:
+            return
+        messages = await self.conversation_messages(ctx)
+        tokens_before = sum(_message_tokens(m) for m in messages)
+        turns = _split_turns(messages)
+
+        # 工具输出只保留首尾；最近一轮可能被追问，保留更多内容
+        for turn_index, turn in enumerate(turns):
+            limit = self.max_tool_output_chars * (4 if turn_index == len(turns) - 1 else 1)
+            for index, message in enumerate(turn):
+                if message.role == MessageRole.TOOL and len(message.content or '') > limit:
+                    turn[index] = ChatMessage(
+                        role=message.role,
+                        content=_truncate_middle(message.content, limit),
+                        additional_kwargs=message.additional_kwargs,
+                    )
+
+        summary_lines = list(await ctx.get('context_summary', default=[]))
+        pinned = await ctx.get('pinned_facts', default={})
+
+        def header_message():
+            parts = []
+            if pinned:
+                parts.append("已知信息（来自之前的工具调用，无需重复获取）：\n" + "\n".join(f"{label}: {value}" for label, value in pinned.items()))
+            if summary_lines:
+                parts.append("早期对话摘要：\n" + "\n".join(summary_lines))
+            if not parts:
+                return None
+            return ChatMessage(role=MessageRole.SYSTEM, content="\n\n".join(parts))
+
+        def total_tokens():
+            header = header_message()
+            return (_message_tokens(header) if header else 0) + sum(_message_tokens(m) for turn in turns for m in turn)
+
+        # 超出预算时，把最早的轮次替换为摘要
+        while len(turns) > self.keep_recent_turns and total_tokens() > self.token_budget:
+            summary_lines.append(_summarize_turn(turns.pop(0)))
+            summary_lines = summary_lines[-self.max_summary_lines:]
+        # 仍然超出预算时，丢弃最早的摘要
+        while summary_lines and total_tokens() > self.token_budget:
+            summary_lines.pop(0)
+
+        header = header_message()
+        compacted = ([header] if header else []) + [m for turn in turns for m in turn]
+        await memory.aset(compacted)
+        await ctx.set(CONTEXT_HEADER_KEY, header.content if header else None)
+        await ctx.set('context_summary', summary_lines)
+        self.turn_tokens.append((tokens_before, total_tokens()))
+
+    async def after_turn(self, ctx: Context, tool_results: Iterable[Tuple[str, str]] = ()) -> None:
+        """每轮对话结束后调用：记录固定信息并压缩上下文"""
+        await self.pin_tool_results(ctx, tool_results)
+        await self.compact(ctx)
+
+    async def carry_over(self, old_ctx: Context, new_ctx: Context) -> None:
+        """把旧上下文中的对话记忆、摘要和固定信息转移到新上下文（例如处理超时后重建上下文时）"""
+        memory = await old_ctx.get('memory', default=None)
+        if memory is not None:
+            await new_ctx.set('memory', memory)
+            await new_ctx.set(CONTEXT_HEADER_KEY, await old_ctx.get(CONTEXT_HEADER_KEY, default=None))
+        await new_ctx.set('context_summary', await old_ctx.get('context_summary', default=[]))
+        await new_ctx.set('pinned_facts', await old_ctx.get('pinned_facts', default={}))
+        await new_ctx.set('pinned_fact_times', await old_ctx.get('pinned_fact_times', default={}))
+        await self.compact(new_ctx)
+
+    def format_stats(self) -> str:
+        """返回最近一轮的上下文大小"""
+        if not self.turn_tokens:
+            return "上下文: 尚无对话"
+        before, after = self.turn_tokens[-1]
+        return f"上下文: 约 {after} tokens (压缩前 {before}, 预算 {self.token_budget}), 已进行 {len(self.turn_tokens)} 轮"
@@ -0,0 +1,72 @@
+"""电脑故障诊断工作流：用工作单元引擎（core/work_units.py）并发收集系统状态，再在独立上下文中分析
+
+    collect_system ─┐
+    collect_disk   ─┼─> analyze（LLM，独立上下文，JSON输出）
+    collect_processes┘
+
+三个收集单元互不依赖，并发执行；它们读取的是实时状态，不缓存。分析单元的输入是问题和收集到的结果，
+按输入缓存：重新诊断时状态没有变化就直接使用上次的分析，不再调用模型。
+"""
+import asyncio
+from typing import Callable, Dict, List
+from core.work_units import WorkUnit, WorkUnitEngine, WorkUnitResult
+
+ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'required': ['causes', 'steps'],
+    'properties': {
+        'causes': {'type': 'array', 'items': {'type': 'string'}},
+        'steps': {'type': 'array', 'items': {'type': 'string'}},
+    },
+}
+
+ANALYSIS_INSTRUCTIONS = (
+    "你是Windows故障诊断专家。输入是用户的问题和刚刚收集到的系统信息、磁盘空间和进程列表。"
+    "根据这些信息找出最可能的原因（causes），并给出用户可以按顺序执行的处理步骤（steps）。"
+    "只依据输入中的信息，无法从输入判断的内容不要猜测。"
+)
+
+# 收集单元：单元名称 -> 工具名称
+COLLECTORS = {
+    'collect_system': 'get_system_info',
+    'collect_disk': 'check_disk_space',
+    'collect_processes': 'get_running_processes',
+}
+
+def _collector(tool: Callable) -> Callable[[dict], asyncio.Future]:
+    async def run(inputs: dict) -> str:
+        return await asyncio.to_thread(tool)
+    return run
+
+def build_diagnosis_units(resolve_tool: Callable[[str], Callable]) -> List[WorkUnit]:
+    """创建诊断工作流的工作单元
+
+    参数:
+        resolve_tool: 按名称返回工具函数
+    """
+    units = [WorkUnit(name, run=_collector(resolve_tool(tool)), output_schema={'type': 'string'},
+                      timeout=30.0, cacheable=False)
+             for name, tool in COLLECTORS.items()]
+    units.append(WorkUnit('analyze', ANALYSIS_INSTRUCTIONS, depends_on=list(COLLECTORS),
+                          input_schema={'type': 'object', 'required': ['question']},
+                          output_schema=ANALYSIS_SCHEMA, retries=1, timeout=120.0))
+    return units
+
+async def run_diagnosis(engine: WorkUnitEngine, question: str,
+                        resolve_tool: Callable[[str], Callable]) -> Dict[str, WorkUnitResult]:
+    """执行诊断工作流，返回 单元名称 -> 结果"""
+    return await engine.run(build_diagnosis_units(resolve_tool), {'question': question})
+
+def format_diagnosis(results: Dict[str, WorkUnitResult]) -> str:
+    """把诊断结果格式化为给用户的回答"""
+    analysis = results.get('analyze')
+    if analysis is None or analysis.status not in ('ok', 'cached'):
+        reason = analysis.error if analysis is not None else '没有执行分析'
+        return f"诊断未完成: {reason}"
+    lines = ["可能的原因:"]
+    lines.extend(f"  - {cause}" for cause in analysis.output['causes'])
+    lines.append("处理步骤:")
+    lines.extend(f"  {index}. {step}" for index, step in enumerate(analysis.output['steps'], 1))
+    if analysis.status == 'cached':
+        lines.append("（系统状态与上次诊断时相同，使用了上次的分析结果）")
+    return "\n".join(lines)
@@ -0,0 +1,76 @@
+import time
+import asyncio
+import functools
+import threading
+from typing import Callable
+
+class GuiLock:
+    """鼠标、键盘和屏幕只有一套，多个会话同时调用GUI工具时按顺序执行
+
+    同步工具在线程池中运行，因此使用线程锁；记录等待锁的次数和时间，用于判断GUI操作是否成为瓶颈。
+
+    参数:
+        timeout: 等待锁的最长时间（秒），超时后工具返回错误信息而不是一直等待
+    """
+
+    def __init__(self, timeout: float = 120.0):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.stats = {'calls': 0, 'contended': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0, 'timeouts': 0}
+
+    def _acquire(self, name: str):
+        start = time.perf_counter()
+        if self.lock.acquire(blocking=False):
+            self.stats['calls'] += 1
+            return None
+        if not self.lock.acquire(timeout=self.timeout):
+            self.stats['timeouts'] += 1
+            return f"执行 {name} 时出错: 等待鼠标键盘超过 {self.timeout:.0f} 秒，其他会话正在操作"
+        waited = time.perf_counter() - start
+        self.stats['calls'] += 1
+        self.stats['contended'] += 1
+        self.stats['wait_seconds'] += waited
+        self.stats['max_wait_seconds'] = max(self.stats['max_wait_seconds'], waited)
+        return None
+
+    def wrap(self, func: Callable) -> Callable:
+        """包装工具函数，调用期间独占GUI；保留函数名、说明和参数签名"""
+        name = getattr(func, '__name__', 'tool')
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                error = await asyncio.to_thread(self._acquire, name)
+                if error:
+                    return error
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.lock.release()
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            error = self._acquire(name)
+            if error:
+                return error
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.lock.release()
+        return wrapper
+
+    def call(self, name: str, func: Callable, *args, **kwargs):
+        """独占GUI执行一组操作（例如重放宏），期间其他会话的GUI工具排队等待"""
+        error = self._acquire(name)
+        if error:
+            return error
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.lock.release()
+
+    def format_stats(self) -> str:
+        stats = self.stats
+        average = stats['wait_seconds'] / stats['contended'] * 1000 if stats['contended'] else 0
+        return (f"GUI工具: 调用 {stats['calls']} 次, 排队 {stats['contended']} 次 (平均等待 {average:.0f}ms, "
+                f"最长 {stats['max_wait_seconds'] * 1000:.0f}ms), 等待超时 {stats['timeouts']} 次")
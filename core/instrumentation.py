@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import hashlib
+import bisect
+import threading
+from typing import Optional, Sequence
+from llama_index.core.agent.workflow import AgentInput, AgentOutput, AgentStream, ToolCall, ToolCallResult
+from tools.text_search import estimate_tokens
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRICS_DIR = os.path.join(PROJECT_DIR, '.cache', 'metrics')
+
+# 延迟直方图的分桶上界（秒）
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """带固定分桶的直方图，同时保留最近的样本用于计算分位数"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS, max_samples: int = 2048):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max_samples = max_samples
+        self.samples = []
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+        if len(self.samples) > self.max_samples:
+            del self.samples[:len(self.samples) - self.max_samples]
+
+    def percentile(self, percent: float) -> float:
+        """返回最近样本的分位数，没有样本时返回0"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(percent / 100 * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def prometheus_lines(self, name: str, labels: str = '') -> list:
+        """按Prometheus文本格式输出直方图"""
+        label_prefix = f"{labels}," if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label_prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{label_prefix}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ''
+        lines.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+class TurnTrace:
+    """记录一轮对话中的各个阶段：首个token、每次LLM调用、每次工具调用"""
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.spans = []
+        self.cache_hit = False
+        self.output_tokens = 0
+        self._step_start = None
+        self._step_first_token = None
+        self._step_text = ''
+        self._tool_starts = {}
+
+    def _offset(self, moment: float) -> float:
+        return round(moment - self.start, 4)
+
+    def on_event(self, event) -> None:
+        """处理一个流式事件"""
+        now = time.perf_counter()
+        if isinstance(event, AgentInput):
+            # FunctionAgent在每次调用LLM前发出AgentInput
+            self._step_start = now
+            self._step_first_token = None
+            self._step_text = ''
+        elif isinstance(event, AgentStream):
+            if event.delta:
+                if self.first_token_at is None:
+                    self.first_token_at = now
+                if self._step_first_token is None:
+                    self._step_first_token = now
+                self._step_text += event.delta
+        elif isinstance(event, AgentOutput):
+            if self._step_start is not None:
+                tokens = estimate_tokens(self._step_text)
+                self.output_tokens += tokens
+                self.spans.append({
+                    'name': 'llm_step',
+                    'start': self._offset(self._step_start),
+                    'duration': round(now - self._step_start, 4),
+                    'first_token': round(self._step_first_token - self._step_start, 4) if self._step_first_token else None,
+                    'output_tokens': tokens,
+                    'tool_calls': len(event.tool_calls),
+                })
+                self._step_start = None
+        elif isinstance(event, ToolCallResult):
+            started = self._tool_starts.pop(event.tool_id, now)
+            self.spans.append({
+                'name': f"tool:{event.tool_name}",
+                'start': self._offset(started),
+                'duration': round(now - started, 4),
+                'error': bool(getattr(event.tool_output, 'is_error', False)),
+            })
+        elif isinstance(event, ToolCall):
+            self._tool_starts[event.tool_id] = now
+
+    def mark_first_token(self) -> None:
+        """直接输出（例如缓存命中）时记录首个token的时间"""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def to_record(self, status: str, total_seconds: float, include_prompt: bool = False) -> dict:
+        """转换为导出的记录；默认只记录问题的哈希和长度，include_prompt 为True时记录问题原文（前200个字符）"""
+        llm_seconds = sum(span['duration'] for span in self.spans if span['name'] == 'llm_step')
+        tool_seconds = sum(span['duration'] for span in self.spans if span['name'].startswith('tool:'))
+        record = {
+            'timestamp': round(self.started_at, 3),
+            'prompt_hash': hashlib.sha256(self.prompt.encode('utf-8')).hexdigest()[:16],
+            'prompt_chars': len(self.prompt),
+            'status': status,
+            'cache_hit': self.cache_hit,
+            'total_seconds': round(total_seconds, 4),
+            'ttft_seconds': round(self.first_token_at - self.start, 4) if self.first_token_at else None,
+            'llm_seconds': round(llm_seconds, 4),
+            'tool_seconds': round(tool_seconds, 4),
+            'output_tokens': self.output_tokens,
+            'spans': self.spans,
+        }
+        if include_prompt:
+            record['prompt'] = self.prompt[:200]
+        return record
+
+class StreamMetrics:
+    """汇总每轮对话的延迟指标，并导出为JSON Lines和Prometheus文本文件
+
+    参数:
+        jsonl_path: 每轮对话一条记录的JSON Lines文件路径，为None时不导出
+        prometheus_path: Prometheus文本格式的指标文件路径（每轮结束后覆盖写入），为None时不导出
+        max_jsonl_bytes: JSON Lines文件超过该大小时轮转为 .1、.2 ……，为None时不轮转
+        backup_count: 轮转时保留的旧文件数量
+        include_prompts: 是否在记录中保存问题原文；默认只保存问题的哈希和长度
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = os.path.join(METRICS_DIR, 'turns.jsonl'),
+                 prometheus_path: Optional[str] = os.path.join(METRICS_DIR, 'metrics.prom'),
+                 max_jsonl_bytes: Optional[int] = 5 * 1024 * 1024, backup_count: int = 3,
+                 include_prompts: bool = False):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.max_jsonl_bytes = max_jsonl_bytes
+        self.backup_count = backup_count
+        self.include_prompts = include_prompts
+        self.lock = threading.Lock()
+        self.histograms = {
+            'turn_seconds': Histogram(),
+            'ttft_seconds': Histogram(),
+            'llm_step_seconds': Histogram(),
+            'llm_first_token_seconds': Histogram(),
+            'tool_call_seconds': Histogram(),
+            'tokens_per_second': Histogram(buckets=(1, 5, 10, 20, 40, 80, 160)),
+        }
+        self.counters = {'turns': 0, 'cache_hits': 0, 'errors': 0, 'llm_steps': 0, 'tool_calls': 0,
+                         'output_tokens': 0, 'llm_seconds': 0.0, 'tool_seconds': 0.0}
+
+    def start_turn(self, prompt: str) -> TurnTrace:
+        return TurnTrace(prompt)
+
+    def finish_turn(self, trace: TurnTrace, status: str = 'ok') -> dict:
+        """结束一轮对话的记录，更新汇总指标并导出"""
+        record = trace.to_record(status, time.perf_counter() - trace.start, include_prompt=self.include_prompts)
+        with self.lock:
+            self.counters['turns'] += 1
+            self.counters['cache_hits'] += trace.cache_hit
+            self.counters['errors'] += status != 'ok'
+            self.counters['output_tokens'] += record['output_tokens']
+            self.counters['llm_seconds'] += record['llm_seconds']
+            self.counters['tool_seconds'] += record['tool_seconds']
+            self.histograms['turn_seconds'].observe(record['total_seconds'])
+            if record['ttft_seconds'] is not None:
+                self.histograms['ttft_seconds'].observe(record['ttft_seconds'])
+            for span in record['spans']:
+                if span['name'] == 'llm_step':
+                    self.counters['llm_steps'] += 1
+                    self.histograms['llm_step_seconds'].observe(span['duration'])
+                    if span['first_token'] is not None:
+                        self.histograms['llm_first_token_seconds'].observe(span['first_token'])
+                        generation_seconds = span['duration'] - span['first_token']
+                        if span['output_tokens'] and generation_seconds > 0:
+                            self.histograms['tokens_per_second'].observe(span['output_tokens'] / generation_seconds)
+                else:
+                    self.counters['tool_calls'] += 1
+                    self.histograms['tool_call_seconds'].observe(span['duration'])
+            self._export(record)
+        return record
+
+    def _rotate(self) -> None:
+        """JSON Lines文件超过大小上限时轮转：turns.jsonl -> turns.jsonl.1 -> …，删除最旧的文件"""
+        if self.max_jsonl_bytes is None:
+            return
+        try:
+            if os.path.getsize(self.jsonl_path) < self.max_jsonl_bytes:
+                return
+        except OSError:
+            return
+        if self.backup_count <= 0:
+            os.remove(self.jsonl_path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.jsonl_path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.jsonl_path}.{index + 1}")
+        os.replace(self.jsonl_path, f"{self.jsonl_path}.1")
+
+    def _export(self, record: dict) -> None:
+        try:
+            if self.jsonl_path:
+                os.makedirs(os.path.dirname(self.jsonl_path), exist_ok=True)
+                self._rotate()
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            if self.prometheus_path:
+                os.makedirs(os.path.dirname(self.prometheus_path), exist_ok=True)
+                temp_file = self.prometheus_path + '.tmp'
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    f.write(self.prometheus_text())
+                os.replace(temp_file, self.prometheus_path)
+        except OSError:
+            # 指标导出失败不影响对话
+            pass
+
+    def prometheus_text(self) -> str:
+        """返回Prometheus文本格式的全部指标"""
+        lines = []
+        for name, value in self.counters.items():
+            metric = f"agent_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value:.6f}" if isinstance(value, float) else f"{metric} {value}")
+        for name, histogram in self.histograms.items():
+            metric = f"agent_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            lines.extend(histogram.prometheus_lines(metric))
+        return "\n".join(lines) + "\n"
+
+    def format_stats(self) -> str:
+        """返回本次会话的延迟统计，用于 /stats 命令"""
+        counters = self.counters
+        if not counters['turns']:
+            return "本次会话还没有对话记录"
+        h = self.histograms
+        busy = counters['llm_seconds'] + counters['tool_seconds']
+        llm_share = counters['llm_seconds'] / busy * 100 if busy else 0
+        return "\n".join([
+            f"对话轮数: {counters['turns']} (缓存命中 {counters['cache_hits']}, 出错 {counters['errors']})",
+            f"整轮耗时: 平均 {h['turn_seconds'].mean():.2f}s, p50 {h['turn_seconds'].percentile(50):.2f}s, p95 {h['turn_seconds'].percentile(95):.2f}s",
+            f"首个token (TTFT): p50 {h['ttft_seconds'].percentile(50):.2f}s, p95 {h['ttft_seconds'].percentile(95):.2f}s",
+            f"LLM调用: {counters['llm_steps']} 次, 每次 p50 {h['llm_step_seconds'].percentile(50):.2f}s, p95 {h['llm_step_seconds'].percentile(95):.2f}s, "
+            f"生成速度平均 {h['tokens_per_second'].mean():.1f} tokens/s",
+            f"工具调用: {counters['tool_calls']} 次, 每次 p50 {h['tool_call_seconds'].percentile(50):.2f}s, p95 {h['tool_call_seconds'].percentile(95):.2f}s",
+            f"时间分布: LLM {counters['llm_seconds']:.2f}s ({llm_share:.0f}%), 工具 {counters['tool_seconds']:.2f}s ({100 - llm_share if busy else 0:.0f}%)",
+        ])
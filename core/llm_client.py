@@ -0,0 +1,484 @@
+import os
+import time
+import random
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Union
+import httpx
+import openai
+from llama_index.core.base.llms.types import (
+    ChatMessage, ChatResponse, ChatResponseAsyncGen, ChatResponseGen, CompletionResponse, CompletionResponseAsyncGen,
+    CompletionResponseGen, LLMMetadata,
+)
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms import LLM, MessageRole
+from llama_index.core.llms.function_calling import FunctionCallingLLM
+from llama_index.core.tools import ToolSelection
+from llama_index.llms.openai import OpenAI
+from core.instrumentation import Histogram
+
+# 通义千问模型的上下文窗口（tokens），未列出的模型按 DEFAULT_CONTEXT_WINDOW 处理
+QWEN_CONTEXT_WINDOWS = {
+    'qwen-max': 32768,
+    'qwen-max-latest': 131072,
+    'qwen-plus': 131072,
+    'qwen-plus-latest': 131072,
+    'qwen-turbo': 1000000,
+    'qwen-turbo-latest': 1000000,
+    'qwen-long': 10000000,
+}
+DEFAULT_CONTEXT_WINDOW = 32768
+
+# 可以重试的临时错误：连接失败、超时、限流和服务端5xx错误
+TRANSIENT_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    httpx.TransportError,
+    asyncio.TimeoutError,
+)
+
+class TransportSettings:
+    """模型服务连接参数
+
+    参数:
+        connect_timeout: 建立连接的超时时间（秒）
+        first_token_timeout: 发出请求后等待第一个数据块的超时时间（秒），超时后重试
+        idle_timeout: 流式输出过程中两个数据块之间的最长间隔（秒），超时后报错（已输出的内容不会重复）
+        pool_size: 连接池的最大连接数，空闲连接保持复用
+        keepalive_expiry: 空闲连接保留的时间（秒）
+        max_retries: 收到第一个数据块之前遇到临时错误时的最大重试次数
+        backoff_base: 重试等待时间的基数（秒），第n次重试等待 0 到 backoff_base * 2^n 之间的随机时间
+        backoff_max: 重试等待时间的上限（秒）
+    """
+
+    def __init__(self, connect_timeout: float = 5.0, first_token_timeout: float = 30.0, idle_timeout: float = 20.0,
+                 pool_size: int = 10, keepalive_expiry: float = 120.0, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.idle_timeout = idle_timeout
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    @classmethod
+    def from_env(cls) -> 'TransportSettings':
+        """从环境变量读取参数，例如 LLM_FIRST_TOKEN_TIMEOUT=20"""
+        defaults = cls()
+        values = {}
+        for name, value in vars(defaults).items():
+            env_value = os.environ.get(f"LLM_{name.upper()}")
+            if env_value:
+                values[name] = type(value)(env_value)
+        return cls(**values)
+
+    def http_timeout(self) -> httpx.Timeout:
+        # 读超时只作为兜底，首个数据块和数据块间隔的超时由 DashScopeOpenAI 分别控制
+        read_timeout = max(self.first_token_timeout, self.idle_timeout) + self.connect_timeout
+        return httpx.Timeout(connect=self.connect_timeout, read=read_timeout, write=self.connect_timeout * 2,
+                             pool=self.connect_timeout)
+
+    def create_http_clients(self):
+        """创建共享连接池的同步和异步HTTP客户端"""
+        limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size,
+                              keepalive_expiry=self.keepalive_expiry)
+        timeout = self.http_timeout()
+        return httpx.Client(timeout=timeout, limits=limits), httpx.AsyncClient(timeout=timeout, limits=limits)
+
+class DashScopeOpenAI(OpenAI):
+    """通过OpenAI兼容接口调用通义千问模型
+
+    llama_index 的 OpenAI 类只认识OpenAI自己的模型名，读取 metadata 时会对 qwen-max 等模型报错，
+    这里按模型名提供上下文窗口，并声明支持对话和函数调用。
+
+    传入 transport 时使用保持连接的连接池，并分别控制首个数据块和数据块间隔的超时；
+    在收到第一个数据块之前遇到临时错误会带随机抖动地重试。
+    """
+
+    context_window: Optional[int] = None
+    first_token_timeout: Optional[float] = None
+    idle_timeout: Optional[float] = None
+    retry_attempts: int = 0
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+
+    _http_timeout: Optional[httpx.Timeout] = PrivateAttr(default=None)
+    _transport_stats: dict = PrivateAttr(default_factory=dict)
+
+    def __init__(self, *args: Any, transport: Optional[TransportSettings] = None, **kwargs: Any) -> None:
+        if transport is not None:
+            http_client, async_http_client = transport.create_http_clients()
+            kwargs.update(
+                http_client=http_client,
+                async_http_client=async_http_client,
+                # 重试由本类处理，关闭 llama_index 和 openai SDK 自带的重试
+                max_retries=0,
+                first_token_timeout=transport.first_token_timeout,
+                idle_timeout=transport.idle_timeout,
+                retry_attempts=transport.max_retries,
+                backoff_base=transport.backoff_base,
+                backoff_max=transport.backoff_max,
+            )
+        super().__init__(*args, **kwargs)
+        if transport is not None:
+            self._http_timeout = transport.http_timeout()
+        self._transport_stats = {'requests': 0, 'retries': 0, 'first_token_timeouts': 0, 'idle_timeouts': 0,
+                                 'errors': 0, 'prewarm_seconds': None}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "dashscope_openai_llm"
+
+    @property
+    def _tokenizer(self):
+        # tiktoken 没有通义千问的分词器
+        return None
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window or QWEN_CONTEXT_WINDOWS.get(self.model, DEFAULT_CONTEXT_WINDOW),
+            num_output=self.max_tokens or -1,
+            is_chat_model=True,
+            is_function_calling_model=True,
+            model_name=self.model,
+            system_role=MessageRole.SYSTEM,
+        )
+
+    @property
+    def transport_stats(self) -> dict:
+        return self._transport_stats
+
+    def _get_credential_kwargs(self, is_async: bool = False) -> dict:
+        kwargs = super()._get_credential_kwargs(is_async=is_async)
+        if self._http_timeout is not None:
+            # openai SDK 会用 timeout 参数覆盖HTTP客户端的超时设置，这里传入分阶段的超时
+            kwargs['timeout'] = self._http_timeout
+        return kwargs
+
+    async def _backoff(self, attempt: int, error: Exception) -> None:
+        """第attempt次重试前等待，超过重试次数时抛出错误"""
+        if attempt >= self.retry_attempts:
+            self._transport_stats['errors'] += 1
+            if isinstance(error, asyncio.TimeoutError):
+                raise TimeoutError(f"模型服务在 {self.first_token_timeout} 秒内没有返回内容（已重试 {attempt} 次）") from error
+            raise error
+        self._transport_stats['retries'] += 1
+        await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+
+    async def _astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        if self.first_token_timeout is None:
+            return await super()._astream_chat(messages, **kwargs)
+        attempt = 0
+        while True:
+            self._transport_stats['requests'] += 1
+            stream = await super()._astream_chat(messages, **kwargs)
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), timeout=self.first_token_timeout)
+                break
+            except StopAsyncIteration:
+                first = None
+                break
+            except TRANSIENT_ERRORS as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self._transport_stats['first_token_timeouts'] += 1
+                await stream.aclose()
+                await self._backoff(attempt, e)
+                attempt += 1
+
+        async def gen() -> ChatResponseAsyncGen:
+            if first is None:
+                return
+            yield first
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=self.idle_timeout)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    self._transport_stats['idle_timeouts'] += 1
+                    self._transport_stats['errors'] += 1
+                    await stream.aclose()
+                    raise TimeoutError(f"模型输出中断超过 {self.idle_timeout} 秒")
+                yield chunk
+
+        return gen()
+
+    async def _achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        if self.first_token_timeout is None:
+            return await super()._achat(messages, **kwargs)
+        attempt = 0
+        while True:
+            self._transport_stats['requests'] += 1
+            try:
+                return await super()._achat(messages, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                await self._backoff(attempt, e)
+                attempt += 1
+
+    async def aprewarm(self) -> Optional[float]:
+        """预先建立到模型服务的连接（TCP和TLS握手），之后的第一次请求可以直接复用；返回耗时，失败时返回None"""
+        client = self._async_http_client
+        if client is None:
+            return None
+        start = time.perf_counter()
+        try:
+            # 任何HTTP响应（包括404）都说明连接已建立并进入连接池
+            await client.get(f"{self.api_base.rstrip('/')}/models",
+                             headers={'Authorization': f"Bearer {self.api_key}"})
+        except (httpx.HTTPError, OSError):
+            return None
+        seconds = time.perf_counter() - start
+        self._transport_stats['prewarm_seconds'] = round(seconds, 4)
+        return seconds
+
+    def format_transport_stats(self) -> str:
+        stats = self._transport_stats
+        prewarm = f", 预热连接 {stats['prewarm_seconds'] * 1000:.0f}ms" if stats.get('prewarm_seconds') is not None else ''
+        return (f"模型连接: 请求 {stats.get('requests', 0)} 次, 重试 {stats.get('retries', 0)} 次, "
+                f"首个数据块超时 {stats.get('first_token_timeouts', 0)} 次, 输出中断 {stats.get('idle_timeouts', 0)} 次, "
+                f"失败 {stats.get('errors', 0)} 次{prewarm}")
+
+# 快速模型可以直接调用的工具（教程和知识库查询），调用其他工具时改由主模型处理
+FAST_ROUTE_TOOLS = ('get_desktop_path', 'read_tutorial', 'search_knowledge_base', 'read_tool_output')
+# 用于申请更多工具的工具；出现在可用工具中不影响路由，但快速模型调用它时改由主模型处理
+ESCALATION_TOOLS = ('request_tool_groups',)
+# 记录需要升级到主模型的问题数量上限
+ESCALATION_CACHE_SIZE = 256
+
+class RouteStats:
+    """一条路由的调用次数、首个数据块时间和总耗时"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.calls = 0
+        self.errors = 0
+        self.first_chunk = Histogram()
+        self.duration = Histogram()
+
+    def snapshot(self) -> dict:
+        return {
+            'model': self.model, 'calls': self.calls, 'errors': self.errors,
+            'first_chunk_p50_seconds': round(self.first_chunk.percentile(50), 4),
+            'first_chunk_p99_seconds': round(self.first_chunk.percentile(99), 4),
+            'duration_p50_seconds': round(self.duration.percentile(50), 4),
+            'duration_p99_seconds': round(self.duration.percentile(99), 4),
+        }
+
+def _last_user_text(chat_history: Optional[Sequence[ChatMessage]], user_msg=None) -> str:
+    if user_msg is not None:
+        return user_msg if isinstance(user_msg, str) else (user_msg.content or '')
+    for message in reversed(chat_history or []):
+        if message.role == MessageRole.USER:
+            return message.content or ''
+    return ''
+
+class RoutingLLM(FunctionCallingLLM):
+    """在快速模型和主模型之间路由请求
+
+    智能体每一步调用模型时，如果问题较短、且工具路由只提供了教程和知识库工具（例如"如何创建文件夹"），
+    使用快速模型；需要文件、系统、鼠标键盘或视觉工具的任务使用主模型。
+    快速模型出错、没有输出或调用了 fast_tools 以外的工具时，这一步改由主模型重新处理，
+    同一问题之后的步骤也都使用主模型。
+
+    参数:
+        strong_llm: 主模型（例如 qwen-max），也用于智能体工具调用以外的所有请求
+        fast_llm: 快速模型（例如 qwen-turbo）
+        fast_tools: 快速模型可以调用的工具名称
+        fast_max_chars: 使用快速模型的问题最大长度
+    """
+
+    strong_llm: LLM = Field(description="主模型")
+    fast_llm: LLM = Field(description="快速模型")
+    fast_tools: List[str] = Field(default_factory=lambda: list(FAST_ROUTE_TOOLS))
+    escalation_tools: List[str] = Field(default_factory=lambda: list(ESCALATION_TOOLS))
+    fast_max_chars: int = 200
+
+    _routes: Dict[str, RouteStats] = PrivateAttr(default_factory=dict)
+    _escalations: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _escalated_questions: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._routes = {
+            'fast': RouteStats(getattr(self.fast_llm, 'model', 'fast')),
+            'strong': RouteStats(getattr(self.strong_llm, 'model', 'strong')),
+        }
+        self._escalations = {'error': 0, 'tools': 0, 'empty': 0, 'late_tools': 0}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "routing_llm"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self.strong_llm.metadata
+
+    def choose_route(self, question: str, tool_names: Sequence[str]) -> str:
+        """返回 'fast' 或 'strong'"""
+        if question in self._escalated_questions:
+            return 'strong'
+        if len(question) > self.fast_max_chars:
+            return 'strong'
+        allowed = set(self.fast_tools) | set(self.escalation_tools)
+        if any(name not in allowed for name in tool_names):
+            return 'strong'
+        return 'fast'
+
+    def _escalate(self, question: str, reason: str) -> None:
+        self._escalations[reason] += 1
+        self._escalated_questions[question] = reason
+        self._escalated_questions.move_to_end(question)
+        while len(self._escalated_questions) > ESCALATION_CACHE_SIZE:
+            self._escalated_questions.popitem(last=False)
+
+    def _disallowed_tools(self, chunk: ChatResponse) -> List[str]:
+        calls = self.fast_llm.get_tool_calls_from_response(chunk, error_on_no_tool_call=False)
+        return [call.tool_name for call in calls if call.tool_name and call.tool_name not in self.fast_tools]
+
+    async def _measured(self, route: str, start: float, buffered: List[ChatResponse], stream: Optional[ChatResponseAsyncGen],
+                        question: str = '') -> ChatResponseAsyncGen:
+        """依次输出已缓冲和剩余的数据块，记录这条路由的首个数据块时间和总耗时"""
+        stats = self._routes[route]
+        first = False
+        last = None
+        try:
+            for chunk in buffered:
+                if not first:
+                    stats.first_chunk.observe(time.perf_counter() - start)
+                    first = True
+                last = chunk
+                yield chunk
+            if stream is not None:
+                async for chunk in stream:
+                    if not first:
+                        stats.first_chunk.observe(time.perf_counter() - start)
+                        first = True
+                    last = chunk
+                    yield chunk
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.duration.observe(time.perf_counter() - start)
+        # 快速模型已经输出了文字，之后才调用主模型的工具：这一步无法撤回，之后的步骤使用主模型
+        if route == 'fast' and last is not None and self._disallowed_tools(last):
+            self._escalate(question, 'late_tools')
+
+    async def _strong_stream(self, tools, **kwargs: Any) -> ChatResponseAsyncGen:
+        stats = self._routes['strong']
+        stats.calls += 1
+        start = time.perf_counter()
+        try:
+            stream = await self.strong_llm.astream_chat_with_tools(tools, **kwargs)
+        except Exception:
+            stats.errors += 1
+            stats.duration.observe(time.perf_counter() - start)
+            raise
+        return self._measured('strong', start, [], stream)
+
+    async def astream_chat_with_tools(self, tools, user_msg: Optional[Union[str, ChatMessage]] = None,
+                                      chat_history: Optional[List[ChatMessage]] = None, verbose: bool = False,
+                                      allow_parallel_tool_calls: bool = False, **kwargs: Any) -> ChatResponseAsyncGen:
+        kwargs.update(user_msg=user_msg, chat_history=chat_history, verbose=verbose,
+                      allow_parallel_tool_calls=allow_parallel_tool_calls)
+        question = _last_user_text(chat_history, user_msg)
+        if self.choose_route(question, [tool.metadata.name for tool in tools]) == 'strong':
+            return await self._strong_stream(tools, **kwargs)
+
+        stats = self._routes['fast']
+        stats.calls += 1
+        start = time.perf_counter()
+        buffered = []
+        escalation = None
+        try:
+            stream = await self.fast_llm.astream_chat_with_tools(tools, **kwargs)
+            # 在输出文字之前先缓冲，确认快速模型没有调用它处理不了的工具
+            async for chunk in stream:
+                buffered.append(chunk)
+                if self._disallowed_tools(chunk):
+                    escalation = 'tools'
+                    await stream.aclose()
+                    break
+                if chunk.delta:
+                    return self._measured('fast', start, buffered, stream, question)
+        except Exception:
+            stats.errors += 1
+            escalation = 'error'
+        if escalation is None:
+            last = buffered[-1] if buffered else None
+            if last is not None and (last.message.content or
+                                     self.fast_llm.get_tool_calls_from_response(last, error_on_no_tool_call=False)):
+                return self._measured('fast', start, buffered, None, question)
+            escalation = 'empty'
+        stats.duration.observe(time.perf_counter() - start)
+        self._escalate(question, escalation)
+        return await self._strong_stream(tools, **kwargs)
+
+    def get_tool_calls_from_response(self, response: ChatResponse, error_on_no_tool_call: bool = True,
+                                     **kwargs: Any) -> List[ToolSelection]:
+        # 两个模型都使用OpenAI兼容的响应格式
+        return self.strong_llm.get_tool_calls_from_response(response, error_on_no_tool_call=error_on_no_tool_call, **kwargs)
+
+    def _prepare_chat_with_tools(self, tools, user_msg=None, chat_history=None, verbose: bool = False,
+                                 allow_parallel_tool_calls: bool = False, **kwargs: Any) -> Dict[str, Any]:
+        return self.strong_llm._prepare_chat_with_tools(tools, user_msg=user_msg, chat_history=chat_history, verbose=verbose,
+                                                        allow_parallel_tool_calls=allow_parallel_tool_calls, **kwargs)
+
+    # 智能体工具调用以外的请求都交给主模型
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self.strong_llm.chat(messages, **kwargs)
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        return self.strong_llm.stream_chat(messages, **kwargs)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return self.strong_llm.complete(prompt, formatted=formatted, **kwargs)
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        return self.strong_llm.stream_complete(prompt, formatted=formatted, **kwargs)
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return await self.strong_llm.achat(messages, **kwargs)
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        return await self.strong_llm.astream_chat(messages, **kwargs)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await self.strong_llm.acomplete(prompt, formatted=formatted, **kwargs)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        return await self.strong_llm.astream_complete(prompt, formatted=formatted, **kwargs)
+
+    async def aprewarm(self) -> Optional[float]:
+        """同时预热两个模型的连接，返回较慢的一个的耗时"""
+        results = await asyncio.gather(self.strong_llm.aprewarm(), self.fast_llm.aprewarm())
+        results = [seconds for seconds in results if seconds is not None]
+        return max(results) if results else None
+
+    @property
+    def transport_stats(self) -> dict:
+        return {'strong': self.strong_llm.transport_stats, 'fast': self.fast_llm.transport_stats}
+
+    def format_transport_stats(self) -> str:
+        return "\n".join(f"[{route}] {llm.format_transport_stats()}"
+                         for route, llm in (('strong', self.strong_llm), ('fast', self.fast_llm)))
+
+    @property
+    def route_stats(self) -> dict:
+        return {'routes': {route: stats.snapshot() for route, stats in self._routes.items()},
+                'escalations': dict(self._escalations)}
+
+    def format_route_stats(self) -> str:
+        lines = []
+        for route, stats in self._routes.items():
+            lines.append(f"  {route} ({stats.model}): {stats.calls} 次, 出错 {stats.errors} 次, "
+                         f"首个数据块 p50 {stats.first_chunk.percentile(50) * 1000:.0f}ms / p99 {stats.first_chunk.percentile(99) * 1000:.0f}ms, "
+                         f"耗时 p50 {stats.duration.percentile(50) * 1000:.0f}ms / p99 {stats.duration.percentile(99) * 1000:.0f}ms")
+        escalations = self._escalations
+        lines.append(f"  升级到主模型 {sum(escalations.values())} 次 (调用其他工具 {escalations['tools'] + escalations['late_tools']}, "
+                     f"出错 {escalations['error']}, 无输出 {escalations['empty']})")
+        return "模型路由:\n" + "\n".join(lines)
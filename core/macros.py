@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import shutil
+import inspect
+import functools
+import threading
+from typing import Callable, Dict, List, Optional
+from core.answer_cache import normalize_question
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MACRO_DIR = os.path.join(PROJECT_DIR, '.cache', 'macros')
+
+# 会改变屏幕状态、需要录制的工具；查看类工具（截图、查找图像等）不录制
+RECORDABLE_TOOLS = {
+    'move_mouse', 'move_mouse_relative', 'click_mouse', 'right_click_mouse', 'double_click_mouse', 'drag_mouse',
+    'press_key', 'type_text', 'hotkey', 'scroll_mouse', 'safe_click_sequence', 'safe_type_and_click',
+    'click_on_image', 'wait_and_click_image', 'wait_for_image',
+}
+# 按坐标操作的工具：{工具: [(x参数, y参数), ...]}，第一组坐标周围的屏幕内容作为前置条件
+COORDINATE_PARAMS = {
+    'move_mouse': [('x', 'y')],
+    'click_mouse': [('x', 'y')],
+    'right_click_mouse': [('x', 'y')],
+    'double_click_mouse': [('x', 'y')],
+    'drag_mouse': [('start_x', 'start_y'), ('end_x', 'end_y')],
+    'safe_type_and_click': [('click_x', 'click_y')],
+}
+# 不提供坐标时在当前鼠标位置操作的工具
+POINTER_TOOLS = {'click_mouse', 'right_click_mouse', 'double_click_mouse'}
+# 按图像操作的工具，图像本身就是前置条件
+IMAGE_TOOLS = {'click_on_image', 'wait_and_click_image', 'wait_for_image'}
+# 工具输出中表示失败的词，失败的调用不录制，重放时遇到则停止
+FAILURE_MARKERS = ('出错', '未找到', '不存在', '无法', '超出', '超时')
+
+def is_failure(output) -> bool:
+    text = str(output)[:200]
+    return any(marker in text for marker in FAILURE_MARKERS)
+
+def _locate(image_path: str, region=None, confidence: float = 0.9):
+    """在屏幕（或指定区域）中查找模板图像，返回 (left, top, width, height) 或 None"""
+    import pyautogui
+    try:
+        try:
+            box = pyautogui.locateOnScreen(image_path, confidence=confidence, region=region)
+        except TypeError:
+            # 没有安装opencv时不支持confidence参数，使用精确匹配
+            box = pyautogui.locateOnScreen(image_path, region=region)
+    except Exception:
+        # 新版本 pyautogui 找不到图像时抛出 ImageNotFoundException
+        return None
+    return tuple(box) if box else None
+
+class MacroRecorder:
+    """录制GUI工具调用序列及每一步执行前的屏幕前置条件
+
+    开始录制后，每次成功的GUI工具调用都会记录工具名称和参数；按坐标操作的工具在执行前截取目标位置周围的一小块屏幕作为模板，
+    按图像操作的工具复制所用的图像作为模板。每轮对话的问题只有在该轮录制到操作时才作为触发问题保存，
+    并记录该轮录制的步骤范围，重放时只执行这些步骤；只询问信息的问题（例如“我的桌面在哪”）不会成为触发问题。
+
+    参数:
+        store: 保存宏的 MacroStore
+        template_size: 坐标模板的边长（像素）
+    """
+
+    def __init__(self, store: 'MacroStore', template_size: int = 48):
+        self.store = store
+        self.template_size = template_size
+        self.lock = threading.Lock()
+        self.name = None
+        self.prompts = []
+        self.steps = []
+        self.workdir = None
+        self.current_prompt = None
+        self.turn_start = 0
+
+    @property
+    def recording(self) -> bool:
+        return self.name is not None
+
+    def start(self, name: str) -> str:
+        with self.lock:
+            self.name = name
+            self.prompts = []
+            self.steps = []
+            self.workdir = self.store.prepare_dir(name)
+            self.current_prompt = None
+        return f"开始录制宏 '{name}'，接下来的问题中成功执行的鼠标键盘和视觉操作都会被记录，输入 /macro stop 保存"
+
+    def note_prompt(self, prompt: str) -> None:
+        """每轮对话开始时调用，记录本轮的问题和步骤的起点"""
+        with self.lock:
+            if self.recording:
+                self.current_prompt = prompt
+                self.turn_start = len(self.steps)
+
+    def finish_prompt(self) -> None:
+        """每轮对话结束时调用：本轮录制到操作时，把问题和本轮的步骤范围保存为触发问题（相同的问题保留最近一次）"""
+        with self.lock:
+            prompt, self.current_prompt = self.current_prompt, None
+            if not self.recording or prompt is None or len(self.steps) <= self.turn_start:
+                return
+            key = normalize_question(prompt)
+            self.prompts = [p for p in self.prompts if normalize_question(p['prompt']) != key]
+            self.prompts.append({'prompt': prompt, 'start': self.turn_start, 'end': len(self.steps)})
+
+    def stop(self) -> str:
+        self.finish_prompt()
+        with self.lock:
+            name, prompts, steps = self.name, self.prompts, self.steps
+            self.name = None
+        if name is None:
+            return "当前没有在录制宏"
+        if not steps:
+            self.store.delete(name)
+            return f"宏 '{name}' 没有录制到任何操作，已放弃"
+        self.store.save({'name': name, 'prompts': prompts, 'steps': steps, 'created': time.time(),
+                         'replays': 0, 'failures': 0})
+        return f"宏 '{name}' 已保存，共 {len(steps)} 步；输入 /macro run {name} 直接重放，再次提出录制时的问题时会询问是否重放"
+
+    def _capture_template(self, x: int, y: int, index: int) -> Optional[dict]:
+        import pyautogui
+        width, height = pyautogui.size()
+        half = self.template_size // 2
+        left = max(0, min(int(x) - half, width - self.template_size))
+        top = max(0, min(int(y) - half, height - self.template_size))
+        box = (left, top, min(self.template_size, width), min(self.template_size, height))
+        file_name = f"step_{index}.png"
+        pyautogui.screenshot(region=box).save(os.path.join(self.workdir, file_name))
+        return {'template': file_name, 'box': list(box)}
+
+    def _precondition(self, tool: str, arguments: dict, index: int) -> Optional[dict]:
+        """在工具执行前记录前置条件；无法记录时返回None（重放时不检查）"""
+        try:
+            if tool in IMAGE_TOOLS and os.path.isfile(arguments.get('image_path', '')):
+                file_name = f"step_{index}{os.path.splitext(arguments['image_path'])[1] or '.png'}"
+                shutil.copyfile(arguments['image_path'], os.path.join(self.workdir, file_name))
+                return {'image': file_name}
+            if tool in COORDINATE_PARAMS:
+                x_name, y_name = COORDINATE_PARAMS[tool][0]
+                if arguments.get(x_name) is not None and arguments.get(y_name) is not None:
+                    return self._capture_template(arguments[x_name], arguments[y_name], index)
+            if tool in POINTER_TOOLS:
+                import pyautogui
+                x, y = pyautogui.position()
+                return self._capture_template(x, y, index)
+        except Exception:
+            pass
+        return None
+
+    def wrap(self, func: Callable) -> Callable:
+        """包装GUI工具，录制期间记录成功的调用；应在GUI锁之内调用，使截取的模板与执行时的屏幕一致"""
+        name = getattr(func, '__name__', 'tool')
+        if name not in RECORDABLE_TOOLS:
+            return func
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.recording:
+                return func(*args, **kwargs)
+            try:
+                arguments = dict(signature.bind_partial(*args, **kwargs).arguments)
+            except TypeError:
+                arguments = dict(kwargs)
+            index = len(self.steps) + 1
+            precondition = self._precondition(name, arguments, index)
+            output = func(*args, **kwargs)
+            if self.recording and not is_failure(output):
+                with self.lock:
+                    self.steps.append({'tool': name, 'args': list(args), 'kwargs': kwargs,
+                                       'precondition': precondition})
+            return output
+        return wrapper
+
+class MacroPlayer:
+    """不经过大模型直接重放宏：每一步执行前等待前置条件满足（模板出现在屏幕上），不满足时停止
+
+    参数:
+        store: 宏所在的 MacroStore
+        resolve_tool: 按名称返回工具函数
+        precondition_timeout: 等待前置条件满足的最长时间（秒），用于等待上一步打开的窗口或菜单出现
+        search_margin: 坐标模板的搜索范围（像素），窗口位置有小幅变化时按模板的新位置调整坐标
+    """
+
+    def __init__(self, store: 'MacroStore', resolve_tool: Callable[[str], Callable], precondition_timeout: float = 5.0,
+                 search_margin: int = 120, poll_interval: float = 0.2):
+        self.store = store
+        self.resolve_tool = resolve_tool
+        self.precondition_timeout = precondition_timeout
+        self.search_margin = search_margin
+        self.poll_interval = poll_interval
+
+    def _check(self, macro: dict, precondition: Optional[dict]):
+        """等待前置条件满足，返回坐标偏移 (dx, dy)，超时返回None"""
+        if not precondition:
+            return (0, 0)
+        directory = self.store.macro_dir(macro['name'])
+        deadline = time.perf_counter() + self.precondition_timeout
+        while True:
+            if 'image' in precondition:
+                if _locate(os.path.join(directory, precondition['image'])):
+                    return (0, 0)
+            else:
+                left, top, width, height = precondition['box']
+                region = (max(0, left - self.search_margin), max(0, top - self.search_margin),
+                          width + 2 * self.search_margin, height + 2 * self.search_margin)
+                box = _locate(os.path.join(directory, precondition['template']), region=region)
+                if box:
+                    return (box[0] - left, box[1] - top)
+            if time.perf_counter() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def _shift(step: dict, offset) -> dict:
+        kwargs = dict(step['kwargs'])
+        for x_name, y_name in COORDINATE_PARAMS.get(step['tool'], []):
+            if kwargs.get(x_name) is not None and kwargs.get(y_name) is not None:
+                kwargs[x_name] += offset[0]
+                kwargs[y_name] += offset[1]
+        return kwargs
+
+    def replay(self, macro: dict) -> dict:
+        """重放宏，返回 {'ok', 'completed', 'total', 'reason', 'outputs', 'seconds'}"""
+        start = time.perf_counter()
+        outputs = []
+        reason = None
+        for index, step in enumerate(macro['steps']):
+            offset = self._check(macro, step.get('precondition'))
+            if offset is None:
+                reason = f"第 {index + 1} 步（{step['tool']}）执行前屏幕与录制时不一致"
+                break
+            try:
+                output = self.resolve_tool(step['tool'])(*step.get('args', []), **self._shift(step, offset))
+            except Exception as e:
+                output = f"执行 {step['tool']} 时出错: {str(e)}"
+            outputs.append(f"{index + 1}. {output}")
+            if is_failure(output):
+                reason = f"第 {index + 1} 步（{step['tool']}）执行失败: {output}"
+                break
+        completed = len(outputs) - (1 if reason and outputs and is_failure(outputs[-1]) else 0)
+        result = {'ok': reason is None, 'completed': completed, 'total': len(macro['steps']), 'reason': reason,
+                  'outputs': outputs, 'seconds': round(time.perf_counter() - start, 3)}
+        self.store.record_replay(macro['name'], result['ok'])
+        return result
+
+class MacroStore:
+    """宏保存在 .cache/macros/<名称>/ 目录中：macro.json 和各步骤的模板图像
+
+    参数:
+        directory: 宏目录
+    """
+
+    def __init__(self, directory: str = MACRO_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self._macros = None
+
+    def macro_dir(self, name: str) -> str:
+        # 名称中的路径分隔符替换掉，避免写到宏目录以外
+        safe_name = ''.join('_' if ch in '/\\:*?"<>|' else ch for ch in name).strip('. ') or 'macro'
+        return os.path.join(self.directory, safe_name)
+
+    def prepare_dir(self, name: str) -> str:
+        directory = self.macro_dir(name)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _load_all(self) -> Dict[str, dict]:
+        if self._macros is None:
+            self._macros = {}
+            if os.path.isdir(self.directory):
+                for entry in os.listdir(self.directory):
+                    path = os.path.join(self.directory, entry, 'macro.json')
+                    try:
+                        with open(path, 'r', encoding='utf-8') as f:
+                            macro = json.load(f)
+                        self._macros[macro['name']] = macro
+                    except (OSError, ValueError, KeyError):
+                        continue
+        return self._macros
+
+    def _write(self, macro: dict) -> None:
+        directory = self.macro_dir(macro['name'])
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'macro.json'), 'w', encoding='utf-8') as f:
+            json.dump(macro, f, ensure_ascii=False, indent=2)
+
+    def save(self, macro: dict) -> None:
+        with self.lock:
+            self._load_all()[macro['name']] = macro
+            self._write(macro)
+
+    def get(self, name: str) -> Optional[dict]:
+        with self.lock:
+            return self._load_all().get(name)
+
+    def delete(self, name: str) -> bool:
+        with self.lock:
+            existed = self._load_all().pop(name, None) is not None
+        shutil.rmtree(self.macro_dir(name), ignore_errors=True)
+        return existed
+
+    def match(self, prompt: str) -> Optional[dict]:
+        """查找录制时提出过相同问题（规范化后相同）的宏，返回只包含该问题那一轮步骤的宏副本
+
+        旧版本保存的触发问题（只有问题文本，没有步骤范围）不参与匹配，仍可用 /macro run 重放。
+        """
+        key = normalize_question(prompt)
+        if not key:
+            return None
+        with self.lock:
+            for macro in self._load_all().values():
+                for trigger in macro.get('prompts', []):
+                    if isinstance(trigger, dict) and normalize_question(trigger['prompt']) == key:
+                        return dict(macro, steps=macro['steps'][trigger['start']:trigger['end']])
+        return None
+
+    def record_replay(self, name: str, ok: bool) -> None:
+        with self.lock:
+            macro = self._load_all().get(name)
+            if macro is None:
+                return
+            macro['replays'] = macro.get('replays', 0) + 1
+            macro['failures'] = macro.get('failures', 0) + (0 if ok else 1)
+            self._write(macro)
+
+    def list(self) -> List[dict]:
+        with self.lock:
+            return list(self._load_all().values())
+
+    def format_list(self) -> str:
+        macros = self.list()
+        if not macros:
+            return "还没有录制宏，输入 /macro record <名称> 开始录制"
+        lines = [f"  {m['name']}: {len(m['steps'])} 步, 重放 {m.get('replays', 0)} 次 (失败 {m.get('failures', 0)} 次), "
+                 f"触发问题: {'; '.join(_format_trigger(p) for p in m.get('prompts', [])) or '无'}" for m in macros]
+        return "已录制的宏:\n" + "\n".join(lines)
+
+def _format_trigger(trigger) -> str:
+    if isinstance(trigger, dict):
+        return f"{trigger['prompt']}（第 {trigger['start'] + 1}-{trigger['end']} 步）"
+    return trigger
+
+def format_replay_report(name: str, result: dict) -> str:
+    """重放结果的说明文字"""
+    if result['ok']:
+        header = f"已按录制的操作宏 '{name}' 完成 {result['total']} 步操作（耗时 {result['seconds']:.1f}s，未调用大模型）："
+    else:
+        header = (f"操作宏 '{name}' 执行了 {result['completed']}/{result['total']} 步后停止：{result['reason']}")
+    return "\n".join([header] + result['outputs'])
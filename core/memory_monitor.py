@@ -0,0 +1,222 @@
+import gc
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import deque
+from typing import Callable, Dict, Optional
+from llama_index.core.workflow import Context
+
+def current_rss_bytes() -> Optional[int]:
+    """当前进程的常驻内存（字节），无法获取时返回None"""
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+        except Exception:
+            pass
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def release_event_log(ctx: Context) -> int:
+    """清空工作流上下文的事件日志，返回清除的事件数
+
+    llama_index 的 Context 把每次运行的所有事件（包括完整的模型输入和工具输出）追加到事件日志中，
+    只在序列化上下文时使用；同一个上下文跨多轮对话复用时日志会无限增长。运行中的上下文不做处理。
+    """
+    if getattr(ctx, 'is_running', False):
+        return 0
+    log = getattr(ctx, '_broker_log', None)
+    if not log:
+        return 0
+    count = len(log)
+    log.clear()
+    accepted = getattr(ctx, '_accepted_events', None)
+    if accepted is not None:
+        accepted.clear()
+    return count
+
+async def context_footprint(ctx: Context) -> dict:
+    """上下文中的对话消息数、消息大小（UTF-8字节）和事件日志长度"""
+    memory = await ctx.get('memory', default=None)
+    messages = await memory.aget_all() if memory is not None else []
+    message_bytes = sum(len((message.content or '').encode('utf-8')) + len(str(message.additional_kwargs))
+                        for message in messages)
+    return {'messages': len(messages), 'message_bytes': message_bytes,
+            'event_log': len(getattr(ctx, '_broker_log', ()))}
+
+class MemoryMonitor:
+    """长时间运行的会话的内存统计和上限控制
+
+    每轮对话结束后记录进程常驻内存、上下文大小（消息数和字节数）和各个缓存占用的内存，
+    并清空工作流上下文的事件日志；缓存超过各自的上限、或进程内存超过 max_rss_bytes 时淘汰缓存。
+    开启 trace_allocations 后同时用 tracemalloc 记录分配内存最多的代码位置（会明显拖慢运行，只用于排查）。
+
+    参数:
+        max_rss_bytes: 进程常驻内存上限（字节），超过时清空所有已注册的缓存；为None时不限制
+        trace_allocations: 是否用 tracemalloc 记录内存分配
+        top_allocators: 每轮记录分配内存最多的代码位置数量
+        history: 保留最近多少轮的记录
+    """
+
+    def __init__(self, max_rss_bytes: Optional[int] = None, trace_allocations: bool = False,
+                 top_allocators: int = 5, history: int = 200):
+        self.max_rss_bytes = max_rss_bytes
+        self.trace_allocations = trace_allocations
+        self.top_allocators = top_allocators
+        self.lock = threading.Lock()
+        self.caches = {}
+        self.samples = deque(maxlen=history)
+        self.stats = {'turns': 0, 'event_log_released': 0, 'evictions': 0, 'evicted_bytes': 0, 'rss_over_cap': 0}
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @classmethod
+    def from_env(cls) -> 'MemoryMonitor':
+        """从环境变量读取设置：MEMORY_MAX_RSS_MB（进程内存上限，MB）、MEMORY_TRACE=1 记录内存分配"""
+        max_rss = os.environ.get('MEMORY_MAX_RSS_MB')
+        return cls(max_rss_bytes=int(float(max_rss) * 1024 * 1024) if max_rss else None,
+                   trace_allocations=os.environ.get('MEMORY_TRACE', '0') == '1')
+
+    def register_cache(self, name: str, size: Callable[[], int], evict: Callable[[int], int],
+                       max_bytes: Optional[int] = None) -> None:
+        """注册一个需要统计和限制的缓存
+
+        参数:
+            name: 缓存名称
+            size: 返回缓存当前占用的内存（字节）
+            evict: 接收目标大小（字节），淘汰缓存直到不超过该大小，返回释放的字节数
+            max_bytes: 缓存的上限（字节），为None时只在进程内存超过上限时淘汰
+        """
+        with self.lock:
+            self.caches[name] = {'size': size, 'evict': evict, 'max_bytes': max_bytes}
+
+    def cache_sizes(self) -> Dict[str, int]:
+        with self.lock:
+            caches = dict(self.caches)
+        sizes = {}
+        for name, cache in caches.items():
+            try:
+                sizes[name] = cache['size']()
+            except Exception:
+                sizes[name] = 0
+        return sizes
+
+    def _evict(self, name: str, target: int) -> int:
+        try:
+            freed = self.caches[name]['evict'](target)
+        except Exception:
+            return 0
+        self.stats['evictions'] += 1
+        self.stats['evicted_bytes'] += freed
+        return freed
+
+    def enforce_caps(self, rss: Optional[int] = None) -> Dict[str, int]:
+        """按上限淘汰缓存，返回 {缓存名称: 释放的字节数}"""
+        freed = {}
+        sizes = self.cache_sizes()
+        for name, size in sizes.items():
+            max_bytes = self.caches[name]['max_bytes']
+            if max_bytes is not None and size > max_bytes:
+                freed[name] = self._evict(name, max_bytes)
+        if self.max_rss_bytes is not None and rss is not None and rss > self.max_rss_bytes:
+            # 进程内存超过上限：清空所有缓存（缓存的内容都可以重新获取或从磁盘读取）
+            self.stats['rss_over_cap'] += 1
+            for name, size in sizes.items():
+                if size > 0:
+                    freed[name] = freed.get(name, 0) + self._evict(name, 0)
+            gc.collect()
+        return freed
+
+    def top_allocations(self) -> list:
+        """分配内存最多的代码位置，未开启 tracemalloc 时返回空列表"""
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        allocations = []
+        for stat in snapshot.statistics('lineno')[:self.top_allocators]:
+            frame = stat.traceback[0]
+            filename = frame.filename
+            for marker in ('site-packages' + os.sep, os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep):
+                if marker in filename:
+                    filename = filename.split(marker, 1)[1]
+                    break
+            allocations.append({'where': f"{filename}:{frame.lineno}", 'bytes': stat.size, 'count': stat.count})
+        return allocations
+
+    async def after_turn(self, ctx: Optional[Context] = None) -> dict:
+        """每轮对话结束后调用：清空事件日志，记录内存和上下文大小，超过上限时淘汰缓存；返回本轮的记录"""
+        released = release_event_log(ctx) if ctx is not None else 0
+        rss = current_rss_bytes()
+        freed = self.enforce_caps(rss)
+        sample = {
+            'time': time.time(),
+            'rss_bytes': rss if not freed or rss is None else current_rss_bytes(),
+            'context': await context_footprint(ctx) if ctx is not None else None,
+            'caches': self.cache_sizes(),
+            'evicted': freed,
+        }
+        if self.trace_allocations:
+            sample['traced_bytes'] = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+            sample['top_allocations'] = self.top_allocations()
+        with self.lock:
+            self.stats['turns'] += 1
+            self.stats['event_log_released'] += released
+            self.samples.append(sample)
+        return sample
+
+    def growth_per_turn(self, key: str = 'rss_bytes') -> Optional[float]:
+        """用最近一半记录估计每轮的内存增长（字节），排除启动和缓存预热的影响"""
+        values = [sample.get(key) for sample in self.samples]
+        tail = [value for value in values[len(values) // 2:] if value is not None]
+        if len(tail) < 2:
+            return None
+        return (tail[-1] - tail[0]) / (len(tail) - 1)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            last = self.samples[-1] if self.samples else None
+            stats = dict(self.stats)
+        growth = self.growth_per_turn()
+        return dict(stats, last=last, rss_growth_bytes_per_turn=round(growth, 1) if growth is not None else None,
+                    max_rss_bytes=self.max_rss_bytes)
+
+    def format_stats(self) -> str:
+        snapshot = self.snapshot()
+        last = snapshot['last']
+        if last is None:
+            return "内存: 尚无记录"
+        rss = f"{last['rss_bytes'] / 1024 / 1024:.1f}MB" if last['rss_bytes'] is not None else "未知"
+        lines = [f"内存: 常驻 {rss}" + (f" (上限 {self.max_rss_bytes / 1024 / 1024:.0f}MB)" if self.max_rss_bytes else "")
+                 + (f", 每轮增长约 {snapshot['rss_growth_bytes_per_turn'] / 1024:.1f}KB"
+                    if snapshot['rss_growth_bytes_per_turn'] is not None else "")]
+        if last['context'] is not None:
+            lines.append(f"  上下文: {last['context']['messages']} 条消息, {last['context']['message_bytes'] / 1024:.1f}KB; "
+                         f"已清理事件日志 {snapshot['event_log_released']} 条")
+        if last['caches']:
+            lines.append("  缓存: " + ", ".join(f"{name} {size / 1024:.1f}KB" for name, size in last['caches'].items())
+                         + f"; 淘汰 {snapshot['evictions']} 次, 释放 {snapshot['evicted_bytes'] / 1024:.1f}KB")
+        for allocation in last.get('top_allocations') or []:
+            lines.append(f"  {allocation['where']}: {allocation['bytes'] / 1024:.1f}KB ({allocation['count']} 个对象)")
+        return "\n".join(lines)
@@ -0,0 +1,124 @@
+import inspect
+import functools
+import threading
+from typing import Callable, Dict, Optional
+from tools.text_search import estimate_tokens
+from tools.result_format import OUTPUT_STORE, OutputStore, TableText
+
+# 每个工具返回给模型的最大字符数；教程和知识库的内容本身就是回答的依据，预算更大
+DEFAULT_OUTPUT_BUDGETS = {
+    'read_tutorial': 4000,
+    'search_knowledge_base': 4000,
+    'read_text_file': 3000,
+    'list_directory': 1500,
+    'find_file': 1500,
+    'get_running_processes': 1200,
+    'find_duplicates': 1500,
+    'analyze_disk_usage': 1500,
+    'batch_file_ops': 1500,
+    'locate_all_on_screen': 800,
+}
+# 不限制输出的工具：分段读取截断输出的工具自己控制长度
+UNLIMITED_TOOLS = {'read_tool_output', 'request_tool_groups'}
+
+class OutputGovernor:
+    """限制工具输出的长度：超出预算的输出按行截断，全文保存在 OutputStore 中，模型可以按句柄读取剩余部分
+
+    同时按工具统计原始输出和实际返回给模型的字符数、token数，用于衡量截断节省的token；用 format_table 输出表格的工具
+    还统计同样内容按原来的逐行标注格式输出时的大小（估算），用于衡量表格格式节省的token，其他工具的原格式大小等于原始输出。
+
+    参数:
+        budgets: {工具名称: 最大字符数}
+        default_budget: 没有单独设置的工具的最大字符数
+        store: 保存截断输出全文的 OutputStore
+    """
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None, default_budget: int = 2000,
+                 store: OutputStore = OUTPUT_STORE):
+        self.budgets = dict(DEFAULT_OUTPUT_BUDGETS, **(budgets or {}))
+        self.default_budget = default_budget
+        self.store = store
+        self.lock = threading.Lock()
+        self.tools = {}
+
+    def budget_for(self, name: str) -> Optional[int]:
+        if name in UNLIMITED_TOOLS:
+            return None
+        return self.budgets.get(name, self.default_budget)
+
+    def govern(self, name: str, output):
+        """按预算截断一次工具输出，返回实际交给模型的内容"""
+        if not isinstance(output, str):
+            return output
+        legacy = (output.legacy_chars, output.legacy_tokens) if isinstance(output, TableText) else None
+        output = str(output)
+        budget = self.budget_for(name)
+        result = output
+        if budget is not None and len(output) > budget:
+            handle = self.store.put(name, output)
+            cut = output.rfind('\n', 0, budget)
+            # 在行边界截断，保证表格的每一行完整；第一行过长时直接按字符截断
+            shown = cut if cut > budget // 2 else budget
+            total_lines = output.count('\n') + 1
+            shown_lines = output.count('\n', 0, shown) + 1
+            result = (f"{output[:shown]}\n[输出过长已截断: 显示 {shown}/{len(output)} 字符, {shown_lines}/{total_lines} 行; "
+                      f"查看剩余部分: read_tool_output(handle='{handle}', offset={shown})]")
+        self._record(name, output, result, legacy)
+        return result
+
+    def _record(self, name: str, output: str, result: str, legacy: Optional[tuple] = None) -> None:
+        raw_tokens = estimate_tokens(output)
+        returned_tokens = raw_tokens if result is output else estimate_tokens(result)
+        legacy_chars, legacy_tokens = legacy if legacy is not None else (len(output), raw_tokens)
+        with self.lock:
+            stats = self.tools.setdefault(name, {'calls': 0, 'truncated': 0, 'tables': 0, 'legacy_chars': 0,
+                                                 'raw_chars': 0, 'returned_chars': 0, 'legacy_tokens': 0,
+                                                 'raw_tokens': 0, 'returned_tokens': 0})
+            stats['calls'] += 1
+            stats['truncated'] += result is not output
+            stats['tables'] += legacy is not None
+            stats['legacy_chars'] += legacy_chars
+            stats['raw_chars'] += len(output)
+            stats['returned_chars'] += len(result)
+            stats['legacy_tokens'] += legacy_tokens
+            stats['raw_tokens'] += raw_tokens
+            stats['returned_tokens'] += returned_tokens
+
+    def wrap(self, func: Callable) -> Callable:
+        """包装工具函数，保留函数名、说明和参数签名"""
+        name = getattr(func, '__name__', 'tool')
+        if name in UNLIMITED_TOOLS:
+            return func
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return self.govern(name, await func(*args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.govern(name, func(*args, **kwargs))
+        return wrapper
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            # saved_tokens：截断节省的token；table_saved_tokens：表格格式相对原格式节省的token（估算）
+            tools = {name: dict(stats, saved_tokens=stats['raw_tokens'] - stats['returned_tokens'],
+                                table_saved_tokens=stats['legacy_tokens'] - stats['raw_tokens'])
+                     for name, stats in self.tools.items()}
+        return {'tools': tools, 'stored_outputs': len(self.store.entries), 'stored_chars': self.store.total_chars}
+
+    def format_stats(self) -> str:
+        tools = self.snapshot()['tools']
+        if not tools:
+            return "工具输出: 暂无调用"
+        legacy = sum(stats['legacy_tokens'] for stats in tools.values())
+        raw = sum(stats['raw_tokens'] for stats in tools.values())
+        saved = sum(stats['saved_tokens'] for stats in tools.values())
+        lines = [f"工具输出: 原格式约 {legacy} tokens, 表格格式约 {raw} tokens (节省约 {legacy - raw}), "
+                 f"截断又节省约 {saved} tokens; 共节省 {(legacy - raw + saved) / legacy if legacy else 0:.0%}"]
+        for name, stats in sorted(tools.items(), key=lambda item: -(item[1]['saved_tokens'] + item[1]['table_saved_tokens'])):
+            if stats['truncated'] or stats['tables']:
+                lines.append(f"  {name}: {stats['legacy_tokens']} -> {stats['raw_tokens']} -> {stats['returned_tokens']} tokens "
+                             f"(表格 {stats['tables']}/{stats['calls']} 次, 截断 {stats['truncated']} 次)")
+        return "\n".join(lines)
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import inspect
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+from tools.text_search import tokenize
+from core.tool_router import ACTION_MARKERS, HOW_TO_MARKERS, current_scope
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PREFETCH_HISTORY_FILE = os.path.join(PROJECT_DIR, '.cache', 'metrics', 'prefetch_history.json')
+
+# 可以提前执行的工具：只读取系统状态、没有副作用、不需要参数（只有使用默认参数的调用才使用提前执行的结果）
+PREFETCHABLE_TOOLS = {'get_system_info', 'check_disk_space', 'get_desktop_path', 'get_running_processes',
+                      'show_windows_version'}
+
+# 不读取也不改变系统状态的工具（教程、知识库、工具路由等），调用时不需要丢弃提前执行的结果
+STATELESS_TOOLS = {'read_tutorial', 'search_knowledge_base', 'request_tool_groups', 'read_tool_output'}
+
+# 问题中出现这些关键词时，模型通常会先调用对应的工具
+KEYWORD_RULES = {
+    'get_system_info': ['系统信息', '配置', 'cpu', '处理器', '内存', '卡顿', '很慢', '变慢', '蓝屏', '驱动'],
+    'check_disk_space': ['磁盘', '硬盘', '空间', 'c盘', 'd盘', '存储', '满了'],
+    'get_desktop_path': ['桌面'],
+    'get_running_processes': ['进程', '占用', '卡顿', '很慢', '变慢', '任务管理器'],
+    'show_windows_version': ['windows版本', '系统版本', '版本号', 'win10', 'win11'],
+}
+
+def _is_default_call(func: Callable, args: tuple, kwargs: dict) -> bool:
+    """调用是否只使用了默认参数（与提前执行时的调用相同）"""
+    if not args and not kwargs:
+        return True
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+    except TypeError:
+        return False
+    parameters = inspect.signature(func).parameters
+    return all(value == parameters[name].default for name, value in bound.arguments.items())
+
+class Prefetcher:
+    """在模型生成第一次工具调用之前，提前在后台执行很可能会被调用的只读工具
+
+    收到问题后按关键词规则和调用历史统计预测会被调用的工具，立即在后台线程中执行；模型真正调用该工具时，
+    直接使用（或等待）提前执行的结果，不必等模型输出完工具调用后才开始执行。每个结果只使用一次
+    （之后再调用时正常执行），在 max_age 秒内有效；调用任何其他可能改变系统状态的工具（例如删除文件）时丢弃所有提前执行的结果，
+    每轮对话结束时丢弃本轮没有使用的结果，这些结果都计为浪费。结果按会话（core.tool_router.set_scope 设置的作用域）分开保存，
+    一个会话只使用、丢弃自己的结果。只询问操作方法的问题（“如何……”）通常只需要教程，不按关键词规则预测。
+
+    参数:
+        resolve_tool: 按名称返回原始工具函数
+        tools: 允许提前执行的工具
+        rules: {工具名称: [关键词]}
+        history_path: 调用历史统计的保存路径，为None时不保存
+        max_age: 提前执行的结果的有效时间（秒）
+        min_support: 按历史统计预测时，某个词至少在多少轮问题中出现过
+        min_probability: 按历史统计预测时，包含该词的问题中调用该工具的比例下限
+        max_workers: 同时提前执行的工具数量上限
+        max_history_tokens: 历史统计最多保存的词数，超过时删除出现次数最少的词
+    """
+
+    def __init__(self, resolve_tool: Callable[[str], Callable], tools: Iterable[str] = PREFETCHABLE_TOOLS,
+                 rules: Optional[Dict[str, list]] = None, history_path: Optional[str] = PREFETCH_HISTORY_FILE,
+                 max_age: float = 30.0, min_support: int = 3, min_probability: float = 0.6, max_workers: int = 3,
+                 max_history_tokens: int = 5000):
+        self.resolve_tool = resolve_tool
+        self.tools = set(tools)
+        self.rules = {tool: keywords for tool, keywords in (KEYWORD_RULES if rules is None else rules).items()
+                      if tool in self.tools}
+        self.history_path = history_path
+        self.max_age = max_age
+        self.min_support = min_support
+        self.min_probability = min_probability
+        self.max_history_tokens = max_history_tokens
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self.entries = {}  # (会话作用域, 工具名称) -> {'future', 'started', 'finished', 'reason'}
+        self.history = None
+        self.stats = {'predictions': 0, 'by_rule': 0, 'by_history': 0, 'hits': 0, 'waited_hits': 0, 'misses': 0,
+                      'wasted': 0, 'invalidated': 0, 'saved_seconds': 0.0, 'wasted_seconds': 0.0}
+
+    def _load_history(self) -> dict:
+        if self.history is None:
+            self.history = {'turns': 0, 'tokens': {}}
+            if self.history_path:
+                try:
+                    with open(self.history_path, 'r', encoding='utf-8') as f:
+                        self.history = json.load(f)
+                except (OSError, ValueError):
+                    pass
+        return self.history
+
+    def predict(self, prompt: str, skip: Iterable[str] = ()) -> Dict[str, str]:
+        """预测这个问题会调用的工具，返回 {工具名称: 预测依据（rule 或 history）}
+
+        参数:
+            prompt: 用户问题
+            skip: 不需要预测的工具（例如结果已经作为固定信息保存在上下文中）
+        """
+        text = prompt.lower()
+        skip = set(skip)
+        predictions = {}
+        how_to = any(marker in text for marker in HOW_TO_MARKERS) and not any(marker in text for marker in ACTION_MARKERS)
+        if not how_to:
+            for tool, keywords in self.rules.items():
+                if tool not in skip and any(keyword in text for keyword in keywords):
+                    predictions[tool] = 'rule'
+        with self.lock:
+            token_stats = self._load_history()['tokens']
+            for token in set(tokenize(prompt)):
+                stats = token_stats.get(token)
+                if not stats or stats['turns'] < self.min_support:
+                    continue
+                for tool, count in stats['tools'].items():
+                    if tool in self.tools and tool not in skip and tool not in predictions \
+                            and count / stats['turns'] >= self.min_probability:
+                        predictions[tool] = 'history'
+        return predictions
+
+    def _discard(self, keys: Iterable[tuple]) -> None:
+        """丢弃未使用的结果，计为浪费（调用时需持有锁）"""
+        for key in list(keys):
+            entry = self.entries.pop(key)
+            self.stats['wasted'] += 1
+            if entry['finished'] is not None:
+                self.stats['wasted_seconds'] += entry['finished'] - entry['started']
+
+    def _expire(self, now: float) -> None:
+        """删除过期的结果（调用时需持有锁）"""
+        self._discard(key for key, entry in list(self.entries.items()) if now - entry['started'] > self.max_age)
+
+    def _scope_keys(self, scope) -> list:
+        return [key for key in self.entries if key[0] == scope]
+
+    def invalidate(self) -> int:
+        """丢弃当前会话所有提前执行的结果（例如调用了可能改变系统状态的工具之后），返回丢弃的数量"""
+        with self.lock:
+            keys = self._scope_keys(current_scope())
+            self._discard(keys)
+            self.stats['invalidated'] += len(keys)
+        return len(keys)
+
+    def _run(self, tool: str, entry: dict):
+        try:
+            return self.resolve_tool(tool)()
+        finally:
+            entry['finished'] = time.perf_counter()
+
+    def start(self, prompt: str, skip: Iterable[str] = ()) -> Dict[str, str]:
+        """预测并在后台开始执行工具，返回本次开始执行的 {工具名称: 预测依据}；仍有效的结果不会重复执行。
+        结果属于当前会话，需在 set_scope 之后调用"""
+        predictions = self.predict(prompt, skip)
+        started = {}
+        scope = current_scope()
+        with self.lock:
+            now = time.perf_counter()
+            self._expire(now)
+            for tool, reason in predictions.items():
+                if (scope, tool) in self.entries:
+                    continue
+                entry = {'started': now, 'finished': None, 'reason': reason}
+                entry['future'] = self.executor.submit(self._run, tool, entry)
+                self.entries[(scope, tool)] = entry
+                started[tool] = reason
+                self.stats['predictions'] += 1
+                self.stats['by_rule' if reason == 'rule' else 'by_history'] += 1
+        return started
+
+    def _take(self, tool: str) -> Optional[dict]:
+        with self.lock:
+            self._expire(time.perf_counter())
+            entry = self.entries.pop((current_scope(), tool), None)
+            if entry is None:
+                self.stats['misses'] += 1
+            return entry
+
+    def wrap(self, func: Callable) -> Callable:
+        """包装工具函数：可提前执行的工具有结果时直接使用，否则正常执行；其他工具执行前丢弃当前会话提前执行的结果"""
+        name = getattr(func, '__name__', 'tool')
+        if not self.tools or name in STATELESS_TOOLS:
+            return func
+        if name not in self.tools:
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def invalidating_async_wrapper(*args, **kwargs):
+                    self.invalidate()
+                    return await func(*args, **kwargs)
+                return invalidating_async_wrapper
+
+            @functools.wraps(func)
+            def invalidating_wrapper(*args, **kwargs):
+                self.invalidate()
+                return func(*args, **kwargs)
+            return invalidating_wrapper
+        if inspect.iscoroutinefunction(func):
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            entry = self._take(name) if _is_default_call(func, args, kwargs) else None
+            if entry is None:
+                return func(*args, **kwargs)
+            requested = time.perf_counter()
+            try:
+                result = entry['future'].result()
+            except Exception:
+                # 提前执行失败时重新执行一次，错误由工具自己按约定返回
+                return func(*args, **kwargs)
+            waited = time.perf_counter() - requested
+            with self.lock:
+                self.stats['hits'] += 1
+                self.stats['waited_hits'] += waited > 0.001
+                # 节省的时间：工具本身的耗时减去模型调用时仍需等待的时间
+                self.stats['saved_seconds'] += max(0.0, entry['finished'] - entry['started'] - waited)
+            return result
+        return wrapper
+
+    def finish_turn(self, prompt: str, tools_called: Iterable[str]) -> None:
+        """每轮对话结束后调用：丢弃当前会话本轮没有使用的结果，把本轮调用的工具计入历史统计"""
+        called = set(tools_called) & self.tools
+        with self.lock:
+            self._discard(self._scope_keys(current_scope()))
+            history = self._load_history()
+            history['turns'] += 1
+            for token in set(tokenize(prompt)):
+                stats = history['tokens'].setdefault(token, {'turns': 0, 'tools': {}})
+                stats['turns'] += 1
+                for tool in called:
+                    stats['tools'][tool] = stats['tools'].get(tool, 0) + 1
+            if len(history['tokens']) > self.max_history_tokens:
+                ranked = sorted(history['tokens'].items(), key=lambda item: -item[1]['turns'])
+                history['tokens'] = dict(ranked[:self.max_history_tokens * 4 // 5])
+            data = json.dumps(history, ensure_ascii=False, separators=(',', ':')) if self.history_path else None
+        if data is not None:
+            try:
+                os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+                temp_path = self.history_path + '.tmp'
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(temp_path, self.history_path)
+            except OSError:
+                pass
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats, pending=len(self.entries))
+        # 命中率：被模型使用的预测所占的比例
+        stats['hit_rate'] = round(stats['hits'] / stats['predictions'], 3) if stats['predictions'] else None
+        return stats
+
+    def format_stats(self) -> str:
+        stats = self.snapshot()
+        if not stats['predictions'] and not stats['misses']:
+            return "提前执行: 暂无"
+        hit_rate = f"{stats['hit_rate']:.0%}" if stats['hit_rate'] is not None else "-"
+        return (f"提前执行: 预测 {stats['predictions']} 次 (关键词 {stats['by_rule']}, 历史 {stats['by_history']}), "
+                f"命中 {stats['hits']} 次 ({hit_rate}, 其中需等待 {stats['waited_hits']} 次), 未预测到 {stats['misses']} 次, "
+                f"浪费 {stats['wasted']} 次 ({stats['wasted_seconds']:.2f}s, 其中因调用操作类工具丢弃 {stats['invalidated']} 次), "
+                f"节省约 {stats['saved_seconds']:.2f}s")
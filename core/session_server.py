@@ -0,0 +1,335 @@
+import json
+import time
+import uuid
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+from core.instrumentation import Histogram
+
+class SessionError(Exception):
+    """会话请求无法处理，status 为对应的HTTP状态码"""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+class Session:
+    """一个用户会话：独立的对话上下文，同一会话的多轮对话按顺序执行"""
+
+    def __init__(self, session_id: str, ctx):
+        self.id = session_id
+        self.ctx = ctx
+        self.created = time.time()
+        self.last_active = time.time()
+        self.lock = asyncio.Lock()
+        # 正在执行和排队等待的请求数
+        self.pending = 0
+        self.turns = 0
+
+class SessionManager:
+    """管理多个并发会话；所有会话共用同一个智能体和LLM连接池，每个会话有自己的上下文
+
+    参数:
+        create_context: 创建新会话上下文的函数
+        run_turn: 执行一轮对话的协程函数，参数为 (问题, ctx=上下文, on_delta=输出回调)，出错时返回None
+        carry_over: 超时后把旧上下文的对话记忆转移到新上下文的协程函数，参数为 (旧上下文, 新上下文)
+        max_sessions: 最大会话数
+        max_pending_per_session: 每个会话同时提交的请求上限（包括正在执行的一个），超过时拒绝
+        max_concurrent_turns: 所有会话同时执行的对话轮数上限，超过时排队；应不大于LLM连接池大小
+        turn_timeout: 单轮对话的最长时间（秒）
+        idle_expiry: 会话空闲超过该时间（秒）后关闭
+    """
+
+    def __init__(self, create_context: Callable, run_turn: Callable[..., Awaitable[Optional[str]]],
+                 carry_over: Optional[Callable] = None, max_sessions: int = 100, max_pending_per_session: int = 1,
+                 max_concurrent_turns: int = 8, turn_timeout: float = 300.0, idle_expiry: float = 1800.0):
+        self.create_context = create_context
+        self.run_turn_function = run_turn
+        self.carry_over = carry_over
+        self.max_sessions = max_sessions
+        self.max_pending_per_session = max_pending_per_session
+        self.max_concurrent_turns = max_concurrent_turns
+        self.turn_timeout = turn_timeout
+        self.idle_expiry = idle_expiry
+        self.sessions: Dict[str, Session] = {}
+        self.turn_slots = asyncio.Semaphore(max_concurrent_turns)
+        self.running = 0
+        self.turn_latency = Histogram()
+        self.queue_latency = Histogram()
+        self.stats = {'sessions_created': 0, 'sessions_expired': 0, 'turns': 0, 'errors': 0, 'timeouts': 0,
+                      'rejected_busy': 0, 'rejected_full': 0}
+
+    def expire_idle(self) -> int:
+        """关闭空闲超时且没有进行中请求的会话，返回关闭的数量"""
+        deadline = time.time() - self.idle_expiry
+        expired = [s.id for s in self.sessions.values() if s.pending == 0 and s.last_active < deadline]
+        for session_id in expired:
+            del self.sessions[session_id]
+        self.stats['sessions_expired'] += len(expired)
+        return len(expired)
+
+    def create_session(self) -> Session:
+        self.expire_idle()
+        if len(self.sessions) >= self.max_sessions:
+            self.stats['rejected_full'] += 1
+            raise SessionError(f"会话数已达上限 {self.max_sessions}，请稍后再试", 503)
+        session = Session(uuid.uuid4().hex, self.create_context())
+        self.sessions[session.id] = session
+        self.stats['sessions_created'] += 1
+        return session
+
+    def get_session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise SessionError(f"会话不存在或已过期: {session_id}", 404)
+        return session
+
+    def close_session(self, session_id: str) -> None:
+        self.get_session(session_id)
+        del self.sessions[session_id]
+
+    def reserve(self, session: Session) -> None:
+        """为一次请求占用会话的名额；必须在开始输出响应之前同步调用，使超限的请求可以直接返回错误状态码"""
+        if session.pending >= self.max_pending_per_session:
+            self.stats['rejected_busy'] += 1
+            raise SessionError(f"该会话已有 {session.pending} 个请求在处理，请等待回答完成", 429)
+        session.pending += 1
+        session.last_active = time.time()
+
+    async def run_turn(self, session: Session, prompt: str, on_delta: Callable[[str], None]) -> dict:
+        """在会话中执行一轮对话（调用前需先 reserve），返回回答和耗时"""
+        start = time.perf_counter()
+        try:
+            async with session.lock:
+                async with self.turn_slots:
+                    queue_seconds = time.perf_counter() - start
+                    self.queue_latency.observe(queue_seconds)
+                    self.running += 1
+                    try:
+                        answer = await asyncio.wait_for(
+                            self.run_turn_function(prompt, ctx=session.ctx, on_delta=on_delta),
+                            timeout=self.turn_timeout,
+                        )
+                    except asyncio.TimeoutError:
+                        self.stats['timeouts'] += 1
+                        await self._rebuild_context(session)
+                        raise SessionError(f"对话处理超过 {self.turn_timeout:.0f} 秒，已中断", 504)
+                    finally:
+                        self.running -= 1
+            if answer is None:
+                self.stats['errors'] += 1
+                raise SessionError("处理问题时出错，请重试", 500)
+            seconds = time.perf_counter() - start
+            self.turn_latency.observe(seconds)
+            session.turns += 1
+            self.stats['turns'] += 1
+            return {'answer': answer, 'seconds': round(seconds, 4), 'queue_seconds': round(queue_seconds, 4)}
+        finally:
+            session.pending -= 1
+            session.last_active = time.time()
+
+    async def _rebuild_context(self, session: Session) -> None:
+        # 中断的工作流状态无法继续使用，重建上下文但保留对话记忆
+        new_ctx = self.create_context()
+        if self.carry_over is not None:
+            try:
+                await self.carry_over(session.ctx, new_ctx)
+            except Exception:
+                pass
+        session.ctx = new_ctx
+
+    def snapshot(self) -> dict:
+        return {
+            'sessions': len(self.sessions),
+            'running_turns': self.running,
+            'max_concurrent_turns': self.max_concurrent_turns,
+            **self.stats,
+            'turn_p50_seconds': round(self.turn_latency.percentile(50), 4),
+            'turn_p99_seconds': round(self.turn_latency.percentile(99), 4),
+            'queue_p99_seconds': round(self.queue_latency.percentile(99), 4),
+        }
+
+    def format_stats(self) -> str:
+        stats = self.snapshot()
+        return (f"会话: 当前 {stats['sessions']} 个, 进行中 {stats['running_turns']}/{stats['max_concurrent_turns']} 轮, "
+                f"完成 {stats['turns']} 轮 (p50 {stats['turn_p50_seconds']}s, p99 {stats['turn_p99_seconds']}s), "
+                f"出错 {stats['errors']} 轮, 超时 {stats['timeouts']} 轮, "
+                f"拒绝 {stats['rejected_busy'] + stats['rejected_full']} 次")
+
+HTTP_REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 429: 'Too Many Requests', 500: 'Internal Server Error',
+                503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+class SessionServer:
+    """多会话HTTP服务，回答以SSE（text/event-stream）流式返回
+
+    接口:
+        POST   /sessions                      创建会话，返回 {"session_id": ...}
+        POST   /sessions/{id}/messages        提交问题 {"message": ...}，返回事件流：
+                                              delta {"text"}、done {"answer", "seconds", "queue_seconds"}、error {"error", "status"}
+        DELETE /sessions/{id}                 关闭会话
+        GET    /stats                         会话、延迟和连接统计
+        GET    /health                        健康检查
+
+    参数:
+        manager: 会话管理器
+        host: 监听地址
+        port: 监听端口，0表示自动选择空闲端口
+        extra_stats: 返回附加统计信息（字典）的函数，包含在 /stats 中
+        max_body_bytes: 请求体大小上限
+    """
+
+    def __init__(self, manager: SessionManager, host: str = '127.0.0.1', port: int = 8080,
+                 extra_stats: Optional[Callable[[], dict]] = None, max_body_bytes: int = 1 << 20):
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.extra_stats = extra_stats
+        self.max_body_bytes = max_body_bytes
+        self.server = None
+        # 客户端断开后仍在执行的对话，保留引用直到结束
+        self._background = set()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self) -> 'SessionServer':
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        return self
+
+    async def serve_forever(self) -> None:
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _version = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length') or 0)
+        if length > self.max_body_bytes:
+            raise SessionError("请求内容过大", 413)
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), path.split('?', 1)[0].rstrip('/'), headers, body
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except SessionError as e:
+                    await self._send_json(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+                except (ValueError, asyncio.IncompleteReadError):
+                    await self._send_json(writer, 400, {'error': "无法解析的请求"}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._dispatch(writer, method, path, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, writer, method: str, path: str, body: bytes, keep_alive: bool) -> None:
+        parts = [part for part in path.split('/') if part]
+        try:
+            if parts == ['health'] and method == 'GET':
+                await self._send_json(writer, 200, {'status': 'ok'}, keep_alive)
+            elif parts == ['stats'] and method == 'GET':
+                stats = {'sessions': self.manager.snapshot()}
+                if self.extra_stats is not None:
+                    stats.update(self.extra_stats())
+                await self._send_json(writer, 200, stats, keep_alive)
+            elif parts == ['sessions'] and method == 'POST':
+                session = self.manager.create_session()
+                await self._send_json(writer, 201, {'session_id': session.id}, keep_alive)
+            elif len(parts) == 2 and parts[0] == 'sessions' and method == 'DELETE':
+                self.manager.close_session(parts[1])
+                await self._send_json(writer, 200, {'closed': parts[1]}, keep_alive)
+            elif len(parts) == 3 and parts[0] == 'sessions' and parts[2] == 'messages' and method == 'POST':
+                session = self.manager.get_session(parts[1])
+                try:
+                    message = json.loads(body or b'{}').get('message')
+                except (ValueError, AttributeError):
+                    message = None
+                if not isinstance(message, str) or not message.strip():
+                    raise SessionError("请求内容应为 {\"message\": \"问题\"}", 400)
+                self.manager.reserve(session)
+                await self._stream_turn(writer, session, message, keep_alive)
+            elif parts and parts[0] in ('health', 'stats', 'sessions'):
+                raise SessionError(f"不支持的请求方法: {method}", 405)
+            else:
+                raise SessionError(f"未知的路径: {path}", 404)
+        except SessionError as e:
+            await self._send_json(writer, e.status, {'error': str(e)}, keep_alive)
+
+    async def _send_json(self, writer, status: int, payload: dict, keep_alive: bool) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(self._status_head(status, keep_alive, [
+            ('Content-Type', 'application/json; charset=utf-8'), ('Content-Length', str(len(data)))]) + data)
+        await writer.drain()
+
+    @staticmethod
+    def _status_head(status: int, keep_alive: bool, headers: list) -> bytes:
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}"]
+        lines += [f"{name}: {value}" for name, value in headers]
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    @staticmethod
+    def _event(kind: str, payload: dict) -> bytes:
+        data = f"event: {kind}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+        # 分块传输编码，响应结束后连接可以继续使用
+        return f"{len(data):x}\r\n".encode() + data + b"\r\n"
+
+    async def _stream_turn(self, writer, session: Session, message: str, keep_alive: bool) -> None:
+        queue = asyncio.Queue()
+
+        def on_delta(text: str) -> None:
+            if text:
+                queue.put_nowait(('delta', {'text': text}))
+
+        async def produce():
+            try:
+                result = await self.manager.run_turn(session, message, on_delta)
+                queue.put_nowait(('done', result))
+            except SessionError as e:
+                queue.put_nowait(('error', {'error': str(e), 'status': e.status}))
+            except Exception as e:
+                queue.put_nowait(('error', {'error': f"处理问题时出错: {str(e)}", 'status': 500}))
+
+        task = asyncio.ensure_future(produce())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        writer.write(self._status_head(200, keep_alive, [
+            ('Content-Type', 'text/event-stream; charset=utf-8'), ('Cache-Control', 'no-cache'),
+            ('Transfer-Encoding', 'chunked')]))
+        while True:
+            kind, payload = await queue.get()
+            # 客户端断开时停止输出，对话继续执行完成并保存在会话上下文中
+            writer.write(self._event(kind, payload))
+            await writer.drain()
+            if kind != 'delta':
+                break
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
@@ -0,0 +1,186 @@
+import os
+import gzip
+import json
+import time
+import uuid
+import asyncio
+import threading
+from typing import List, Optional
+from llama_index.core.llms import ChatMessage
+from llama_index.core.workflow import Context
+from core.context_manager import ContextManager
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SESSION_DIR = os.path.join(PROJECT_DIR, '.cache', 'sessions')
+# 所有会话共用的固定信息（桌面路径、系统信息等），新会话也可以直接使用
+FACTS_FILE_NAME = 'facts.json'
+
+def new_session_id() -> str:
+    return time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:4]
+
+def _json_default(value):
+    # 工具调用消息的 additional_kwargs 中包含 openai 的 pydantic 对象
+    if hasattr(value, 'model_dump'):
+        return value.model_dump()
+    return str(value)
+
+class SessionStore:
+    """把会话的对话记忆、摘要和固定信息保存到磁盘，下次启动时恢复
+
+    只保存恢复对话需要的内容（压缩后的消息、早期对话摘要和固定信息），不保存工作流的运行状态；
+    每个会话一个 gzip 压缩的JSON文件：.cache/sessions/<会话ID>.json.gz。固定信息另外合并保存到 facts.json，
+    新会话也可以直接使用，过期的信息在恢复时丢弃。
+
+    参数:
+        directory: 保存目录
+        max_age: 会话保存的最长时间（秒），超过后不再恢复并删除
+    """
+
+    def __init__(self, directory: str = SESSION_DIR, max_age: float = 7 * 86400):
+        self.directory = directory
+        self.max_age = max_age
+        self.lock = threading.Lock()
+
+    def path(self, session_id: str) -> str:
+        safe_id = ''.join(ch for ch in session_id if ch.isalnum() or ch in '-_') or 'default'
+        return os.path.join(self.directory, f"{safe_id}.json.gz")
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def load_facts(self) -> dict:
+        """返回 {'pinned_facts': {...}, 'pinned_fact_times': {...}}"""
+        try:
+            with open(os.path.join(self.directory, FACTS_FILE_NAME), 'r', encoding='utf-8') as f:
+                facts = json.load(f)
+            return {'pinned_facts': dict(facts.get('pinned_facts', {})),
+                    'pinned_fact_times': dict(facts.get('pinned_fact_times', {}))}
+        except (OSError, ValueError):
+            return {'pinned_facts': {}, 'pinned_fact_times': {}}
+
+    def _merge_facts(self, pinned: dict, fact_times: dict) -> None:
+        """把本会话的固定信息合并到共用的 facts.json，同一项以较新的为准"""
+        with self.lock:
+            facts = self.load_facts()
+            for label, value in pinned.items():
+                if fact_times.get(label, 0) >= facts['pinned_fact_times'].get(label, 0):
+                    facts['pinned_facts'][label] = value
+                    facts['pinned_fact_times'][label] = fact_times.get(label, 0)
+            self._write_atomic(os.path.join(self.directory, FACTS_FILE_NAME),
+                               json.dumps(facts, ensure_ascii=False).encode('utf-8'))
+
+    def _write_session(self, session_id: str, record: dict) -> int:
+        data = gzip.compress(json.dumps(record, ensure_ascii=False, separators=(',', ':'),
+                                        default=_json_default).encode('utf-8'))
+        self._write_atomic(self.path(session_id), data)
+        self._merge_facts(record['pinned_facts'], record['pinned_fact_times'])
+        return len(data)
+
+    async def save(self, session_id: str, ctx: Context) -> int:
+        """保存会话，返回写入的字节数"""
+        messages = [{'role': m.role.value, 'content': m.content, 'additional_kwargs': m.additional_kwargs}
+                    for m in await ContextManager.conversation_messages(ctx)]
+        record = {
+            'session_id': session_id,
+            'saved_at': time.time(),
+            'messages': messages,
+            'context_summary': list(await ctx.get('context_summary', default=[])),
+            'pinned_facts': dict(await ctx.get('pinned_facts', default={})),
+            'pinned_fact_times': dict(await ctx.get('pinned_fact_times', default={})),
+        }
+        return await asyncio.to_thread(self._write_session, session_id, record)
+
+    def load(self, session_id: str) -> Optional[dict]:
+        """读取保存的会话；不存在、已过期或文件损坏时返回None"""
+        path = self.path(session_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                return json.loads(gzip.decompress(f.read()).decode('utf-8'))
+        except (OSError, ValueError, EOFError):
+            return None
+
+    async def restore(self, ctx: Context, session_id: Optional[str], llm=None,
+                      context_manager: Optional[ContextManager] = None) -> dict:
+        """把保存的会话和共用的固定信息恢复到新的上下文中，返回恢复的消息数和固定信息数
+
+        参数:
+            ctx: 新创建的上下文
+            session_id: 要恢复的会话ID，为None时只恢复共用的固定信息
+            llm: 创建对话记忆使用的模型（用于计算token数）
+            context_manager: 恢复后用于重新生成上下文开头的已知信息和摘要
+        """
+        from llama_index.core.memory import ChatMemoryBuffer
+        facts = await asyncio.to_thread(self.load_facts)
+        record = await asyncio.to_thread(self.load, session_id) if session_id else None
+        pinned, fact_times = facts['pinned_facts'], facts['pinned_fact_times']
+        messages = []
+        if record:
+            record_times = record.get('pinned_fact_times', {})
+            for label, value in record.get('pinned_facts', {}).items():
+                if record_times.get(label, 0) >= fact_times.get(label, 0):
+                    pinned[label] = value
+                    fact_times[label] = record_times.get(label, 0)
+            messages = [ChatMessage(role=m['role'], content=m['content'], additional_kwargs=m.get('additional_kwargs') or {})
+                        for m in record.get('messages', [])]
+            await ctx.set('context_summary', list(record.get('context_summary', [])))
+        fresh = ContextManager.fresh_facts(pinned, fact_times)
+        await ctx.set('pinned_facts', fresh)
+        await ctx.set('pinned_fact_times', {label: fact_times[label] for label in fresh})
+        if messages or fresh:
+            await ctx.set('memory', ChatMemoryBuffer.from_defaults(llm=llm, chat_history=messages))
+            if context_manager is not None:
+                await context_manager.compact(ctx)
+        return {'session_id': session_id, 'resumed': record is not None, 'messages': len(messages),
+                'facts': len(fresh), 'expired_facts': len(pinned) - len(fresh)}
+
+    def list(self) -> List[dict]:
+        """返回未过期的会话，最近保存的在前；顺便删除过期的会话文件"""
+        sessions = []
+        if not os.path.isdir(self.directory):
+            return sessions
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json.gz'):
+                continue
+            session_id = name[:-len('.json.gz')]
+            record = self.load(session_id)
+            if record is None:
+                continue
+            question = next((m['content'] for m in record.get('messages', []) if m['role'] == 'user' and m['content']), '')
+            sessions.append({'session_id': session_id, 'saved_at': record.get('saved_at', 0),
+                             'messages': len(record.get('messages', [])), 'first_question': ' '.join(question.split())[:40]})
+        sessions.sort(key=lambda session: -session['saved_at'])
+        return sessions
+
+    def latest_session_id(self) -> Optional[str]:
+        """最近保存的未过期会话（只看文件修改时间，不读取内容，启动时不必等待）"""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith('.json.gz')]
+        except OSError:
+            return None
+        latest = max(names, key=lambda name: os.path.getmtime(os.path.join(self.directory, name)), default=None)
+        if latest is None or time.time() - os.path.getmtime(os.path.join(self.directory, latest)) > self.max_age:
+            return None
+        return latest[:-len('.json.gz')]
+
+    def delete(self, session_id: str) -> bool:
+        try:
+            os.remove(self.path(session_id))
+            return True
+        except OSError:
+            return False
+
+    def format_list(self, current: Optional[str] = None) -> str:
+        sessions = self.list()
+        if not sessions:
+            return "没有保存的会话"
+        lines = [f"  {'*' if s['session_id'] == current else ' '} {s['session_id']}: {s['messages']} 条消息, "
+                 f"保存于 {time.strftime('%m-%d %H:%M', time.localtime(s['saved_at']))}, 第一个问题: {s['first_question']}"
+                 for s in sessions]
+        return "保存的会话:\n" + "\n".join(lines)
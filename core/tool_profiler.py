@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import atexit
+import cProfile
+import inspect
+import functools
+import threading
+from typing import Callable, Optional
+from core.instrumentation import Histogram
+from tools.text_search import estimate_tokens
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILE_DIR = os.path.join(PROJECT_DIR, '.cache', 'profiles')
+TOOL_PROFILE_FILE = os.path.join(PROJECT_DIR, '.cache', 'metrics', 'tool_profile.json')
+
+# 工具约定出错时返回包含此文字的字符串，而不是抛出异常
+ERROR_MARKER = '出错'
+
+class ToolStats:
+    """单个工具的调用统计"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.output_chars = 0
+        self.output_tokens = 0
+        self.max_output_chars = 0
+        self.slow_profiles = []
+
+    def to_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_seconds': round(self.latency.sum, 4),
+            'p50_seconds': round(self.latency.percentile(50), 4),
+            'p95_seconds': round(self.latency.percentile(95), 4),
+            'p99_seconds': round(self.latency.percentile(99), 4),
+            'max_seconds': round(max(self.latency.samples, default=0.0), 4),
+            'output_chars': self.output_chars,
+            'output_tokens': self.output_tokens,
+            'avg_output_tokens': round(self.output_tokens / self.calls, 1) if self.calls else 0,
+            'max_output_chars': self.max_output_chars,
+            'slow_profiles': self.slow_profiles[-5:],
+        }
+
+class ToolProfiler:
+    """用装饰器记录每个工具的调用次数、延迟分位数、错误数和输出大小
+
+    参数:
+        cprofile_threshold: 单次调用超过该秒数时保存cProfile结果到 .cache/profiles/，为None时不启用cProfile
+        dump_path: 退出时写入统计结果的JSON文件路径，为None时不写入
+    """
+
+    def __init__(self, cprofile_threshold: Optional[float] = None, dump_path: Optional[str] = TOOL_PROFILE_FILE):
+        self.cprofile_threshold = cprofile_threshold
+        self.dump_path = dump_path
+        self.lock = threading.Lock()
+        self.tools = {}
+        if dump_path:
+            atexit.register(self.dump)
+
+    def _stats(self, name: str) -> ToolStats:
+        with self.lock:
+            return self.tools.setdefault(name, ToolStats())
+
+    def _record(self, name: str, seconds: float, result, raised: bool, profile: Optional[cProfile.Profile]) -> None:
+        output = '' if result is None else str(result)
+        stats = self._stats(name)
+        with self.lock:
+            stats.calls += 1
+            stats.errors += raised or ERROR_MARKER in output[:200]
+            stats.latency.observe(seconds)
+            stats.output_chars += len(output)
+            stats.output_tokens += estimate_tokens(output)
+            stats.max_output_chars = max(stats.max_output_chars, len(output))
+            call_number = stats.calls
+        if profile is not None and seconds >= self.cprofile_threshold:
+            try:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                profile_file = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{call_number}-{int(seconds * 1000)}ms.prof")
+                profile.dump_stats(profile_file)
+                with self.lock:
+                    stats.slow_profiles.append(profile_file)
+            except OSError:
+                pass
+
+    def _start_profile(self) -> Optional[cProfile.Profile]:
+        if self.cprofile_threshold is None:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 同一线程中已有其他profiler在运行（例如工具嵌套调用）
+            return None
+        return profile
+
+    def profile(self, func: Callable) -> Callable:
+        """装饰工具函数；保留函数名、文档字符串和签名，不影响工具描述的生成"""
+        name = func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                result, raised = None, False
+                try:
+                    result = await func(*args, **kwargs)
+                    return result
+                except Exception:
+                    raised = True
+                    raise
+                finally:
+                    self._record(name, time.perf_counter() - start, result, raised, None)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = self._start_profile()
+            start = time.perf_counter()
+            result, raised = None, False
+            try:
+                result = func(*args, **kwargs)
+                return result
+            except Exception:
+                raised = True
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                if profile is not None:
+                    profile.disable()
+                self._record(name, seconds, result, raised, profile)
+        return wrapper
+
+    def snapshot(self) -> dict:
+        """返回所有工具的统计数据"""
+        with self.lock:
+            return {name: stats.to_dict() for name, stats in self.tools.items()}
+
+    def dump(self, path: Optional[str] = None) -> Optional[str]:
+        """把统计结果写入JSON文件，没有调用记录时不写入"""
+        path = path or self.dump_path
+        snapshot = self.snapshot()
+        if not path or not snapshot:
+            return None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'generated': time.time(), 'tools': snapshot}, f, ensure_ascii=False, indent=2)
+        except OSError:
+            return None
+        return path
+
+    def format_stats(self, sort_by: str = 'total_seconds', limit: int = 10) -> str:
+        """按指定字段排序，返回工具统计表格
+
+        参数:
+            sort_by: 排序字段，例如 'total_seconds'、'calls'、'output_tokens'、'p95_seconds'
+            limit: 最多显示的工具数量
+        """
+        snapshot = self.snapshot()
+        if not snapshot:
+            return "工具统计: 尚无工具调用"
+        rows = sorted(snapshot.items(), key=lambda item: item[1].get(sort_by, 0), reverse=True)[:limit]
+        lines = [f"工具统计（按 {sort_by} 排序）:", "工具\t调用\t出错\t总耗时\tp50\tp95\t平均输出tokens\t最大输出字符"]
+        for name, stats in rows:
+            lines.append(
+                f"{name}\t{stats['calls']}\t{stats['errors']}\t{stats['total_seconds']:.2f}s\t"
+                f"{stats['p50_seconds']:.3f}s\t{stats['p95_seconds']:.3f}s\t{stats['avg_output_tokens']}\t{stats['max_output_chars']}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,165 @@
+import os
+import ast
+import time
+import typing
+import inspect
+import builtins
+import importlib
+import importlib.util
+import threading
+from typing import Callable, Dict, Iterable, List
+
+# 解析工具函数的类型注解时可用的名称
+_ANNOTATION_NAMESPACE = {name: getattr(typing, name) for name in typing.__all__}
+
+class _DeclarationError(Exception):
+    """无法从源码中静态解析工具声明，需要导入模块"""
+
+def _eval_annotation(node):
+    if node is None:
+        return inspect.Parameter.empty
+    try:
+        return eval(ast.unparse(node), {'__builtins__': builtins}, _ANNOTATION_NAMESPACE)
+    except Exception:
+        raise _DeclarationError(ast.unparse(node))
+
+def _eval_default(node):
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        raise _DeclarationError(ast.unparse(node))
+
+def _signature_from_ast(node: ast.FunctionDef) -> inspect.Signature:
+    """根据函数定义的语法树构造签名，不需要执行模块代码"""
+    arguments = node.args
+    parameters = []
+    positional = arguments.posonlyargs + arguments.args
+    defaults = [inspect.Parameter.empty] * (len(positional) - len(arguments.defaults)) + arguments.defaults
+    for index, (arg, default) in enumerate(zip(positional, defaults)):
+        kind = inspect.Parameter.POSITIONAL_ONLY if index < len(arguments.posonlyargs) else inspect.Parameter.POSITIONAL_OR_KEYWORD
+        parameters.append(inspect.Parameter(
+            arg.arg, kind, annotation=_eval_annotation(arg.annotation),
+            default=default if default is inspect.Parameter.empty else _eval_default(default),
+        ))
+    if arguments.vararg:
+        parameters.append(inspect.Parameter(arguments.vararg.arg, inspect.Parameter.VAR_POSITIONAL,
+                                            annotation=_eval_annotation(arguments.vararg.annotation)))
+    for arg, default in zip(arguments.kwonlyargs, arguments.kw_defaults):
+        parameters.append(inspect.Parameter(
+            arg.arg, inspect.Parameter.KEYWORD_ONLY, annotation=_eval_annotation(arg.annotation),
+            default=inspect.Parameter.empty if default is None else _eval_default(default),
+        ))
+    if arguments.kwarg:
+        parameters.append(inspect.Parameter(arguments.kwarg.arg, inspect.Parameter.VAR_KEYWORD,
+                                            annotation=_eval_annotation(arguments.kwarg.annotation)))
+    return inspect.Signature(parameters, return_annotation=_eval_annotation(node.returns))
+
+def read_declarations(module_name: str) -> Dict[str, tuple]:
+    """读取模块源码中顶层函数的 (签名, 文档字符串)，无法静态解析的函数不包含在结果中"""
+    spec = importlib.util.find_spec(module_name)
+    if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+        return {}
+    with open(spec.origin, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=spec.origin)
+    declarations = {}
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            try:
+                declarations[node.name] = (_signature_from_ast(node), ast.get_docstring(node, clean=False))
+            except _DeclarationError:
+                continue
+    return declarations
+
+class LazyToolRegistry:
+    """按需导入的工具注册表
+
+    工具的名称、参数和说明从模块源码中静态读取，不导入模块即可生成工具描述；
+    某个工具模块（例如依赖 pyautogui 和 opencv 的视觉工具）在其中的工具第一次被调用时才导入。
+
+    参数:
+        tool_groups: {工具组: {模块名: [函数名, ...]}}
+    """
+
+    def __init__(self, tool_groups: Dict[str, Dict[str, List[str]]]):
+        self.tool_groups = tool_groups
+        self.lock = threading.RLock()
+        self.modules = {}
+        # 模块名 -> 导入耗时（秒）
+        self.import_seconds = {}
+        self._declarations = {}
+
+    def load_module(self, module_name: str):
+        """导入工具模块（线程安全，只导入一次）"""
+        with self.lock:
+            module = self.modules.get(module_name)
+            if module is None:
+                start = time.perf_counter()
+                module = importlib.import_module(module_name)
+                self.import_seconds[module_name] = time.perf_counter() - start
+                self.modules[module_name] = module
+            return module
+
+    def _declaration(self, module_name: str, function_name: str):
+        if module_name not in self._declarations:
+            self._declarations[module_name] = read_declarations(module_name)
+        return self._declarations[module_name].get(function_name)
+
+    def _make_tool_function(self, module_name: str, function_name: str) -> Callable:
+        declaration = self._declaration(module_name, function_name)
+        if declaration is None:
+            # 源码中的声明无法静态解析，直接导入模块使用原函数
+            return getattr(self.load_module(module_name), function_name)
+        signature, docstring = declaration
+        registry = self
+
+        def tool_function(*args, **kwargs):
+            try:
+                function = getattr(registry.load_module(module_name), function_name)
+            except Exception as e:
+                return f"加载工具 {function_name} 时出错: {str(e)}"
+            return function(*args, **kwargs)
+
+        tool_function.__name__ = tool_function.__qualname__ = function_name
+        tool_function.__doc__ = docstring
+        tool_function.__module__ = module_name
+        tool_function.__signature__ = signature
+        return tool_function
+
+    def build_tool_groups(self) -> Dict[str, List[Callable]]:
+        """返回 {工具组: [工具函数]}，工具函数在第一次调用时才导入所在模块"""
+        return {
+            group: [self._make_tool_function(module_name, function_name)
+                    for module_name, function_names in modules.items() for function_name in function_names]
+            for group, modules in self.tool_groups.items()
+        }
+
+    def get_function(self, function_name: str) -> Callable:
+        """按名称返回原始工具函数（导入所在模块），例如重放宏时直接调用工具"""
+        for modules in self.tool_groups.values():
+            for module_name, function_names in modules.items():
+                if function_name in function_names:
+                    return getattr(self.load_module(module_name), function_name)
+        raise KeyError(f"未知的工具: {function_name}")
+
+    def preload(self, groups: Iterable[str]) -> None:
+        """在后台线程中导入这些工具组用到的模块，使第一次调用工具时不必等待导入"""
+        pending = [module_name for group in groups for module_name in self.tool_groups.get(group, {})
+                   if module_name not in self.modules]
+        if not pending:
+            return
+
+        def load_all():
+            for module_name in pending:
+                try:
+                    self.load_module(module_name)
+                except Exception:
+                    # 导入失败时，调用工具会返回错误信息
+                    pass
+
+        threading.Thread(target=load_all, daemon=True).start()
+
+    def format_stats(self) -> str:
+        if not self.import_seconds:
+            return "工具模块: 尚未导入"
+        loaded = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.import_seconds.items())
+        return f"工具模块: 已导入 {len(self.import_seconds)}/{len({m for modules in self.tool_groups.values() for m in modules})} 个 ({loaded})"
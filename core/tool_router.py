@@ -0,0 +1,180 @@
+import json
+import asyncio
+import inspect
+import functools
+import contextvars
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Union
+from llama_index.core.objects import ObjectRetriever
+from llama_index.core.tools import BaseTool, FunctionTool
+from llama_index.core.workflow import Context
+from tools.text_search import estimate_tokens
+
+# 每次请求都会提供的基础工具组
+BASE_GROUP = 'knowledge'
+
+# 各工具组的关键词，出现任一关键词即提供该组工具
+GROUP_KEYWORDS = {
+    'file': ['文件', '目录', '复制', '拷贝', '移动', '删除', '重命名', '新建', '创建', '读取', '写入', '保存',
+             '桌面', '下载', '重复', '整理', '路径', '清理', 'file', 'folder', 'directory', 'copy', 'move', 'delete'],
+    'system': ['系统信息', '进程', '内存', 'cpu', '处理器', '磁盘', '硬盘', '空间', 'c盘', 'd盘', '版本', '任务管理器',
+               '控制面板', '设备管理器', '命令提示符', 'powershell', 'cmd', '卡顿', '很慢', '占用', 'process', 'disk'],
+    'input': ['鼠标', '键盘', '点击', '单击', '双击', '右键', '拖动', '拖拽', '输入', '打字', '按下', '按键', '滚动',
+              '光标', '坐标', 'click', 'mouse', 'keyboard', 'type'],
+    'visual': ['屏幕', '截图', '截屏', '图像', '图片', '图标', '颜色', '识别', '按钮', '窗口', 'screenshot', 'screen'],
+}
+
+# 只询问操作方法的提问方式，这类问题通常只需要教程
+HOW_TO_MARKERS = ['如何', '怎么', '怎样', '什么', '为什么', '哪些', '是否', '能否', 'how to', 'what is']
+# 要求助手直接动手操作的说法
+ACTION_MARKERS = ['帮我', '帮忙', '替我', '给我', '请你', '请帮', '执行', '马上', '直接', '立即', '现在就']
+
+# 按问题缓存选择结果的数量上限（同一轮对话中每一步都会重新获取工具）
+SELECTION_CACHE_SIZE = 128
+
+# 当前会话的标识；工作流的步骤在运行对话的任务中创建，会继承该值。
+# 选择结果按 (会话, 问题) 保存，一个会话申请的工具组不会提供给另一个会话的相同问题
+_current_scope = contextvars.ContextVar('tool_router_scope', default=None)
+
+def set_scope(scope) -> None:
+    """设置当前任务（及之后创建的子任务）所属的会话，在运行一轮对话之前调用"""
+    _current_scope.set(scope)
+
+def current_scope():
+    """当前任务所属的会话，没有设置时为None"""
+    return _current_scope.get()
+
+def _in_thread(func: Callable) -> Callable:
+    """在线程中执行同步工具函数的异步版本；asyncio.to_thread 会把会话作用域等上下文变量带到线程中，
+    llama_index 默认使用的 run_in_executor 不会"""
+    @functools.wraps(func)
+    async def async_fn(*args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return async_fn
+
+def _to_tool(tool: Union[BaseTool, Callable]) -> BaseTool:
+    if isinstance(tool, BaseTool):
+        return tool
+    if inspect.iscoroutinefunction(tool):
+        return FunctionTool.from_defaults(async_fn=tool)
+    return FunctionTool.from_defaults(fn=tool, async_fn=_in_thread(tool))
+
+class ToolRouter(ObjectRetriever):
+    """按用户问题选择需要提供给模型的工具组，减少每次请求序列化的工具描述
+
+    作为 FunctionAgent 的 tool_retriever 使用。模型可以调用 request_tool_groups 工具
+    申请更多工具组（或全部工具），之后同一问题的后续步骤会提供这些工具。
+
+    参数:
+        tool_groups: {工具组: [工具或工具函数]}
+        on_select: 选定工具组后调用的回调，参数为工具组集合（例如用于提前导入这些工具所在的模块）
+    """
+
+    def __init__(self, tool_groups: Dict[str, Sequence[Union[BaseTool, Callable]]],
+                 on_select: Optional[Callable[[set], None]] = None):
+        self.on_select = on_select
+        self.groups = {}
+        self.tools_by_name = {}
+        for group, tools in tool_groups.items():
+            converted = [_to_tool(tool) for tool in tools]
+            self.groups[group] = [tool.metadata.name for tool in converted]
+            self.tools_by_name.update({tool.metadata.name: tool for tool in converted})
+        escalation_tool = FunctionTool.from_defaults(async_fn=self._request_tool_groups, name='request_tool_groups')
+        self.groups.setdefault(BASE_GROUP, []).append(escalation_tool.metadata.name)
+        self.tools_by_name[escalation_tool.metadata.name] = escalation_tool
+
+        self.schema_tokens = {
+            name: estimate_tokens(json.dumps(tool.metadata.to_openai_tool(skip_length_check=True), ensure_ascii=False))
+            for name, tool in self.tools_by_name.items()
+        }
+        self._selections = OrderedDict()  # (会话, 问题) -> 工具组集合
+        self.stats = {'requests': 0, 'full_requests': 0, 'full_tokens': 0, 'selected_tokens': 0}
+        self.last_report = ''
+
+    def classify(self, query: str) -> set:
+        """用关键词规则判断问题需要哪些工具组"""
+        text = query.lower()
+        groups = {BASE_GROUP}
+        is_action = any(marker in text for marker in ACTION_MARKERS)
+        is_how_to = any(marker in text for marker in HOW_TO_MARKERS)
+        if is_how_to and not is_action:
+            return groups
+        matched = {group for group, keywords in GROUP_KEYWORDS.items() if any(keyword in text for keyword in keywords)}
+        if is_action and not matched:
+            # 明确要求操作但无法判断类型时，提供全部工具
+            return set(self.groups)
+        return groups | matched
+
+    def select(self, query: str) -> List[BaseTool]:
+        """返回问题对应的工具列表，并记录节省的工具描述token数"""
+        key = (_current_scope.get(), query)
+        groups = self._selections.get(key)
+        if groups is None:
+            groups = self.classify(query)
+            self._remember(key, groups)
+            self._record(groups)
+        else:
+            self._selections.move_to_end(key)
+        names = [name for group in self.groups if group in groups for name in self.groups[group]]
+        return [self.tools_by_name[name] for name in names]
+
+    def _remember(self, key: tuple, groups: set) -> None:
+        self._selections[key] = groups
+        self._selections.move_to_end(key)
+        while len(self._selections) > SELECTION_CACHE_SIZE:
+            self._selections.popitem(last=False)
+        if self.on_select is not None:
+            self.on_select(groups)
+
+    def _record(self, groups: set) -> None:
+        full_tokens = sum(self.schema_tokens.values())
+        selected = [name for group in groups for name in self.groups.get(group, [])]
+        selected_tokens = sum(self.schema_tokens[name] for name in selected)
+        self.stats['requests'] += 1
+        self.stats['full_requests'] += groups >= set(self.groups)
+        self.stats['full_tokens'] += full_tokens
+        self.stats['selected_tokens'] += selected_tokens
+        self.last_report = (
+            f"工具组: {', '.join(sorted(groups))}; 工具 {len(selected)}/{len(self.tools_by_name)} 个; "
+            f"工具描述约 {selected_tokens}/{full_tokens} tokens, 节省 {full_tokens - selected_tokens} tokens"
+        )
+
+    def format_stats(self) -> str:
+        """返回本次会话的工具选择统计"""
+        stats = self.stats
+        saved = stats['full_tokens'] - stats['selected_tokens']
+        percent = saved / stats['full_tokens'] * 100 if stats['full_tokens'] else 0
+        return (f"工具路由: 请求 {stats['requests']} 次 (使用全部工具 {stats['full_requests']} 次), "
+                f"工具描述共节省约 {saved} tokens ({percent:.1f}%)")
+
+    async def _request_tool_groups(self, ctx: Context, groups: List[str]) -> str:
+        """当现有工具不足以完成任务时，申请更多工具组
+
+        参数:
+            groups: 需要的工具组列表，可选值: 'file'（文件操作）, 'system'（系统信息与进程）,
+                'input'（鼠标键盘控制）, 'visual'（屏幕截图与图像识别）, 'all'（全部工具）
+        """
+        query = await ctx.get('user_msg_str', default='')
+        if 'all' in groups:
+            requested = set(self.groups)
+        else:
+            unknown = [group for group in groups if group not in self.groups]
+            if unknown:
+                return f"未知的工具组: {', '.join(unknown)}，可选: {', '.join(self.groups)}, all"
+            requested = set(groups)
+        key = (_current_scope.get(), query)
+        current = self._selections.get(key) or self.classify(query)
+        self._remember(key, current | requested)
+        self._record(current | requested)
+        names = [name for group in requested for name in self.groups[group]]
+        return f"已提供工具组 {', '.join(sorted(requested))}，新增可用工具: {', '.join(names)}"
+
+    def retrieve(self, str_or_query_bundle) -> List[BaseTool]:
+        query = getattr(str_or_query_bundle, 'query_str', str_or_query_bundle)
+        # 执行工具调用时，工作流会用工具名称查找工具
+        if query in self.tools_by_name:
+            return [self.tools_by_name[query]]
+        return self.select(query)
+
+    async def aretrieve(self, str_or_query_bundle) -> List[BaseTool]:
+        return self.retrieve(str_or_query_bundle)
@@ -0,0 +1,326 @@
+"""隔离上下文工作单元引擎（见 DesignDocuments.txt）
+
+每个工作单元使用全新的LLM上下文执行，只接收自身指令和上游单元的结构化输出，
+输入输出通过JSON Schema约定。单元之间构成有向无环图，互不依赖的单元并发执行。
+
+示例::
+
+    units = [
+        WorkUnit('collect', '列出排查电脑运行缓慢需要检查的项目', output_schema={...}, tools=[get_system_info]),
+        WorkUnit('analyze', '根据检查结果分析原因', depends_on=['collect'], output_schema={...}),
+        WorkUnit('report', '生成给用户的操作建议', depends_on=['analyze']),
+    ]
+    result = await WorkUnitEngine(llm).run(units, {'question': '电脑运行缓慢怎么办'})
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import random
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from llama_index.core.agent.workflow import FunctionAgent
+from llama_index.core.workflow import Context
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_UNIT_CACHE_DIR = os.path.join(PROJECT_DIR, '.cache', 'work_units')
+
+_JSON_BLOCK_PATTERN = re.compile(r'```(?:json)?\s*(.*?)```', re.DOTALL)
+_SCHEMA_TYPES = {
+    'object': dict, 'array': list, 'string': str, 'boolean': bool,
+    'integer': int, 'number': (int, float), 'null': type(None),
+}
+
+class WorkUnitError(Exception):
+    """工作单元执行失败"""
+
+def validate_schema(value: Any, schema: Optional[dict], path: str = '$') -> List[str]:
+    """按JSON Schema的常用子集（type、required、properties、items、enum）校验数据，返回错误列表"""
+    if not schema:
+        return []
+    errors = []
+    expected = schema.get('type')
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        python_types = []
+        for name in types:
+            python_type = _SCHEMA_TYPES[name]
+            python_types.extend(python_type if isinstance(python_type, tuple) else (python_type,))
+        python_types = tuple(python_types)
+        # bool 是 int 的子类，需要单独排除
+        if not isinstance(value, python_types) or (isinstance(value, bool) and 'boolean' not in types):
+            return [f"{path}: 期望类型 {expected}，实际为 {type(value).__name__}"]
+    if 'enum' in schema and value not in schema['enum']:
+        errors.append(f"{path}: 取值必须是 {schema['enum']} 之一")
+    if isinstance(value, dict):
+        for key in schema.get('required', []):
+            if key not in value:
+                errors.append(f"{path}: 缺少字段 '{key}'")
+        for key, sub_schema in schema.get('properties', {}).items():
+            if key in value:
+                errors.extend(validate_schema(value[key], sub_schema, f"{path}.{key}"))
+    if isinstance(value, list) and 'items' in schema:
+        for index, item in enumerate(value):
+            errors.extend(validate_schema(item, schema['items'], f"{path}[{index}]"))
+    return errors
+
+def parse_json_output(text: str) -> Any:
+    """从模型回复中解析JSON，兼容 ```json 代码块和前后多余文字"""
+    match = _JSON_BLOCK_PATTERN.search(text)
+    candidate = match.group(1) if match else text
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        pass
+    for opening, closing in (('{', '}'), ('[', ']')):
+        start, end = candidate.find(opening), candidate.rfind(closing)
+        if start != -1 and end > start:
+            try:
+                return json.loads(candidate[start:end + 1])
+            except ValueError:
+                continue
+    raise WorkUnitError("模型输出不是有效的JSON")
+
+def _tool_name(tool) -> str:
+    """工具的稳定名称：FunctionTool 等工具对象使用 metadata.name，函数使用函数名"""
+    metadata = getattr(tool, 'metadata', None)
+    if metadata is not None and getattr(metadata, 'name', None):
+        return metadata.name
+    return getattr(tool, '__name__', type(tool).__name__)
+
+class WorkUnit:
+    """单个工作单元
+
+    参数:
+        name: 单元名称，在同一个工作流中唯一
+        instructions: 单元的指令（作为独立上下文的系统提示词）
+        depends_on: 上游单元名称列表，上游的输出以单元名为键合并到本单元的输入中
+        input_schema / output_schema: 输入输出的JSON Schema（可选）
+        tools: 单元可用的工具（可选）
+        retries: 失败后的重试次数
+        timeout: 每次执行的超时时间（秒）
+        run: 不使用LLM的单元可提供异步函数 run(inputs) -> 输出，代替LLM执行
+        cacheable: 是否按输入缓存结果；调用了有副作用工具的单元应设为False
+    """
+
+    def __init__(self, name: str, instructions: str = '', depends_on: Optional[List[str]] = None,
+                 input_schema: Optional[dict] = None, output_schema: Optional[dict] = None,
+                 tools: Optional[list] = None, retries: int = 1, timeout: float = 60.0,
+                 run: Optional[Callable[[dict], Awaitable[Any]]] = None, cacheable: bool = True):
+        self.name = name
+        self.instructions = instructions
+        self.depends_on = list(depends_on or [])
+        self.input_schema = input_schema
+        self.output_schema = output_schema
+        self.tools = tools or []
+        self.retries = retries
+        self.timeout = timeout
+        self.run = run
+        self.cacheable = cacheable
+
+    def cache_key(self, inputs: dict) -> str:
+        """按单元定义和输入计算缓存键"""
+        payload = json.dumps({
+            'name': self.name,
+            'instructions': self.instructions,
+            'output_schema': self.output_schema,
+            'tools': sorted(_tool_name(tool) for tool in self.tools),
+            'inputs': inputs,
+        }, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class WorkUnitResult:
+    """单个工作单元的执行结果"""
+
+    def __init__(self, name: str, status: str, output: Any = None, error: str = '', attempts: int = 0,
+                 duration: float = 0.0):
+        self.name = name
+        # 'ok' / 'cached' / 'failed' / 'skipped'
+        self.status = status
+        self.output = output
+        self.error = error
+        self.attempts = attempts
+        self.duration = duration
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'status': self.status, 'output': self.output, 'error': self.error,
+                'attempts': self.attempts, 'duration': round(self.duration, 3)}
+
+class WorkUnitEngine:
+    """按依赖关系并发执行工作单元
+
+    参数:
+        llm: 工作单元使用的大模型
+        max_concurrency: 全局同时执行的单元数量上限
+        cache_dir: 结果缓存目录，为None时不缓存
+        max_cache_entries: 最多缓存的结果数量，超过时删除最久没有使用的结果
+        max_cache_age_days: 缓存结果的有效期（天）
+    """
+
+    def __init__(self, llm=None, max_concurrency: int = 4, cache_dir: Optional[str] = WORK_UNIT_CACHE_DIR,
+                 max_cache_entries: int = 200, max_cache_age_days: float = 30.0):
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.cache_dir = cache_dir
+        self.max_cache_entries = max_cache_entries
+        self.max_cache_age = max_cache_age_days * 24 * 3600
+
+    @staticmethod
+    def topological_order(units: List[WorkUnit]) -> List[WorkUnit]:
+        """检查单元名称和依赖关系，返回拓扑排序后的单元列表"""
+        by_name = {}
+        for unit in units:
+            if unit.name in by_name:
+                raise WorkUnitError(f"工作单元名称重复: {unit.name}")
+            by_name[unit.name] = unit
+        for unit in units:
+            missing = [dep for dep in unit.depends_on if dep not in by_name]
+            if missing:
+                raise WorkUnitError(f"工作单元 '{unit.name}' 依赖的单元不存在: {', '.join(missing)}")
+
+        order = []
+        state = {}  # 名称 -> 'visiting' / 'done'
+
+        def visit(unit, chain):
+            if state.get(unit.name) == 'done':
+                return
+            if state.get(unit.name) == 'visiting':
+                raise WorkUnitError(f"工作单元之间存在循环依赖: {' -> '.join(chain + [unit.name])}")
+            state[unit.name] = 'visiting'
+            for dep in unit.depends_on:
+                visit(by_name[dep], chain + [unit.name])
+            state[unit.name] = 'done'
+            order.append(unit)
+
+        for unit in units:
+            visit(unit, [])
+        return order
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_cached(self, unit: WorkUnit, key: str):
+        if not self.cache_dir or not unit.cacheable:
+            return None
+        path = self._cache_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_cache_age:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            # 更新修改时间，清理时按最近使用时间保留
+            os.utime(path)
+            return cached
+        except (OSError, ValueError):
+            return None
+
+    def _prune_cache(self) -> None:
+        """删除过期的缓存结果，数量超过上限时删除最久没有使用的结果"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        entries.sort(reverse=True)
+        now = time.time()
+        for index, (modified, path) in enumerate(entries):
+            if index >= self.max_cache_entries or now - modified > self.max_cache_age:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _store_cached(self, unit: WorkUnit, key: str, output: Any) -> None:
+        if not self.cache_dir or not unit.cacheable:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self._cache_path(key), 'w', encoding='utf-8') as f:
+            json.dump({'output': output}, f, ensure_ascii=False)
+        self._prune_cache()
+
+    async def _run_with_llm(self, unit: WorkUnit, inputs: dict) -> Any:
+        """在全新的上下文中执行单元，并解析结构化输出"""
+        system_prompt = unit.instructions
+        if unit.output_schema:
+            system_prompt += ("\n\n只输出一个符合以下JSON Schema的JSON对象，不要输出其他内容：\n"
+                              + json.dumps(unit.output_schema, ensure_ascii=False))
+        agent = FunctionAgent(name=unit.name, description=unit.instructions[:200] or unit.name,
+                              tools=unit.tools, llm=self.llm, system_prompt=system_prompt)
+        ctx = Context(agent)
+        response = await agent.run(json.dumps(inputs, ensure_ascii=False), ctx=ctx)
+        text = str(response)
+        return parse_json_output(text) if unit.output_schema else text
+
+    async def _execute_unit(self, unit: WorkUnit, inputs: dict, semaphore: asyncio.Semaphore) -> WorkUnitResult:
+        start_time = time.time()
+        errors = validate_schema(inputs, unit.input_schema)
+        if errors:
+            return WorkUnitResult(unit.name, 'failed', error="输入不符合Schema: " + "; ".join(errors))
+
+        key = unit.cache_key(inputs)
+        cached = self._load_cached(unit, key)
+        if cached is not None:
+            return WorkUnitResult(unit.name, 'cached', cached['output'], duration=time.time() - start_time)
+
+        last_error = ''
+        attempts = 0
+        for attempt in range(unit.retries + 1):
+            attempts = attempt + 1
+            try:
+                async with semaphore:
+                    runner = unit.run(inputs) if unit.run else self._run_with_llm(unit, inputs)
+                    output = await asyncio.wait_for(runner, timeout=unit.timeout)
+                errors = validate_schema(output, unit.output_schema)
+                if errors:
+                    raise WorkUnitError("输出不符合Schema: " + "; ".join(errors))
+                self._store_cached(unit, key, output)
+                return WorkUnitResult(unit.name, 'ok', output, attempts=attempts, duration=time.time() - start_time)
+            except asyncio.TimeoutError:
+                last_error = f"执行超时（{unit.timeout} 秒）"
+            except Exception as e:
+                last_error = str(e) or type(e).__name__
+            if attempt < unit.retries:
+                # 指数退避加随机抖动
+                await asyncio.sleep(min(8.0, 0.5 * 2 ** attempt) * (0.5 + random.random()))
+        return WorkUnitResult(unit.name, 'failed', error=last_error, attempts=attempts, duration=time.time() - start_time)
+
+    async def run(self, units: List[WorkUnit], initial_input: Optional[Dict[str, Any]] = None) -> Dict[str, WorkUnitResult]:
+        """执行全部工作单元，返回 单元名称 -> 结果
+
+        没有依赖的单元接收 initial_input；有依赖的单元接收 initial_input 加上以上游单元名为键的上游输出。
+        上游失败的单元会被跳过，其余分支不受影响。
+        """
+        ordered = self.topological_order(units)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = {}
+
+        async def run_unit(unit: WorkUnit) -> WorkUnitResult:
+            upstream = {dep: await tasks[dep] for dep in unit.depends_on}
+            failed = [name for name, result in upstream.items() if result.status in ('failed', 'skipped')]
+            if failed:
+                return WorkUnitResult(unit.name, 'skipped', error=f"上游单元失败: {', '.join(failed)}")
+            inputs = dict(initial_input or {})
+            inputs.update({name: result.output for name, result in upstream.items()})
+            return await self._execute_unit(unit, inputs, semaphore)
+
+        # 按拓扑顺序创建任务，保证依赖的任务已经存在
+        for unit in ordered:
+            tasks[unit.name] = asyncio.ensure_future(run_unit(unit))
+        await asyncio.gather(*tasks.values())
+        return {name: task.result() for name, task in tasks.items()}
+
+def format_work_unit_results(results: Dict[str, WorkUnitResult]) -> str:
+    """把执行结果格式化为简短的表格"""
+    status_labels = {'ok': '成功', 'cached': '缓存', 'failed': '失败', 'skipped': '跳过'}
+    lines = ["单元\t状态\t尝试\t耗时"]
+    for result in results.values():
+        line = f"{result.name}\t{status_labels[result.status]}\t{result.attempts}\t{result.duration:.2f}s"
+        if result.error:
+            line += f"\t{result.error}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,102 @@
+import os
+import sys
+import pytest
+from benchmarks.fake_backends import FakeScreen, fake_modules
+from benchmarks.stand_in_llm import StandInLLMServer, load_scenarios
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope='session', autouse=True)
+def offline_tokenizer():
+    """tiktoken 无法下载编码文件时改用估算的token数"""
+    from benchmarks.run_benchmarks import use_offline_tokenizer_if_needed
+    use_offline_tokenizer_if_needed()
+
+@pytest.fixture(scope='session')
+def stand_in_server():
+    """回放 benchmarks/scenarios.json 的替身LLM服务，整个测试会话共用"""
+    server = StandInLLMServer(load_scenarios(os.path.join(PROJECT_DIR, 'benchmarks', 'scenarios.json'))).start()
+    yield server
+    server.stop()
+
+@pytest.fixture(scope='session')
+def agent_module(stand_in_server):
+    """连接替身LLM服务的智能体模块（模块导入时读取API地址，整个测试会话只导入一次）"""
+    os.environ['QIANWEN_API_KEY'] = 'stand-in'
+    os.environ['QIANWEN_API_BASE'] = stand_in_server.base_url
+    import computer_expert_agent
+    computer_expert_agent.prepare_agent()
+    return computer_expert_agent
+
+@pytest.fixture
+def fake_gui(monkeypatch):
+    """安装 pyautogui 和 pyperclip 替身的函数（参数同 FakeScreen），返回 FakeScreen；测试结束后恢复原来的模块"""
+    def install(**kwargs) -> FakeScreen:
+        screen = FakeScreen(**kwargs)
+        for name, module in fake_modules(screen).items():
+            monkeypatch.setitem(sys.modules, name, module)
+        return screen
+    return install
+
+@pytest.fixture
+def answer_cache(tmp_path):
+    """保存在临时目录的回答缓存"""
+    from core.answer_cache import AnswerCache
+    return AnswerCache(path=str(tmp_path / 'answer_cache.json'))
+
+@pytest.fixture
+def make_metrics(tmp_path):
+    """创建只写 tmp_path/turns.jsonl 的 StreamMetrics 的函数，参数同 StreamMetrics"""
+    from core.instrumentation import StreamMetrics
+
+    def make(**kwargs):
+        return StreamMetrics(jsonl_path=str(tmp_path / 'turns.jsonl'), prometheus_path=None, **kwargs)
+    return make
+
+@pytest.fixture
+def governor():
+    """进程列表预算足够大的输出控制器"""
+    from core.output_governor import OutputGovernor
+    from tools.result_format import OutputStore
+    return OutputGovernor(budgets={'get_running_processes': 10000}, store=OutputStore())
+
+@pytest.fixture
+def disk_prefetcher():
+    """只提前执行 check_disk_space（问题包含“磁盘”时）的 Prefetcher，返回 (prefetcher, check_disk_space)；
+    check_disk_space 的结果包含它被调用的次数"""
+    from core.prefetch import Prefetcher
+    calls = []
+
+    def check_disk_space():
+        calls.append('check_disk_space')
+        return f"可用空间 {len(calls)}"
+
+    tools = {'check_disk_space': check_disk_space}
+    prefetcher = Prefetcher(tools.__getitem__, tools=['check_disk_space'], rules={'check_disk_space': ['磁盘']},
+                            history_path=None)
+    yield prefetcher, check_disk_space
+    prefetcher.executor.shutdown(wait=True)
+
+@pytest.fixture
+def agent(agent_module, tmp_path, monkeypatch, answer_cache):
+    """智能体模块，会话、回答缓存和指标都写到临时目录"""
+    from core.instrumentation import StreamMetrics
+    from core.session_store import SessionStore
+    monkeypatch.setattr(agent_module, 'session_store', SessionStore(str(tmp_path / 'sessions')))
+    monkeypatch.setattr(agent_module, 'answer_cache', answer_cache)
+    monkeypatch.setattr(agent_module, 'stream_metrics', StreamMetrics(jsonl_path=None, prometheus_path=None))
+    monkeypatch.setattr(agent_module.get_component('prefetcher'), 'history_path', None)
+    monkeypatch.setattr(agent_module.get_component('tool_profiler'), 'dump_path', None)
+    return agent_module
+
+@pytest.fixture
+def ctx():
+    """空白的工作流上下文"""
+    from llama_index.core.workflow import Context, StartEvent, StopEvent, Workflow, step
+
+    class EmptyWorkflow(Workflow):
+        @step
+        async def run_step(self, ev: StartEvent) -> StopEvent:
+            return StopEvent()
+
+    return Context(EmptyWorkflow())
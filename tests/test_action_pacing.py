@@ -0,0 +1,24 @@
+import sys
+import time
+from tools.action_pacing import ActionPacer
+
+def test_waits_for_delayed_response_before_settling(fake_gui):
+    # 菜单在点击后200ms才出现，晚于连续几帧没有变化的稳定判断（约90ms）
+    screen = fake_gui(response_latency=0.2)
+    pacer = ActionPacer()
+    start = time.perf_counter()
+    sys.modules['pyautogui'].click(400, 300)
+    pacer.after_action('click', 400, 300)
+    assert screen.menus == 1
+    assert 0.2 <= time.perf_counter() - start < pacer.settle_budgets['click']
+    assert pacer.stats['no_response'] == 0
+
+def test_unchanged_screen_waits_only_for_response_window(fake_gui):
+    fake_gui()
+    pacer = ActionPacer()
+    sys.modules['pyautogui'].click(400, 300)
+    start = time.perf_counter()
+    pacer.after_action('click', 400, 300)
+    waited = time.perf_counter() - start
+    assert pacer.response_windows['click'] <= waited < pacer.settle_budgets['click']
+    assert pacer.stats['no_response'] == 1 and pacer.stats['over_budget'] == 0
@@ -0,0 +1,26 @@
+from core.answer_cache import _similarity, normalize_question
+
+def test_swapped_drive_letters_do_not_match(answer_cache):
+    answer_cache.store('怎么把C盘的文件移动到D盘', '从C盘移动到D盘的步骤')
+    assert _similarity(normalize_question('怎么把C盘的文件移动到D盘'), normalize_question('怎么把D盘的文件移动到C盘')) == 0.0
+    assert answer_cache.lookup('怎么把D盘的文件移动到C盘') is None
+
+def test_opposite_actions_do_not_match(answer_cache):
+    answer_cache.store('请告诉我怎样在Windows系统中打开防火墙的详细步骤', '打开防火墙的步骤')
+    assert answer_cache.lookup('请告诉我怎样在Windows系统中关闭防火墙的详细步骤') is None
+
+def test_swapped_chinese_operands_do_not_match(answer_cache):
+    answer_cache.store('如何把文档文件夹里的图片移动到桌面文件夹里', '从文档移动到桌面')
+    assert answer_cache.lookup('如何把桌面文件夹里的图片移动到文档文件夹里') is None
+
+def test_negated_question_does_not_match(answer_cache):
+    answer_cache.store('在Windows系统中如何显示隐藏的文件', '显示隐藏文件的步骤')
+    assert _similarity(normalize_question('在Windows系统中如何显示隐藏的文件'),
+                       normalize_question('在Windows系统中如何不显示隐藏的文件')) == 0.0
+    assert answer_cache.lookup('在Windows系统中如何不显示隐藏的文件') is None
+    assert answer_cache.lookup('在Windows系统中如何显示隐藏的文件呢') == '显示隐藏文件的步骤'
+
+def test_normalized_and_near_duplicate_questions_match(answer_cache):
+    answer_cache.store('如何在Windows 10上查看电脑的系统信息和硬件配置？', '系统信息步骤')
+    assert answer_cache.lookup('如何在windows10上查看电脑的系统信息和硬件配置') == '系统信息步骤'
+    assert answer_cache.lookup('如何在Windows 10上查看电脑的系统信息和硬件配置呢') == '系统信息步骤'
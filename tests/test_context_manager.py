@@ -0,0 +1,34 @@
+import time
+import asyncio
+from llama_index.core.llms import ChatMessage
+from llama_index.core.memory import ChatMemoryBuffer
+from core.context_manager import CONTEXT_HEADER_KEY, PINNED_FACT_TTLS, ContextManager
+
+def test_expired_facts_leave_header_in_long_running_session(ctx):
+    manager = ContextManager()
+
+    async def run():
+        await ctx.set('memory', ChatMemoryBuffer.from_defaults(chat_history=[
+            ChatMessage(role='user', content='帮我看看磁盘空间'), ChatMessage(role='assistant', content='C盘剩余 20GB')]))
+        await manager.after_turn(ctx, [('check_disk_space', 'C: 剩余 20GB'), ('get_desktop_path', 'C:\\Users\\me\\Desktop')])
+        assert '磁盘空间' in await ctx.get(CONTEXT_HEADER_KEY)
+        # 一个多小时后：磁盘空间过期，桌面路径仍然有效
+        times = dict(await ctx.get('pinned_fact_times'))
+        times['磁盘空间'] -= PINNED_FACT_TTLS['磁盘空间'] + 1
+        await ctx.set('pinned_fact_times', times)
+        assert await manager.expire_facts(ctx) == 1
+        return await ctx.get(CONTEXT_HEADER_KEY), await ctx.get('pinned_facts')
+
+    header, pinned = asyncio.run(run())
+    assert '磁盘空间' not in header and '桌面路径' in header
+    assert list(pinned) == ['桌面路径']
+
+def test_compact_excludes_expired_facts_from_header(ctx):
+    async def run():
+        await ctx.set('memory', ChatMemoryBuffer.from_defaults(chat_history=[ChatMessage(role='user', content='你好')]))
+        await ctx.set('pinned_facts', {'磁盘空间': 'C: 剩余 20GB'})
+        await ctx.set('pinned_fact_times', {'磁盘空间': time.time() - 2 * PINNED_FACT_TTLS['磁盘空间']})
+        await ContextManager().compact(ctx)
+        return await ctx.get(CONTEXT_HEADER_KEY)
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,27 @@
+import json
+
+def read_records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_prompt_is_not_exported_by_default(tmp_path, make_metrics):
+    metrics = make_metrics()
+    metrics.finish_turn(metrics.start_turn('我的密码是 hunter2，怎么改'))
+    record = read_records(tmp_path / 'turns.jsonl')[0]
+    assert 'prompt' not in record
+    assert 'hunter2' not in json.dumps(record, ensure_ascii=False)
+    assert record['prompt_chars'] == len('我的密码是 hunter2，怎么改')
+    assert len(record['prompt_hash']) == 16
+
+def test_prompt_is_exported_when_enabled(tmp_path, make_metrics):
+    metrics = make_metrics(include_prompts=True)
+    metrics.finish_turn(metrics.start_turn('如何创建文件夹'))
+    assert read_records(tmp_path / 'turns.jsonl')[0]['prompt'] == '如何创建文件夹'
+
+def test_jsonl_rotates_by_size(tmp_path, make_metrics):
+    metrics = make_metrics(max_jsonl_bytes=1000, backup_count=2)
+    for _ in range(100):
+        metrics.finish_turn(metrics.start_turn('如何创建文件夹'))
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert files == ['turns.jsonl', 'turns.jsonl.1', 'turns.jsonl.2']
+    assert all(path.stat().st_size < 1000 + 1000 for path in tmp_path.iterdir())
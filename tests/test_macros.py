@@ -0,0 +1,32 @@
+from core.macros import MacroRecorder, MacroStore
+
+def press_key(key):
+    return f"已按下 {key} 键"
+
+def record_turn(recorder, tool, prompt, keys):
+    recorder.note_prompt(prompt)
+    for key in keys:
+        tool(key)
+    recorder.finish_prompt()
+
+def test_only_prompts_with_steps_become_triggers(tmp_path):
+    store = MacroStore(str(tmp_path))
+    recorder = MacroRecorder(store)
+    tool = recorder.wrap(press_key)
+    recorder.start('记事本')
+    record_turn(recorder, tool, '我的桌面在哪', [])
+    record_turn(recorder, tool, '打开记事本', ['win', 'enter'])
+    record_turn(recorder, tool, '保存文件', ['ctrl+s'])
+    recorder.stop()
+
+    assert store.match('我的桌面在哪') is None
+    assert [step['args'] for step in store.match('打开记事本')['steps']] == [['win'], ['enter']]
+    assert [step['args'] for step in store.match('保存文件！')['steps']] == [['ctrl+s']]
+    assert len(store.get('记事本')['steps']) == 3
+
+def test_legacy_string_triggers_do_not_match(tmp_path):
+    store = MacroStore(str(tmp_path))
+    store.save({'name': '旧宏', 'prompts': ['打开记事本'], 'steps': [{'tool': 'press_key', 'args': ['win'],
+                                                                        'kwargs': {}, 'precondition': None}]})
+    assert store.match('打开记事本') is None
+    assert '打开记事本' in store.format_list()
@@ -0,0 +1,22 @@
+from tools.result_format import format_table, join_sections
+
+def test_table_outputs_record_legacy_format_size(governor):
+    table = format_table("当前运行的进程（按内存排序）", ["进程名", "PID", "内存MB"],
+                         [(f"process{i}.exe", 1000 + i, 12.5) for i in range(20)])
+    result = governor.wrap(lambda: table)()
+    stats = governor.snapshot()['tools']['<lambda>']
+    assert type(result) is str and result == table
+    assert stats['tables'] == 1
+    assert stats['legacy_chars'] == table.legacy_chars > stats['raw_chars']
+    assert stats['table_saved_tokens'] > 0
+
+def test_plain_outputs_have_no_table_savings(governor):
+    governor.govern('get_desktop_path', 'C:\\Users\\me\\Desktop')
+    stats = governor.snapshot()['tools']['get_desktop_path']
+    assert stats['tables'] == 0 and stats['table_saved_tokens'] == 0
+
+def test_join_sections_keeps_legacy_size():
+    table = format_table("重复文件组", ["组", "文件数"], [(1, 2), (2, 3)])
+    joined = join_sections("摘要", table)
+    assert joined == "摘要\n" + table
+    assert joined.legacy_chars == len("摘要") + 1 + table.legacy_chars
@@ -0,0 +1,72 @@
+import asyncio
+import contextvars
+from core.tool_router import ToolRouter, current_scope, set_scope
+
+def wait_for_entries(prefetcher):
+    for entry in list(prefetcher.entries.values()):
+        entry['future'].result()
+
+def test_write_tool_invalidates_prefetched_results(disk_prefetcher):
+    prefetcher, check_disk_space = disk_prefetcher
+
+    def delete_file(path):
+        return f"已删除 {path}"
+
+    check, delete = prefetcher.wrap(check_disk_space), prefetcher.wrap(delete_file)
+    assert prefetcher.start('磁盘满了，帮我删掉大文件') == {'check_disk_space': 'rule'}
+    wait_for_entries(prefetcher)
+    delete('big.iso')
+    assert check() == "可用空间 2"
+    stats = prefetcher.snapshot()
+    assert stats['hits'] == 0 and stats['wasted'] == 1 and stats['invalidated'] == 1
+
+def test_prefetched_result_is_used_without_writes(disk_prefetcher):
+    prefetcher, check_disk_space = disk_prefetcher
+    prefetcher.start('看看磁盘空间')
+    wait_for_entries(prefetcher)
+    assert prefetcher.wrap(check_disk_space)() == "可用空间 1"
+    assert prefetcher.snapshot()['hits'] == 1
+
+def test_finish_turn_discards_unused_results(disk_prefetcher):
+    prefetcher, _ = disk_prefetcher
+    prefetcher.start('看看磁盘空间')
+    prefetcher.finish_turn('看看磁盘空间', [])
+    stats = prefetcher.snapshot()
+    assert stats['pending'] == 0 and stats['wasted'] == 1
+
+def in_session(scope, func, *args):
+    """在指定会话的上下文中执行（服务模式下每个请求在自己的任务中设置会话作用域）"""
+    def run():
+        set_scope(scope)
+        return func(*args)
+    return contextvars.copy_context().run(run)
+
+def test_sessions_only_use_and_discard_their_own_results(disk_prefetcher):
+    prefetcher, check_disk_space = disk_prefetcher
+
+    def delete_file(path):
+        return f"已删除 {path}"
+
+    check, delete = prefetcher.wrap(check_disk_space), prefetcher.wrap(delete_file)
+    in_session('a', prefetcher.start, '看看磁盘空间')
+    in_session('b', prefetcher.start, '看看磁盘空间')
+    wait_for_entries(prefetcher)
+    in_session('a', delete, 'big.iso')
+    in_session('a', prefetcher.finish_turn, '看看磁盘空间', [])
+    assert prefetcher.snapshot()['pending'] == 1
+    assert in_session('c', check) == "可用空间 3"
+    assert in_session('b', check) in ("可用空间 1", "可用空间 2")
+    stats = prefetcher.snapshot()
+    assert stats['hits'] == 1 and stats['wasted'] == 1 and stats['invalidated'] == 1
+
+def test_router_runs_sync_tools_in_the_session_scope():
+    def show_scope():
+        """返回当前会话"""
+        return str(current_scope())
+
+    tool = ToolRouter({'system': [show_scope]}).tools_by_name['show_scope']
+
+    async def call():
+        set_scope('a')
+        return (await tool.acall()).content
+    assert asyncio.run(call()) == 'a'
@@ -0,0 +1,16 @@
+import time
+import asyncio
+
+def test_first_question_of_restored_session_with_shared_facts_is_cached(agent):
+    # 之前的会话记录过固定信息（桌面路径），新会话恢复时这些信息写入上下文开头
+    agent.session_store._merge_facts({'桌面路径': 'C:\\Users\\me\\Desktop'}, {'桌面路径': time.time()})
+    prompt = '如何在Windows上查看系统信息？'
+
+    async def run():
+        ctx = await agent.restore_session('new-session')
+        assert await agent.get_component('context_manager').conversation_messages(ctx) == []
+        return await agent.run_computer_expert_agent_stream(prompt, ctx=ctx, on_delta=lambda delta: None)
+
+    answer = asyncio.run(run())
+    assert answer
+    assert agent.answer_cache.lookup(prompt) == answer
@@ -0,0 +1,58 @@
+import sys
+import time
+from tools import text_entry
+from tools.action_pacing import PACER
+
+def test_untypeable_text_is_pasted_even_when_keys_requested():
+    assert text_entry.choose_method('打开控制面板', 'keys') == 'paste'
+    assert text_entry.choose_method('打开控制面板', 'typed', interval=0.05) == 'paste'
+    assert text_entry.choose_method('hello', 'keys') == 'keys'
+
+def test_keys_request_for_chinese_text_is_pasted(fake_gui, monkeypatch):
+    screen = fake_gui()
+    monkeypatch.setattr(PACER, 'enabled', False)
+    result = text_entry.enter_text('你好，世界', method='keys')
+    assert result['method'] == 'paste'
+    assert result['note']
+    assert screen.typed == '你好，世界'
+
+def test_clipboard_is_restored_after_minimum_delay(fake_gui, monkeypatch):
+    screen = fake_gui()
+    monkeypatch.setattr(PACER, 'enabled', False)
+    screen.clipboard = '原来的内容'
+    events = {}
+    pyautogui, pyperclip = sys.modules['pyautogui'], sys.modules['pyperclip']
+    hotkey, copy = pyautogui.hotkey, pyperclip.copy
+
+    def timed_hotkey(*keys):
+        events['pasted'] = time.perf_counter()
+        return hotkey(*keys)
+
+    def timed_copy(text):
+        if 'pasted' in events:
+            events['restored'] = time.perf_counter()
+        return copy(text)
+
+    monkeypatch.setattr(pyautogui, 'hotkey', timed_hotkey)
+    monkeypatch.setattr(pyperclip, 'copy', timed_copy)
+    assert text_entry._paste('要粘贴的文本') is None
+    assert events['restored'] - events['pasted'] >= text_entry.PASTE_RESTORE_DELAY
+    assert screen.clipboard == '原来的内容'
+
+def test_input_is_verified_at_the_clicked_field_not_the_pointer(fake_gui, monkeypatch):
+    fake_gui()
+    monkeypatch.setattr(PACER, 'enabled', False)
+    monkeypatch.setattr(PACER, 'focus_point', None)
+    pyautogui = sys.modules['pyautogui']
+    pyautogui.click(400, 300)
+    PACER.after_action('click', 400, 300)
+    # 点击文本框后把鼠标移开，文字仍然出现在文本框中
+    pyautogui.moveTo(1500, 900)
+    assert text_entry.enter_text('hello')['verified'] is True
+
+def test_input_is_not_verified_without_a_known_focus(fake_gui, monkeypatch):
+    fake_gui()
+    monkeypatch.setattr(PACER, 'enabled', False)
+    monkeypatch.setattr(PACER, 'focus_point', (400, 300))
+    PACER.after_action('key')
+    assert text_entry.enter_text('hello')['verified'] is None
@@ -0,0 +1,80 @@
+import time
+import asyncio
+from llama_index.core.tools import FunctionTool
+from core.work_units import WorkUnit, WorkUnitEngine
+from core.diagnosis import COLLECTORS, build_diagnosis_units, format_diagnosis
+
+def sleeping_unit(name, seconds, calls, depends_on=None, cacheable=True):
+    async def run(inputs):
+        calls.append(name)
+        await asyncio.sleep(seconds)
+        return {'name': name, 'upstream': sorted(key for key in inputs if key != 'question')}
+    return WorkUnit(name, depends_on=depends_on, run=run, cacheable=cacheable)
+
+def test_independent_units_run_concurrently(tmp_path):
+    calls = []
+    units = [sleeping_unit(f"unit{i}", 0.2, calls) for i in range(4)]
+    engine = WorkUnitEngine(cache_dir=str(tmp_path))
+    start = time.perf_counter()
+    results = asyncio.run(engine.run(units, {'question': 'q'}))
+    assert time.perf_counter() - start < 0.6
+    assert all(result.status == 'ok' for result in results.values())
+
+def test_rerun_with_same_inputs_skips_cached_units(tmp_path):
+    calls = []
+    units = [sleeping_unit('collect', 0.0, calls, cacheable=False),
+             sleeping_unit('analyze', 0.0, calls, depends_on=['collect'])]
+    engine = WorkUnitEngine(cache_dir=str(tmp_path))
+    asyncio.run(engine.run(units, {'question': 'q'}))
+    results = asyncio.run(engine.run(units, {'question': 'q'}))
+    assert results['collect'].status == 'ok'
+    assert results['analyze'].status == 'cached'
+    assert calls == ['collect', 'analyze', 'collect']
+
+def test_cache_key_uses_tool_names():
+    def get_system_info():
+        return ''
+
+    key = WorkUnit('unit', tools=[FunctionTool.from_defaults(fn=get_system_info)]).cache_key({})
+    assert key == WorkUnit('unit', tools=[FunctionTool.from_defaults(fn=get_system_info)]).cache_key({})
+    assert key == WorkUnit('unit', tools=[get_system_info]).cache_key({})
+
+def test_diagnosis_collects_concurrently_and_reports_analysis(tmp_path):
+    def resolve_tool(name):
+        def tool():
+            time.sleep(0.2)
+            return f"{name} 输出"
+        return tool
+
+    units = build_diagnosis_units(resolve_tool)
+    analysis = next(unit for unit in units if unit.name == 'analyze')
+
+    async def analyze(inputs):
+        assert set(COLLECTORS) <= set(inputs)
+        return {'causes': ['内存不足'], 'steps': ['关闭不需要的程序']}
+    analysis.run = analyze
+
+    start = time.perf_counter()
+    results = asyncio.run(WorkUnitEngine(cache_dir=str(tmp_path)).run(units, {'question': '电脑很慢'}))
+    assert time.perf_counter() - start < 0.5
+    report = format_diagnosis(results)
+    assert '内存不足' in report and '1. 关闭不需要的程序' in report
+
+def test_cache_keeps_only_recently_used_results(tmp_path):
+    calls = []
+    engine = WorkUnitEngine(cache_dir=str(tmp_path), max_cache_entries=2)
+    for question in ['q1', 'q2', 'q3']:
+        asyncio.run(engine.run([sleeping_unit('analyze', 0.0, calls)], {'question': question}))
+        time.sleep(0.01)
+    assert len(list(tmp_path.iterdir())) == 2
+    results = asyncio.run(engine.run([sleeping_unit('analyze', 0.0, calls)], {'question': 'q1'}))
+    assert results['analyze'].status == 'ok'
+    results = asyncio.run(engine.run([sleeping_unit('analyze', 0.0, calls)], {'question': 'q3'}))
+    assert results['analyze'].status == 'cached'
+
+def test_expired_cache_results_are_not_used(tmp_path):
+    calls = []
+    engine = WorkUnitEngine(cache_dir=str(tmp_path), max_cache_age_days=0)
+    asyncio.run(engine.run([sleeping_unit('analyze', 0.0, calls)], {'question': 'q'}))
+    results = asyncio.run(engine.run([sleeping_unit('analyze', 0.0, calls)], {'question': 'q'}))
+    assert results['analyze'].status == 'ok' and calls == ['analyze', 'analyze']
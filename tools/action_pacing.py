@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+from typing import Optional
+
+# 每类操作等待屏幕稳定的最长时间（秒），超过后不再等待，直接返回
+DEFAULT_SETTLE_BUDGETS = {
+    'click': 1.0,
+    'drag': 1.0,
+    'key': 0.6,
+    'type': 0.6,
+    'scroll': 0.6,
+}
+
+# 每类操作等待界面开始响应的时间（秒）：窗口、菜单通常在点击或按键后100~300ms才开始出现，
+# 这段时间内屏幕没有变化不算稳定；文本输入和滚动的效果几乎立即出现
+DEFAULT_RESPONSE_WINDOWS = {
+    'click': 0.3,
+    'drag': 0.2,
+    'key': 0.3,
+    'type': 0.1,
+    'scroll': 0.15,
+}
+
+class ActionPacer:
+    """鼠标键盘操作的节奏控制：用“等待屏幕稳定”代替固定的暂停时间
+
+    每次操作后按固定间隔截取操作位置附近的屏幕（缩小的灰度图）。界面开始响应之前屏幕也没有变化，
+    所以先在该类操作的响应时间内等待屏幕出现变化；出现变化后（或响应时间内一直没有变化时）连续几帧没有变化即认为界面已经响应完毕。
+    屏幕一直在变化（例如播放动画）时最多等待该类操作的时间预算。两次操作之间至少间隔 min_gap 秒，
+    避免输入事件过快导致应用丢失按键。
+
+    参数:
+        min_gap: 两次操作之间的最小间隔（秒）
+        settle_budgets: {操作类型: 等待屏幕稳定的最长时间（秒）}
+        response_windows: {操作类型: 等待界面开始响应的时间（秒）}
+        poll_interval: 截图比较的间隔（秒）
+        stable_frames: 连续多少次比较没有变化视为稳定（默认约100ms没有变化）
+        region_radius: 截图区域的半径（像素），只比较操作位置附近的屏幕；没有位置时比较整个屏幕
+        change_ratio: 两帧之间发生变化的像素比例低于该值视为没有变化（忽略文本光标闪烁等细小变化）
+        enabled: 为False时只保证最小间隔，不等待屏幕稳定
+    """
+
+    def __init__(self, min_gap: float = 0.03, settle_budgets: Optional[dict] = None,
+                 response_windows: Optional[dict] = None, poll_interval: float = 0.03, stable_frames: int = 3,
+                 region_radius: int = 300, change_ratio: float = 0.002, enabled: bool = True):
+        self.min_gap = min_gap
+        self.settle_budgets = dict(DEFAULT_SETTLE_BUDGETS, **(settle_budgets or {}))
+        self.response_windows = dict(DEFAULT_RESPONSE_WINDOWS, **(response_windows or {}))
+        self.poll_interval = poll_interval
+        self.stable_frames = stable_frames
+        self.region_radius = region_radius
+        self.change_ratio = change_ratio
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.last_action = 0.0
+        # 最后一次点击的位置：之后输入的文本通常出现在这里；按键（可能切换焦点）和拖动之后不再确定
+        self.focus_point = None
+        self.stats = {'actions': 0, 'gap_seconds': 0.0, 'settles': 0, 'settle_seconds': 0.0,
+                      'max_settle_seconds': 0.0, 'over_budget': 0, 'no_response': 0, 'capture_errors': 0}
+
+    @classmethod
+    def from_env(cls) -> 'ActionPacer':
+        """从环境变量读取设置：ACTION_MIN_GAP、ACTION_SETTLE_BUDGET、ACTION_RESPONSE_WINDOW（后两个所有操作类型共用）、
+        ACTION_SETTLE=0 关闭稳定检测"""
+        budget = os.environ.get('ACTION_SETTLE_BUDGET')
+        window = os.environ.get('ACTION_RESPONSE_WINDOW')
+        return cls(
+            min_gap=float(os.environ.get('ACTION_MIN_GAP', '0.03')),
+            settle_budgets={kind: float(budget) for kind in DEFAULT_SETTLE_BUDGETS} if budget else None,
+            response_windows={kind: float(window) for kind in DEFAULT_RESPONSE_WINDOWS} if window else None,
+            enabled=os.environ.get('ACTION_SETTLE', '1') != '0',
+        )
+
+    def before_action(self) -> None:
+        """保证与上一次操作之间的最小间隔"""
+        with self.lock:
+            wait = self.last_action + self.min_gap - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+                self.stats['gap_seconds'] += wait
+            self.stats['actions'] += 1
+
+    def _region(self, x: Optional[int], y: Optional[int]):
+        import pyautogui
+        width, height = pyautogui.size()
+        if x is None or y is None:
+            return (0, 0, width, height)
+        left = max(0, min(int(x) - self.region_radius, width - 1))
+        top = max(0, min(int(y) - self.region_radius, height - 1))
+        return (left, top, min(2 * self.region_radius, width - left), min(2 * self.region_radius, height - top))
+
+    def _frame(self, region):
+        import pyautogui
+        image = pyautogui.screenshot(region=region).convert('L')
+        # 缩小后比较，降低截图比较的开销
+        return image.reduce(4) if min(image.size) >= 16 else image
+
+    @staticmethod
+    def _changed_ratio(previous, current) -> float:
+        """两帧之间灰度差异超过阈值的像素比例"""
+        from PIL import ImageChops
+        if previous.size != current.size:
+            return 1.0
+        histogram = ImageChops.difference(previous, current).histogram()
+        return sum(histogram[16:]) / max(1, previous.size[0] * previous.size[1])
+
+    def snapshot(self, x: Optional[int] = None, y: Optional[int] = None):
+        """截取操作位置附近的屏幕，用于确认操作是否产生了效果；无法截图时返回None"""
+        try:
+            region = self._region(x, y)
+            return (region, self._frame(region))
+        except Exception:
+            return None
+
+    def has_changed(self, before, after) -> Optional[bool]:
+        """比较两次 snapshot 的结果，无法判断时返回None"""
+        if before is None or after is None or before[0] != after[0]:
+            return None
+        return self._changed_ratio(before[1], after[1]) > 0
+
+    def after_action(self, kind: str, x: Optional[int] = None, y: Optional[int] = None) -> float:
+        """操作结束后等待界面响应并稳定，返回等待的时间（秒）
+
+        参数:
+            kind: 操作类型（click、drag、key、type、scroll），决定等待响应的时间和最长等待时间
+            x: 操作位置X坐标（可选）
+            y: 操作位置Y坐标（可选）
+        """
+        start = time.perf_counter()
+        # 最小间隔从输入事件发出时算起，等待屏幕稳定的时间也计入间隔
+        with self.lock:
+            self.last_action = start
+            if kind == 'click' and x is not None and y is not None:
+                self.focus_point = (int(x), int(y))
+            elif kind in ('key', 'drag'):
+                self.focus_point = None
+        if self.enabled:
+            budget = self.settle_budgets.get(kind, 0.5)
+            window = min(self.response_windows.get(kind, 0.2), budget)
+            try:
+                region = self._region(x, y)
+                previous = self._frame(region)
+                stable = 0
+                responded = False
+                # 稳定：屏幕已经开始响应（或响应时间内一直没有变化），并且之后连续几帧没有变化
+                while stable < self.stable_frames or not (responded or time.perf_counter() - start >= window):
+                    if time.perf_counter() - start >= budget:
+                        self.stats['over_budget'] += 1
+                        break
+                    time.sleep(self.poll_interval)
+                    current = self._frame(region)
+                    if self._changed_ratio(previous, current) < self.change_ratio:
+                        stable += 1
+                    else:
+                        stable = 0
+                        responded = True
+                    previous = current
+                if not responded:
+                    self.stats['no_response'] += 1
+            except Exception:
+                # 无法截图时（例如没有桌面会话）退回到最小间隔
+                self.stats['capture_errors'] += 1
+        waited = time.perf_counter() - start
+        with self.lock:
+            self.stats['settles'] += 1
+            self.stats['settle_seconds'] += waited
+            self.stats['max_settle_seconds'] = max(self.stats['max_settle_seconds'], waited)
+        return waited
+
+    def mark_action(self) -> None:
+        """记录一次不需要等待屏幕稳定的操作（例如移动鼠标），只用于计算下一次操作的最小间隔"""
+        with self.lock:
+            self.last_action = time.perf_counter()
+
+    def format_stats(self) -> str:
+        stats = self.stats
+        average = stats['settle_seconds'] / stats['settles'] * 1000 if stats['settles'] else 0
+        return (f"操作节奏: {stats['actions']} 次操作, 等待屏幕稳定 {stats['settles']} 次 (平均 {average:.0f}ms, "
+                f"最长 {stats['max_settle_seconds'] * 1000:.0f}ms, 超出预算 {stats['over_budget']} 次, "
+                f"屏幕没有变化 {stats['no_response']} 次), "
+                f"最小间隔等待 {stats['gap_seconds'] * 1000:.0f}ms")
+
+# 所有鼠标键盘工具共用的节奏控制
+PACER = ActionPacer.from_env()
@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional
+from tools.result_format import format_table, join_sections
+
+# 缓存目录位于项目根目录下
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache')
+DISK_USAGE_CACHE_FILE = os.path.join(CACHE_DIR, 'disk_usage_cache.json')
+
+# 重复文件检测时读取的文件头尾块大小
+PARTIAL_HASH_BLOCK = 64 * 1024
+FULL_HASH_CHUNK = 1024 * 1024
+
+# 磁盘占用缓存最多保存的目录数，超过时删除最久未使用的目录
+DISK_USAGE_CACHE_MAX_ENTRIES = 20000
+# 缓存的目录统计的有效期（秒）：文件原地变大不会改变目录修改时间，超过有效期后重新扫描
+DISK_USAGE_CACHE_MAX_AGE = 3600
+
+# 每个目录的直接子项统计，按目录修改时间和有效期校验，进程内共享
+_disk_usage_cache = None
+_disk_usage_cache_lock = threading.Lock()
+
+def _format_size(size_bytes: float) -> str:
+    """把字节数格式化为易读的大小"""
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size_bytes < 1024 or unit == 'TB':
+            return f"{size_bytes:.2f} {unit}"
+        size_bytes /= 1024
+
+def _load_disk_usage_cache() -> dict:
+    """加载磁盘占用缓存（只在首次使用时读取磁盘）"""
+    global _disk_usage_cache
+    with _disk_usage_cache_lock:
+        if _disk_usage_cache is None:
+            try:
+                with open(DISK_USAGE_CACHE_FILE, 'r', encoding='utf-8') as f:
+                    _disk_usage_cache = json.load(f)
+            except (OSError, ValueError):
+                _disk_usage_cache = {}
+        return _disk_usage_cache
+
+def _save_disk_usage_cache() -> None:
+    """按最近使用时间淘汰超出数量上限的目录，再把磁盘占用缓存写回磁盘"""
+    with _disk_usage_cache_lock:
+        if _disk_usage_cache is None:
+            return
+        if len(_disk_usage_cache) > DISK_USAGE_CACHE_MAX_ENTRIES:
+            by_use = sorted(_disk_usage_cache, key=lambda p: _disk_usage_cache[p].get('used', 0))
+            for path in by_use[:len(_disk_usage_cache) - DISK_USAGE_CACHE_MAX_ENTRIES]:
+                del _disk_usage_cache[path]
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temp_file = DISK_USAGE_CACHE_FILE + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(_disk_usage_cache, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_file, DISK_USAGE_CACHE_FILE)
+
+def _scan_single_directory(path: str, use_cache: bool) -> tuple:
+    """统计单个目录的直接文件大小、按扩展名的大小和子目录列表
+
+    目录修改时间未变化且缓存未超过有效期时直接返回缓存结果。返回 (记录, 是否命中缓存)，无法访问时记录为None。
+    """
+    cache = _load_disk_usage_cache()
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None, False
+
+    now = time.time()
+    if use_cache:
+        record = cache.get(path)
+        if record and record.get('mtime') == mtime and now - record.get('scanned', 0) <= DISK_USAGE_CACHE_MAX_AGE:
+            record['used'] = now
+            return record, True
+
+    size = 0
+    files = 0
+    extensions = {}
+    dirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        file_size = entry.stat(follow_symlinks=False).st_size
+                        size += file_size
+                        files += 1
+                        ext = os.path.splitext(entry.name)[1].lower() or '(无扩展名)'
+                        ext_size, ext_count = extensions.get(ext, (0, 0))
+                        extensions[ext] = (ext_size + file_size, ext_count + 1)
+                except OSError:
+                    continue
+    except OSError:
+        return None, False
+
+    record = {'mtime': mtime, 'scanned': now, 'used': now, 'size': size, 'files': files, 'ext': extensions, 'dirs': dirs}
+    with _disk_usage_cache_lock:
+        cache[path] = record
+    return record, False
+
+def _walk_directory_parallel(root: str, max_workers: int, use_cache: bool) -> tuple:
+    """并行遍历目录树，返回 (路径 -> 记录, 缓存命中数, 无法访问的目录数)
+
+    要分析的目录本身总是重新扫描（只有一层，开销很小），其中原地变大的文件可以立即反映出来。
+    """
+    records = {}
+    cache_hits = 0
+    errors = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pending = {executor.submit(_scan_single_directory, root, False): root}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                record, hit = future.result()
+                if record is None:
+                    errors += 1
+                    continue
+                records[path] = record
+                cache_hits += hit
+                for child in record['dirs']:
+                    child_path = os.path.join(path, child)
+                    pending[executor.submit(_scan_single_directory, child_path, use_cache)] = child_path
+    return records, cache_hits, errors
+
+def analyze_disk_usage(directory_path: str, top_n: int = 10, max_workers: int = 8, use_cache: bool = True) -> str:
+    """分析目录的空间占用情况，列出占用最大的子目录和文件类型
+
+    参数:
+        directory_path: 要分析的目录路径，例如 'C:\\' 或 'C:\\Users'
+        top_n: 报告中列出的子目录和文件类型数量
+        max_workers: 并行扫描的线程数
+        use_cache: 是否使用缓存的目录统计（按目录修改时间和有效期校验，之后深入查看子目录时几乎无需重新扫描）
+    """
+    try:
+        if not os.path.isdir(directory_path):
+            return f"路径 '{directory_path}' 不是一个有效的目录"
+
+        start_time = time.time()
+        root = os.path.abspath(directory_path)
+        records, cache_hits, errors = _walk_directory_parallel(root, max_workers, use_cache)
+        # 除重新扫描的根目录外都命中缓存时不必重写缓存文件
+        if cache_hits < len(records) - 1:
+            _save_disk_usage_cache()
+        if root not in records:
+            return f"无法访问目录 '{directory_path}'"
+
+        # 自底向上汇总每个目录的总大小
+        totals = {}
+        extensions = {}
+        total_files = 0
+        for path in sorted(records, key=lambda p: p.count(os.sep), reverse=True):
+            record = records[path]
+            totals[path] = record['size'] + sum(totals.get(os.path.join(path, child), 0) for child in record['dirs'])
+            total_files += record['files']
+            for ext, (ext_size, ext_count) in record['ext'].items():
+                size, count = extensions.get(ext, (0, 0))
+                extensions[ext] = (size + ext_size, count + ext_count)
+
+        total_size = totals[root]
+        elapsed_time = time.time() - start_time
+        lines = [
+            f"目录 '{root}' 共占用 {_format_size(total_size)} (文件 {total_files} 个, 目录 {len(records)} 个), "
+            f"耗时 {elapsed_time:.2f} 秒, 缓存命中 {cache_hits}/{len(records)}"
+        ]
+        if errors:
+            lines.append(f"有 {errors} 个目录无法访问，已跳过")
+
+        children = [(totals.get(os.path.join(root, child), 0), child) for child in records[root]['dirs']]
+        children.append((records[root]['size'], '(当前目录下的文件)'))
+        children.sort(reverse=True)
+        lines.append(format_table(f"占用最大的子目录 (前 {top_n})", ["大小", "占比%", "名称"],
+                                  [(_format_size(size), round(size / total_size * 100 if total_size else 0, 1), name)
+                                   for size, name in children[:top_n]]))
+        lines.append(format_table(f"占用最大的文件类型 (前 {top_n})", ["大小", "文件数", "类型"],
+                                  [(_format_size(size), count, ext) for ext, (size, count)
+                                   in sorted(extensions.items(), key=lambda item: item[1][0], reverse=True)[:top_n]]))
+        return join_sections(*lines)
+    except Exception as e:
+        return f"分析磁盘占用时出错: {str(e)}"
+
+def _list_directory_files(path: str) -> tuple:
+    """返回目录下的 (文件路径, 大小) 列表和子目录路径列表"""
+    files = []
+    dirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        files.append((entry.path, entry.stat(follow_symlinks=False).st_size))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, dirs
+
+def _collect_files_parallel(root: str, max_workers: int) -> list:
+    """并行遍历目录树，返回所有文件的 (路径, 大小)"""
+    all_files = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pending = {executor.submit(_list_directory_files, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs = future.result()
+                all_files.extend(files)
+                pending.update(executor.submit(_list_directory_files, d) for d in dirs)
+    return all_files
+
+def _hash_file_partial(path: str, size: int) -> Optional[str]:
+    """计算文件头部和尾部数据块的哈希；小文件会读取全部内容"""
+    try:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            digest.update(f.read(PARTIAL_HASH_BLOCK))
+            if size > PARTIAL_HASH_BLOCK * 2:
+                f.seek(-PARTIAL_HASH_BLOCK, os.SEEK_END)
+                digest.update(f.read(PARTIAL_HASH_BLOCK))
+            elif size > PARTIAL_HASH_BLOCK:
+                digest.update(f.read())
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+def _partial_hash_key(item: tuple) -> Optional[tuple]:
+    """返回 (大小, 头尾哈希) 作为分组键，无法读取时返回None"""
+    path, size = item
+    digest = _hash_file_partial(path, size)
+    return (size, digest) if digest is not None else None
+
+def _hash_file_full(path: str) -> Optional[str]:
+    """计算文件完整内容的哈希（在进程池中执行）"""
+    try:
+        digest = hashlib.blake2b(digest_size=32)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(FULL_HASH_CHUNK), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+def _group_by(items: list, key_function, executor) -> list:
+    """用执行器并行计算每一项的键，返回包含至少两项的分组"""
+    groups = {}
+    keys = executor.map(key_function, items)
+    for item, key in zip(items, keys):
+        if key is not None:
+            groups.setdefault(key, []).append(item)
+    return [group for group in groups.values() if len(group) > 1]
+
+def find_duplicates(directory_path: str, min_size: int = 1, max_groups: int = 20, max_workers: int = 8) -> str:
+    """查找目录中内容完全相同的重复文件，并统计可释放的空间
+
+    先按文件大小分组，再比较文件头尾数据块的哈希，最后只对仍然相同的候选文件计算完整哈希。
+
+    参数:
+        directory_path: 要查找的目录路径
+        min_size: 参与比较的最小文件大小（字节），可用于忽略小文件
+        max_groups: 报告中最多列出的重复文件组数量（按可释放空间排序）
+        max_workers: 并行遍历和读取文件的线程数
+    """
+    try:
+        if not os.path.isdir(directory_path):
+            return f"路径 '{directory_path}' 不是一个有效的目录"
+
+        start_time = time.time()
+        files = _collect_files_parallel(os.path.abspath(directory_path), max_workers)
+        total_scanned = len(files)
+
+        # 第一步：只有大小相同的文件才可能重复
+        size_groups = {}
+        for path, size in files:
+            if size >= max(min_size, 1):
+                size_groups.setdefault(size, []).append(path)
+        candidates = [(path, size) for size, paths in size_groups.items() if len(paths) > 1 for path in paths]
+        bytes_read = 0
+
+        # 第二步：比较头尾数据块
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            partial_groups = _group_by(candidates, _partial_hash_key, executor)
+        bytes_read += sum(min(size, PARTIAL_HASH_BLOCK * 2) for _, size in candidates)
+
+        # 第三步：头尾相同的大文件再计算完整哈希；小文件的头尾块已经覆盖全部内容
+        duplicate_groups = [group for group in partial_groups if group[0][1] <= PARTIAL_HASH_BLOCK * 2]
+        full_candidates = [item for group in partial_groups if group[0][1] > PARTIAL_HASH_BLOCK * 2 for item in group]
+        if full_candidates:
+            paths = [path for path, _ in full_candidates]
+            try:
+                with ProcessPoolExecutor(max_workers=min(max(1, max_workers), os.cpu_count() or 1)) as executor:
+                    full_hashes = list(executor.map(_hash_file_full, paths, chunksize=4))
+            except Exception:
+                # 无法创建进程池时（例如受限环境）退回到线程池
+                with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                    full_hashes = list(executor.map(_hash_file_full, paths))
+            bytes_read += sum(size for _, size in full_candidates)
+            full_groups = {}
+            for item, digest in zip(full_candidates, full_hashes):
+                if digest is not None:
+                    full_groups.setdefault((item[1], digest), []).append(item)
+            duplicate_groups.extend(group for group in full_groups.values() if len(group) > 1)
+
+        if not duplicate_groups:
+            return f"在 '{directory_path}' 中扫描了 {total_scanned} 个文件，未发现重复文件 (耗时 {time.time() - start_time:.2f} 秒)"
+
+        # 每组保留一个文件，其余文件占用的空间可以释放
+        duplicate_groups.sort(key=lambda group: group[0][1] * (len(group) - 1), reverse=True)
+        reclaimable = sum(group[0][1] * (len(group) - 1) for group in duplicate_groups)
+        naive_bytes = sum(size for _, size in files if size >= max(min_size, 1))
+        lines = [
+            f"在 '{directory_path}' 中扫描了 {total_scanned} 个文件，发现 {len(duplicate_groups)} 组重复文件，"
+            f"共可释放 {_format_size(reclaimable)} (耗时 {time.time() - start_time:.2f} 秒, "
+            f"读取 {_format_size(bytes_read)}，完整哈希需读取 {_format_size(naive_bytes)})"
+        ]
+        # 每组一行，输出过长被截断时保留完整的组
+        lines.append(format_table("重复文件组", ["组", "文件数", "每个大小", "可释放", "文件（; 分隔）"],
+                                  [(index, len(group), _format_size(group[0][1]), _format_size(group[0][1] * (len(group) - 1)),
+                                    "; ".join(path for path, _ in sorted(group)))
+                                   for index, group in enumerate(duplicate_groups[:max_groups], 1)]))
+        if len(duplicate_groups) > max_groups:
+            lines.append(f"... 另有 {len(duplicate_groups) - max_groups} 组未列出")
+        return join_sections(*lines)
+    except Exception as e:
+        return f"查找重复文件时出错: {str(e)}"
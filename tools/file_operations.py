@@ -3,6 +3,8 @@ import shutil
 import time
 from datetime import datetime
 from typing import List, Optional
+from tools.text_search import BM25Index, estimate_tokens, split_markdown_sections
+from tools.result_format import format_size, format_table
 
 def create_folder(folder_path: str) -> str:
     """创建新文件夹
@@ -148,22 +150,13 @@ def list_directory(directory_path: str, show_hidden: bool = False) -> str:
                 
                 item_path = os.path.join(directory_path, item)
                 is_dir = os.path.isdir(item_path)
-                item_type = "[目录]" if is_dir else "[文件]"
-                
-                # 如果是文件，获取大小
-                if not is_dir:
-                    size = os.path.getsize(item_path)
-                    def format_size(size_bytes):
-                        for unit in ['B', 'KB', 'MB', 'GB']:
-                            if size_bytes < 1024 or unit == 'GB':
-                                return f"{size_bytes:.2f} {unit}"
-                            size_bytes /= 1024
-                    items.append(f"{item_type} {item} - {format_size(size)}")
-                else:
-                    items.append(f"{item_type} {item}")
+                # 目录不显示大小
+                items.append((item, "目录" if is_dir else "文件", "" if is_dir else format_size(os.path.getsize(item_path))))
             
             if items:
-                return f"目录 '{directory_path}' 的内容 ({len(items)} 项):\n" + "\n".join(items)
+                # 目录在前，输出过长被截断时先看到目录结构
+                items.sort(key=lambda entry: (entry[1] != "目录", entry[0].lower()))
+                return format_table(f"目录 '{directory_path}' 的内容", ["名称", "类型", "大小"], items)
             else:
                 return f"目录 '{directory_path}' 为空"
         else:
@@ -254,8 +247,34 @@ def get_desktop_path() -> str:
     except Exception as e:
         return f"获取桌面路径时出错: {str(e)}"
 
-def read_tutorial() -> str:
-    """读取教程文档内容，提供给AI作为参考资料"""
+# 教程索引缓存：只在教程文件修改时间变化时重新解析
+_tutorial_index = None
+
+def _load_tutorial_index(tutorial_path: str) -> dict:
+    """按章节解析教程并建立检索索引，文件未修改时直接复用内存中的索引"""
+    global _tutorial_index
+    mtime = os.path.getmtime(tutorial_path)
+    if _tutorial_index is None or _tutorial_index['path'] != tutorial_path or _tutorial_index['mtime'] != mtime:
+        with open(tutorial_path, 'r', encoding='utf-8') as f:
+            sections = split_markdown_sections(f.read())
+        # 标题在检索时权重更高，因此重复一次
+        documents = [f"{title}\n{title}\n{body}" for title, body in sections]
+        _tutorial_index = {
+            'path': tutorial_path,
+            'mtime': mtime,
+            'sections': sections,
+            'index': BM25Index(documents),
+        }
+    return _tutorial_index
+
+def read_tutorial(query: str = "", top_k: int = 3, max_tokens: int = 1500) -> str:
+    """检索教程文档中与问题最相关的章节，提供给AI作为参考资料
+    
+    参数:
+        query: 检索关键词或用户问题，例如 '如何创建文件夹'；为空时返回教程目录
+        top_k: 最多返回的章节数量
+        max_tokens: 返回内容的大致token上限
+    """
     try:
         # 获取脚本所在目录
         script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -263,12 +282,296 @@ def read_tutorial() -> str:
         
         if os.path.isfile(tutorial_path):
             try:
-                with open(tutorial_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                return f"教程文档内容：\n{content}"
+                tutorial = _load_tutorial_index(tutorial_path)
             except Exception as e:
                 return f"读取教程文档时出错：{str(e)}"
+            
+            sections = tutorial['sections']
+            if not query.strip():
+                titles = "\n".join(f"- {title}" for title, _ in sections)
+                return f"教程文档目录（请使用query参数检索具体章节）：\n{titles}"
+            
+            results = []
+            used_tokens = 0
+            for doc_id, _ in tutorial['index'].search(query, top_k):
+                title, body = sections[doc_id]
+                section_text = f"## {title}\n{body}"
+                section_tokens = estimate_tokens(section_text)
+                # 至少返回一个章节，其余章节在预算内才返回
+                if results and used_tokens + section_tokens > max_tokens:
+                    break
+                results.append(section_text)
+                used_tokens += section_tokens
+            
+            if not results:
+                return f"教程文档中没有与 '{query}' 相关的内容"
+            return f"教程文档中与 '{query}' 相关的内容：\n\n" + "\n\n".join(results)
         else:
             return f"教程文档不存在于路径：{tutorial_path}"
     except Exception as e:
         return f"查找教程文档时出错：{str(e)}"
+
+# 批量操作支持的操作类型及其需要的参数
+BATCH_OPERATION_FIELDS = {
+    'create_folder': ('path',),
+    'write_file': ('path',),
+    'delete_file': ('path',),
+    'copy_file': ('source', 'destination'),
+    'move_file': ('source', 'destination'),
+}
+
+def _normalize_path(path: str) -> str:
+    """规范化路径，便于比较两个操作是否涉及同一路径"""
+    return os.path.normcase(os.path.abspath(path))
+
+def _paths_conflict(path_a: str, path_b: str) -> bool:
+    """判断两个路径是否相同或存在包含关系"""
+    if path_a == path_b:
+        return True
+    return path_a.startswith(path_b.rstrip(os.sep) + os.sep) or path_b.startswith(path_a.rstrip(os.sep) + os.sep)
+
+def _operation_paths(operation: dict) -> List[str]:
+    """返回操作涉及的所有规范化路径"""
+    return [_normalize_path(operation[field]) for field in BATCH_OPERATION_FIELDS[operation['op']]]
+
+def _validate_batch(operations: List[dict]) -> List[str]:
+    """在执行前校验全部操作，按顺序模拟文件系统状态，返回错误列表"""
+    errors = []
+    # 模拟状态：路径 -> 'file' / 'dir' / None（已删除）
+    virtual = {}
+
+    def kind_of(path):
+        if path in virtual:
+            return virtual[path]
+        if os.path.isdir(path):
+            return 'dir'
+        if os.path.isfile(path):
+            return 'file'
+        return None
+
+    for index, operation in enumerate(operations, 1):
+        if not isinstance(operation, dict):
+            errors.append(f"第 {index} 项不是有效的操作字典")
+            continue
+        op = operation.get('op')
+        if op not in BATCH_OPERATION_FIELDS:
+            errors.append(f"第 {index} 项的操作类型 '{op}' 不受支持，支持: {', '.join(BATCH_OPERATION_FIELDS)}")
+            continue
+        missing = [field for field in BATCH_OPERATION_FIELDS[op] if not operation.get(field)]
+        if missing:
+            errors.append(f"第 {index} 项 ({op}) 缺少参数: {', '.join(missing)}")
+            continue
+
+        if op == 'create_folder':
+            path = _normalize_path(operation['path'])
+            if kind_of(path) == 'file':
+                errors.append(f"第 {index} 项: '{operation['path']}' 已存在同名文件")
+            else:
+                virtual[path] = 'dir'
+        elif op == 'write_file':
+            path = _normalize_path(operation['path'])
+            if kind_of(path) == 'dir':
+                errors.append(f"第 {index} 项: '{operation['path']}' 是一个目录")
+            else:
+                virtual[path] = 'file'
+        elif op == 'delete_file':
+            path = _normalize_path(operation['path'])
+            if kind_of(path) != 'file':
+                errors.append(f"第 {index} 项: '{operation['path']}' 不是一个有效的文件")
+            else:
+                virtual[path] = None
+        else:
+            source = _normalize_path(operation['source'])
+            destination = _normalize_path(operation['destination'])
+            source_kind = kind_of(source)
+            if op == 'copy_file' and source_kind != 'file':
+                errors.append(f"第 {index} 项: 源路径 '{operation['source']}' 不是一个有效的文件")
+                continue
+            if op == 'move_file' and source_kind is None:
+                errors.append(f"第 {index} 项: 源路径 '{operation['source']}' 不存在")
+                continue
+            if kind_of(destination) == 'dir':
+                destination = os.path.join(destination, os.path.basename(source))
+            if _paths_conflict(source, destination) and source_kind == 'dir':
+                errors.append(f"第 {index} 项: 不能把目录移动到其自身内部")
+                continue
+            virtual[destination] = source_kind
+            if op == 'move_file':
+                virtual[source] = None
+    return errors
+
+def _plan_batch_levels(operations: List[dict]) -> List[int]:
+    """计算每个操作的执行批次：涉及相同或嵌套路径的操作保持原有先后顺序，其余操作可并行"""
+    levels = []
+    paths = [_operation_paths(operation) for operation in operations]
+    for index, own_paths in enumerate(paths):
+        level = 0
+        for earlier in range(index):
+            if any(_paths_conflict(a, b) for a in own_paths for b in paths[earlier]):
+                level = max(level, levels[earlier] + 1)
+        levels.append(level)
+    return levels
+
+def _backup_path(journal_dir: str, path: str, index: int) -> str:
+    """为即将被覆盖或删除的文件生成备份路径"""
+    return os.path.join(journal_dir, f"{index}_{os.path.basename(path)}")
+
+def _execute_batch_operation(operation: dict, index: int, journal_dir: str) -> List[tuple]:
+    """执行单个操作，返回用于回滚的日志条目（按撤销顺序排列）"""
+    op = operation['op']
+    undo = []
+    if op == 'create_folder':
+        path = os.path.abspath(operation['path'])
+        # 记录将要新建的每一级目录，回滚时由内向外删除
+        created = []
+        current = path
+        while current and not os.path.exists(current):
+            created.append(current)
+            parent = os.path.dirname(current)
+            if parent == current:
+                break
+            current = parent
+        os.makedirs(path, exist_ok=True)
+        undo.extend(('rmdir', folder) for folder in created)
+    elif op == 'write_file':
+        path = os.path.abspath(operation['path'])
+        if os.path.exists(path):
+            backup = _backup_path(journal_dir, path, index)
+            shutil.copy2(path, backup)
+            undo.append(('restore', backup, path))
+        else:
+            undo.append(('remove', path))
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(operation.get('content', ''))
+    elif op == 'delete_file':
+        path = os.path.abspath(operation['path'])
+        # 删除时先移入回滚日志目录，全部成功后再真正清理
+        backup = _backup_path(journal_dir, path, index)
+        shutil.move(path, backup)
+        undo.append(('restore', backup, path))
+    else:
+        source = os.path.abspath(operation['source'])
+        destination = os.path.abspath(operation['destination'])
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+        destination_dir = os.path.dirname(destination)
+        if destination_dir and not os.path.exists(destination_dir):
+            os.makedirs(destination_dir, exist_ok=True)
+        if os.path.isfile(destination):
+            backup = _backup_path(journal_dir, destination, index)
+            shutil.copy2(destination, backup)
+            undo.append(('restore', backup, destination))
+        else:
+            undo.append(('remove', destination))
+        if op == 'copy_file':
+            shutil.copy2(source, destination)
+        else:
+            shutil.move(source, destination)
+            # 撤销移动时先把文件移回原处，再恢复被覆盖的目标文件
+            undo.insert(0, ('move_back', destination, source))
+    return undo
+
+def _undo_batch_entry(entry: tuple) -> None:
+    """执行一条回滚日志"""
+    action = entry[0]
+    if action == 'rmdir':
+        if os.path.isdir(entry[1]) and not os.listdir(entry[1]):
+            os.rmdir(entry[1])
+    elif action == 'remove':
+        if os.path.isfile(entry[1]):
+            os.remove(entry[1])
+    elif action == 'restore':
+        shutil.move(entry[1], entry[2])
+    elif action == 'move_back':
+        shutil.move(entry[1], entry[2])
+
+def _describe_batch_operation(operation: dict) -> str:
+    """生成操作的简短描述，用于结果表"""
+    if 'source' in BATCH_OPERATION_FIELDS.get(operation.get('op'), ()):
+        return f"{operation.get('source')} -> {operation.get('destination')}"
+    return str(operation.get('path'))
+
+def batch_file_ops(operations: List[dict], dry_run: bool = False, rollback_on_error: bool = True, max_workers: int = 4) -> str:
+    """批量执行文件操作，一次调用完成多个创建、写入、复制、移动和删除操作
+    
+    参数:
+        operations: 操作列表，每项为一个字典，'op' 为操作类型:
+            - {'op': 'create_folder', 'path': 文件夹路径}
+            - {'op': 'write_file', 'path': 文件路径, 'content': 文件内容}
+            - {'op': 'delete_file', 'path': 文件路径}
+            - {'op': 'copy_file', 'source': 源路径, 'destination': 目标路径}
+            - {'op': 'move_file', 'source': 源路径, 'destination': 目标路径}
+        dry_run: 为True时只校验并返回执行计划，不修改任何文件
+        rollback_on_error: 任一操作失败时，是否按回滚日志撤销本批次已完成的操作
+        max_workers: 同一批次内并行执行的最大线程数
+    """
+    try:
+        if not operations:
+            return "没有需要执行的文件操作"
+
+        # 执行前统一校验，任何一项不合法都不执行
+        errors = _validate_batch(operations)
+        if errors:
+            return f"批量操作校验失败，未执行任何操作 ({len(errors)} 个错误):\n" + "\n".join(errors)
+
+        levels = _plan_batch_levels(operations)
+        if dry_run:
+            rows = [f"{i}\t批次{levels[i - 1] + 1}\t{op['op']}\t{_describe_batch_operation(op)}"
+                    for i, op in enumerate(operations, 1)]
+            return (f"预演模式：{len(operations)} 个操作校验通过，共 {max(levels) + 1} 个批次\n"
+                    "序号\t批次\t操作\t路径\n" + "\n".join(rows))
+
+        from concurrent.futures import ThreadPoolExecutor
+        import tempfile
+
+        start_time = time.time()
+        journal_dir = tempfile.mkdtemp(prefix='batch_file_ops_')
+        statuses = ['跳过'] * len(operations)
+        messages = [''] * len(operations)
+        journal = []  # 按完成顺序记录每个操作的回滚条目
+        failed = False
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            for level in range(max(levels) + 1):
+                indexes = [i for i, lv in enumerate(levels) if lv == level]
+                futures = {i: executor.submit(_execute_batch_operation, operations[i], i, journal_dir) for i in indexes}
+                for i, future in futures.items():
+                    try:
+                        journal.append(future.result())
+                        statuses[i] = '成功'
+                    except Exception as e:
+                        statuses[i] = '失败'
+                        messages[i] = str(e)
+                        failed = True
+                if failed:
+                    break
+
+        rolled_back = False
+        if failed and rollback_on_error:
+            for undo in reversed(journal):
+                for entry in undo:
+                    try:
+                        _undo_batch_entry(entry)
+                    except Exception as e:
+                        messages.append(f"回滚出错: {str(e)}")
+            statuses = ['已回滚' if status == '成功' else status for status in statuses]
+            rolled_back = True
+        shutil.rmtree(journal_dir, ignore_errors=True)
+
+        elapsed_time = time.time() - start_time
+        summary = (f"批量文件操作{'失败' if failed else '完成'}: 成功 {statuses.count('成功')}, "
+                   f"失败 {statuses.count('失败')}, 跳过 {statuses.count('跳过')}"
+                   f"{', 已回滚 ' + str(statuses.count('已回滚')) if rolled_back else ''} (耗时 {elapsed_time:.2f} 秒)")
+        rows = []
+        for i, operation in enumerate(operations):
+            row = f"{i + 1}\t{statuses[i]}\t{operation['op']}\t{_describe_batch_operation(operation)}"
+            if messages[i]:
+                row += f"\t{messages[i]}"
+            rows.append(row)
+        extra = messages[len(operations):]
+        return summary + "\n序号\t状态\t操作\t路径\n" + "\n".join(rows + extra)
+    except Exception as e:
+        return f"批量执行文件操作时出错: {str(e)}"
@@ -0,0 +1,223 @@
+import os
+import time
+import fnmatch
+import select
+import ctypes
+import ctypes.util
+from typing import List, Optional
+
+# 下载过程中浏览器使用的临时文件后缀，这些文件不算作“已完成”
+TEMP_DOWNLOAD_SUFFIXES = ('.crdownload', '.part', '.partial', '.download', '.tmp')
+
+# 没有系统通知机制时的轮询间隔（秒）
+POLL_INTERVAL = 0.5
+
+class _PollingWatcher:
+    """没有系统通知机制时的回退实现：定时唤醒"""
+    backend = '轮询'
+
+    def wait(self, timeout: float) -> bool:
+        time.sleep(max(0.0, min(timeout, POLL_INTERVAL)))
+        return True
+
+    def close(self) -> None:
+        pass
+
+class _InotifyWatcher:
+    """基于Linux inotify的目录变化通知"""
+    backend = 'inotify'
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_MASK = 0x002 | 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+
+    def __init__(self, directories: List[str]):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+        for directory in directories:
+            if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.EVENT_MASK) < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"无法监视目录 '{directory}'")
+
+    def wait(self, timeout: float) -> bool:
+        readable, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not readable:
+            return False
+        # 读空事件队列，具体变化由调用方重新检查文件状态得出
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class _WindowsChangeWatcher:
+    """基于Windows目录变化通知句柄的实现"""
+    backend = 'FindFirstChangeNotification'
+    # FILE_NOTIFY_CHANGE_FILE_NAME | DIR_NAME | SIZE | LAST_WRITE
+    NOTIFY_FILTER = 0x001 | 0x002 | 0x008 | 0x010
+    INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+    WAIT_TIMEOUT = 0x102
+    MAXIMUM_WAIT_OBJECTS = 64
+
+    def __init__(self, directories: List[str]):
+        self.kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self.kernel32.FindFirstChangeNotificationW.restype = ctypes.c_void_p
+        self.kernel32.FindFirstChangeNotificationW.argtypes = [ctypes.c_wchar_p, ctypes.c_int, ctypes.c_uint32]
+        self.kernel32.FindNextChangeNotification.argtypes = [ctypes.c_void_p]
+        self.kernel32.FindCloseChangeNotification.argtypes = [ctypes.c_void_p]
+        if len(directories) > self.MAXIMUM_WAIT_OBJECTS:
+            raise OSError(f"最多同时监视 {self.MAXIMUM_WAIT_OBJECTS} 个目录")
+        self.handles = []
+        for directory in directories:
+            handle = self.kernel32.FindFirstChangeNotificationW(directory, False, self.NOTIFY_FILTER)
+            if handle is None or handle == self.INVALID_HANDLE_VALUE:
+                self.close()
+                raise ctypes.WinError(ctypes.get_last_error())
+            self.handles.append(handle)
+        self.handle_array = (ctypes.c_void_p * len(self.handles))(*self.handles)
+
+    def wait(self, timeout: float) -> bool:
+        result = self.kernel32.WaitForMultipleObjects(
+            len(self.handles), self.handle_array, False, int(max(0.0, timeout) * 1000)
+        )
+        if result == self.WAIT_TIMEOUT or result >= len(self.handles):
+            return False
+        # 重新启用被触发的通知句柄
+        self.kernel32.FindNextChangeNotification(self.handles[result])
+        return True
+
+    def close(self) -> None:
+        for handle in self.handles:
+            self.kernel32.FindCloseChangeNotification(handle)
+        self.handles = []
+
+def _create_watcher(directories: List[str]):
+    """根据操作系统选择变化通知实现，失败时回退到轮询"""
+    try:
+        if os.name == 'nt':
+            return _WindowsChangeWatcher(directories)
+        if hasattr(select, 'select') and os.path.isdir('/proc/sys/fs/inotify'):
+            return _InotifyWatcher(directories)
+    except Exception:
+        pass
+    return _PollingWatcher()
+
+def _file_signature(path: str) -> Optional[tuple]:
+    """返回文件的 (大小, 修改时间)，文件不存在时返回None"""
+    try:
+        stats = os.stat(path)
+        return stats.st_size, stats.st_mtime
+    except OSError:
+        return None
+
+def _directory_snapshot(directory: str, pattern: Optional[str]) -> dict:
+    """返回目录中匹配模式的文件 -> (大小, 修改时间)"""
+    snapshot = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if pattern and not fnmatch.fnmatch(entry.name.lower(), pattern.lower()):
+                    continue
+                try:
+                    if entry.is_file():
+                        stats = entry.stat()
+                        snapshot[entry.path] = (stats.st_size, stats.st_mtime)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return snapshot
+
+def wait_for_file_event(paths: List[str], event: str = 'stable', timeout: int = 60, debounce: float = 2.0, pattern: Optional[str] = None) -> str:
+    """等待文件出现、被修改或写入完成（大小稳定），使用系统文件变化通知而不是反复查询
+
+    参数:
+        paths: 要监视的路径列表。可以是文件（可以尚不存在），也可以是目录（监视目录中的文件）
+        event: 等待的事件类型:
+            - 'created': 文件出现（目录中出现新文件）
+            - 'modified': 文件被修改（目录中有文件新增或变化）
+            - 'stable': 文件存在且在 debounce 秒内大小不再变化，适合等待下载完成
+        timeout: 超时时间（秒）
+        debounce: 去抖时间（秒），连续变化会被合并，变化停止后才返回；对 'stable' 即为大小保持不变的时长
+        pattern: 监视目录时只关注匹配该通配符的文件名（可选），例如 '*.zip'
+    """
+    if event not in ('created', 'modified', 'stable'):
+        return f"不支持的事件类型 '{event}'，支持: created, modified, stable"
+    if isinstance(paths, str):
+        paths = [paths]
+    if not paths:
+        return "请至少提供一个要监视的路径"
+
+    watcher = None
+    try:
+        # 记录初始状态；文件目标监视其所在目录
+        targets = []
+        watch_dirs = set()
+        for path in paths:
+            path = os.path.abspath(path)
+            if os.path.isdir(path):
+                targets.append(('dir', path, _directory_snapshot(path, pattern)))
+                watch_dirs.add(path)
+            else:
+                parent = os.path.dirname(path)
+                if not os.path.isdir(parent):
+                    return f"路径 '{path}' 所在的目录不存在"
+                targets.append(('file', path, _file_signature(path)))
+                watch_dirs.add(parent)
+
+        watcher = _create_watcher(sorted(watch_dirs))
+        start_time = time.time()
+        deadline = start_time + timeout
+        # 满足条件的候选文件 -> (签名, 签名最后一次变化的时间)
+        candidates = {}
+
+        while True:
+            now = time.time()
+            current = {}
+            for kind, path, initial in targets:
+                if kind == 'file':
+                    signature = _file_signature(path)
+                    if signature is None:
+                        continue
+                    if event == 'created' and initial is not None:
+                        continue
+                    if event == 'modified' and signature == initial:
+                        continue
+                    current[path] = signature
+                else:
+                    for file_path, signature in _directory_snapshot(path, pattern).items():
+                        if initial.get(file_path) == signature:
+                            continue
+                        if event == 'created' and file_path in initial:
+                            continue
+                        current[file_path] = signature
+
+            for file_path, signature in current.items():
+                if event == 'stable' and file_path.lower().endswith(TEMP_DOWNLOAD_SUFFIXES):
+                    continue
+                previous = candidates.get(file_path)
+                if previous is None or previous[0] != signature:
+                    candidates[file_path] = (signature, now)
+
+            ready = [path for path, (_, since) in candidates.items() if path in current and now - since >= debounce]
+            if ready:
+                elapsed_time = now - start_time
+                details = [f"  {path} ({candidates[path][0][0]} 字节)" for path in ready]
+                return f"在 {elapsed_time:.2f} 秒后检测到 {event} 事件 (监视方式: {watcher.backend}):\n" + "\n".join(details)
+
+            remaining = deadline - now
+            if remaining <= 0:
+                break
+            pending = [debounce - (now - since) for path, (_, since) in candidates.items() if path in current]
+            watcher.wait(min([remaining] + pending))
+
+        return f"在 {timeout} 秒内未检测到 {event} 事件 (监视方式: {watcher.backend})"
+    except Exception as e:
+        return f"等待文件事件时出错: {str(e)}"
+    finally:
+        if watcher is not None:
+            watcher.close()
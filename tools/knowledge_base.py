@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import threading
+from typing import Optional
+from tools.text_search import BM25Index, estimate_tokens, split_markdown_sections
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 运维手册等Markdown文档放在项目根目录的 knowledge 目录下（可包含子目录）
+KNOWLEDGE_DIR = os.path.join(PROJECT_DIR, 'knowledge')
+KNOWLEDGE_INDEX_FILE = os.path.join(PROJECT_DIR, '.cache', 'knowledge_index.json')
+KNOWLEDGE_INDEX_VERSION = 1
+
+# 单个分块的最大字符数，过长的章节按段落拆分
+MAX_CHUNK_CHARS = 800
+# 两次检查文档目录是否有变化的最短间隔（秒）
+REFRESH_INTERVAL = 2.0
+
+_knowledge_base = None
+_knowledge_base_lock = threading.Lock()
+
+def _split_long_section(body: str) -> list:
+    """把过长的章节按段落拆分为多个不超过 MAX_CHUNK_CHARS 的分块"""
+    if len(body) <= MAX_CHUNK_CHARS:
+        return [body]
+    chunks = []
+    current = ''
+    for paragraph in body.split('\n\n'):
+        if current and len(current) + len(paragraph) + 2 > MAX_CHUNK_CHARS:
+            chunks.append(current)
+            current = ''
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+        while len(current) > MAX_CHUNK_CHARS:
+            chunks.append(current[:MAX_CHUNK_CHARS])
+            current = current[MAX_CHUNK_CHARS:]
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+def _chunk_document(relative_path: str, content: str) -> dict:
+    """把文档切分为带元数据的分块，返回 分块ID -> 分块"""
+    chunks = {}
+    for section_number, (title, body) in enumerate(split_markdown_sections(content)):
+        for part_number, text in enumerate(_split_long_section(body)):
+            chunk_id = f"{relative_path}#{section_number}.{part_number}"
+            chunks[chunk_id] = {'file': relative_path, 'title': title, 'text': text}
+    return chunks
+
+def _chunk_search_text(chunk: dict) -> str:
+    """用于建立索引的文本：标题权重更高，因此重复一次"""
+    return f"{chunk['title']}\n{chunk['title']}\n{chunk['text']}"
+
+def _scan_knowledge_files() -> dict:
+    """返回知识库目录中所有Markdown文件的 相对路径 -> (修改时间, 大小)"""
+    files = {}
+    for root, _, names in os.walk(KNOWLEDGE_DIR):
+        for name in names:
+            if not name.lower().endswith(('.md', '.markdown')):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stats = os.stat(path)
+            except OSError:
+                continue
+            relative_path = os.path.relpath(path, KNOWLEDGE_DIR).replace(os.sep, '/')
+            files[relative_path] = (stats.st_mtime, stats.st_size)
+    return files
+
+def _load_knowledge_base() -> dict:
+    """从磁盘加载持久化的索引，不存在或版本不符时返回空索引"""
+    try:
+        with open(KNOWLEDGE_INDEX_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') == KNOWLEDGE_INDEX_VERSION:
+            return {
+                'files': {path: tuple(info) for path, info in data['files'].items()},
+                'chunks': data['chunks'],
+                'index': BM25Index.from_dict(data['index']),
+                'checked_at': 0.0,
+            }
+    except (OSError, ValueError, KeyError):
+        pass
+    return {'files': {}, 'chunks': {}, 'index': BM25Index(), 'checked_at': 0.0}
+
+def _save_knowledge_base(knowledge_base: dict) -> None:
+    """把索引写回磁盘"""
+    os.makedirs(os.path.dirname(KNOWLEDGE_INDEX_FILE), exist_ok=True)
+    data = {
+        'version': KNOWLEDGE_INDEX_VERSION,
+        'files': knowledge_base['files'],
+        'chunks': knowledge_base['chunks'],
+        'index': knowledge_base['index'].to_dict(),
+    }
+    temp_file = KNOWLEDGE_INDEX_FILE + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temp_file, KNOWLEDGE_INDEX_FILE)
+
+def refresh_knowledge_base(force: bool = False) -> dict:
+    """增量更新知识库索引：只重新处理新增、修改或删除的文档
+
+    返回 {'added': 新增/更新的文件数, 'removed': 删除的文件数}
+    """
+    global _knowledge_base
+    with _knowledge_base_lock:
+        if _knowledge_base is None:
+            _knowledge_base = _load_knowledge_base()
+        knowledge_base = _knowledge_base
+        if not force and time.time() - knowledge_base['checked_at'] < REFRESH_INTERVAL:
+            return {'added': 0, 'removed': 0}
+        knowledge_base['checked_at'] = time.time()
+
+        current_files = _scan_knowledge_files() if os.path.isdir(KNOWLEDGE_DIR) else {}
+        changed = [path for path, info in current_files.items() if force or knowledge_base['files'].get(path) != info]
+        removed = [path for path in knowledge_base['files'] if path not in current_files]
+        if not changed and not removed:
+            return {'added': 0, 'removed': 0}
+
+        index = knowledge_base['index']
+        chunks = knowledge_base['chunks']
+        stale_files = set(changed) | set(removed)
+        for chunk_id in [cid for cid, chunk in chunks.items() if chunk['file'] in stale_files]:
+            index.remove(chunk_id, _chunk_search_text(chunks.pop(chunk_id)))
+        for path in removed:
+            del knowledge_base['files'][path]
+
+        for path in changed:
+            try:
+                with open(os.path.join(KNOWLEDGE_DIR, path), 'r', encoding='utf-8') as f:
+                    new_chunks = _chunk_document(path, f.read())
+            except (OSError, UnicodeDecodeError):
+                knowledge_base['files'].pop(path, None)
+                continue
+            for chunk_id, chunk in new_chunks.items():
+                chunks[chunk_id] = chunk
+                index.add(chunk_id, _chunk_search_text(chunk))
+            knowledge_base['files'][path] = current_files[path]
+
+        _save_knowledge_base(knowledge_base)
+        return {'added': len(changed), 'removed': len(removed)}
+
+def search_knowledge_base(query: str, top_k: int = 5, max_tokens: int = 1500, file_filter: Optional[str] = None) -> str:
+    """在内部知识库（knowledge目录下的运维手册等Markdown文档）中检索与问题最相关的内容片段
+
+    参数:
+        query: 检索关键词或用户问题
+        top_k: 最多返回的片段数量
+        max_tokens: 返回内容的大致token上限
+        file_filter: 只在文件路径包含该字符串的文档中检索（可选），例如 'vpn'
+    """
+    try:
+        if not query.strip():
+            return "请提供检索关键词"
+        start_time = time.time()
+        refresh_knowledge_base()
+        with _knowledge_base_lock:
+            knowledge_base = _knowledge_base
+            if not knowledge_base['chunks']:
+                return f"知识库为空，请把Markdown文档放到目录：{KNOWLEDGE_DIR}"
+
+            # 有文件过滤条件时多取一些候选结果再过滤
+            candidate_count = top_k * 10 if file_filter else top_k
+            results = []
+            used_tokens = 0
+            for chunk_id, score in knowledge_base['index'].search(query, candidate_count):
+                chunk = knowledge_base['chunks'][chunk_id]
+                if file_filter and file_filter.lower() not in chunk['file'].lower():
+                    continue
+                text = f"[{chunk['file']}] {chunk['title']} (相关度 {score:.2f})\n{chunk['text']}"
+                text_tokens = estimate_tokens(text)
+                # 至少返回一个片段，其余片段在预算内才返回
+                if results and used_tokens + text_tokens > max_tokens:
+                    break
+                results.append(text)
+                used_tokens += text_tokens
+                if len(results) >= top_k:
+                    break
+            document_count = len(knowledge_base['files'])
+
+        if not results:
+            return f"知识库中没有与 '{query}' 相关的内容"
+        elapsed_ms = (time.time() - start_time) * 1000
+        return (f"知识库中与 '{query}' 相关的内容 ({len(results)} 个片段, 共 {document_count} 篇文档, 耗时 {elapsed_ms:.1f} 毫秒)：\n\n"
+                + "\n\n".join(results))
+    except Exception as e:
+        return f"检索知识库时出错: {str(e)}"
@@ -1,10 +1,12 @@
 import pyautogui
-import time
 from typing import Optional, Tuple, List
+from tools.action_pacing import PACER
+from tools.text_entry import enter_text
 
 # 设置pyautogui的安全功能
 pyautogui.FAILSAFE = True  # 启用故障安全，将鼠标移动到屏幕左上角可以中断操作
-pyautogui.PAUSE = 0.1  # 每个操作之间的暂停时间（秒）
+# 不使用固定的操作间暂停，由 PACER 在操作后等待屏幕稳定，并保证操作之间的最小间隔
+pyautogui.PAUSE = 0
 
 def get_mouse_position() -> str:
     """获取当前鼠标位置"""
@@ -14,13 +16,13 @@ def get_mouse_position() -> str:
     except Exception as e:
         return f"获取鼠标位置时出错: {str(e)}"
 
-def move_mouse(x: int, y: int, duration: float = 0.2) -> str:
+def move_mouse(x: int, y: int, duration: float = 0.0) -> str:
     """移动鼠标到指定位置
     
     参数:
         x: 目标X坐标
         y: 目标Y坐标
-        duration: 移动持续时间（秒）
+        duration: 移动持续时间（秒），默认瞬间移动；需要触发悬停效果或模拟拖动轨迹时再指定
     """
     try:
         screen_width, screen_height = pyautogui.size()
@@ -28,21 +30,25 @@ def move_mouse(x: int, y: int, duration: float = 0.2) -> str:
         if x < 0 or x > screen_width or y < 0 or y > screen_height:
             return f"坐标 ({x}, {y}) 超出屏幕范围 (0,0) 到 ({screen_width},{screen_height})"
         
+        PACER.before_action()
         pyautogui.moveTo(x, y, duration=duration)
+        PACER.mark_action()
         return f"鼠标已移动到位置: X={x}, Y={y}"
     except Exception as e:
         return f"移动鼠标时出错: {str(e)}"
 
-def move_mouse_relative(dx: int, dy: int, duration: float = 0.2) -> str:
+def move_mouse_relative(dx: int, dy: int, duration: float = 0.0) -> str:
     """相对当前位置移动鼠标
     
     参数:
         dx: X方向相对移动距离
         dy: Y方向相对移动距离
-        duration: 移动持续时间（秒）
+        duration: 移动持续时间（秒），默认瞬间移动
     """
     try:
+        PACER.before_action()
         pyautogui.moveRel(dx, dy, duration=duration)
+        PACER.mark_action()
         new_x, new_y = pyautogui.position()
         return f"鼠标已相对移动 (dx={dx}, dy={dy})，新位置: X={new_x}, Y={new_y}"
     except Exception as e:
@@ -64,12 +70,16 @@ def click_mouse(x: Optional[int] = None, y: Optional[int] = None, button: str =
             if x < 0 or x > screen_width or y < 0 or y > screen_height:
                 return f"坐标 ({x}, {y}) 超出屏幕范围"
             
+            PACER.before_action()
             pyautogui.click(x, y, clicks=clicks, button=button)
+            PACER.after_action('click', x, y)
             return f"已在位置 ({x}, {y}) {button}键点击 {clicks} 次"
         else:
             # 在当前位置点击
             current_x, current_y = pyautogui.position()
+            PACER.before_action()
             pyautogui.click(clicks=clicks, button=button)
+            PACER.after_action('click', current_x, current_y)
             return f"已在当前位置 ({current_x}, {current_y}) {button}键点击 {clicks} 次"
     except Exception as e:
         return f"点击鼠标时出错: {str(e)}"
@@ -111,9 +121,11 @@ def drag_mouse(start_x: int, start_y: int, end_x: int, end_y: int, duration: flo
             return "起始或结束坐标超出屏幕范围"
         
         # 先移动到起始位置
+        PACER.before_action()
         pyautogui.moveTo(start_x, start_y)
-        # 然后拖动
+        # 然后拖动（拖动需要持续时间，应用才能识别为拖放操作）
         pyautogui.dragTo(end_x, end_y, duration=duration, button=button)
+        PACER.after_action('drag', end_x, end_y)
         return f"鼠标已从 ({start_x}, {start_y}) 拖动到 ({end_x}, {end_y})"
     except Exception as e:
         return f"拖动鼠标时出错: {str(e)}"
@@ -128,21 +140,32 @@ def press_key(key: str) -> str:
              'f1'-'f12', 'pageup', 'pagedown', 'home', 'end'
     """
     try:
+        PACER.before_action()
         pyautogui.press(key)
+        PACER.after_action('key')
         return f"已按下并释放按键: {key}"
     except Exception as e:
         return f"按键操作时出错: {str(e)}"
 
-def type_text(text: str, interval: float = 0.05) -> str:
-    """输入文本
+def type_text(text: str, interval: float = 0.0, method: str = 'auto') -> str:
+    """输入文本，支持中文等非ASCII字符
     
     参数:
         text: 要输入的文本
-        interval: 每个字符之间的间隔时间（秒）
+        interval: 每个字符之间的间隔时间（秒），默认0；只有目标程序会丢失按键时才需要设置
+        method: 输入方式，auto（自动选择，长文本和中文通过剪贴板粘贴）、paste（粘贴）、keys（发送按键）或 typed（分批逐字输入）
     """
     try:
-        pyautogui.typewrite(text, interval=interval)
-        return f"已输入文本: {text}"
+        result = enter_text(text, method=method, interval=interval)
+        method_name = {'paste': '粘贴', 'keys': '按键', 'typed': '逐字输入'}[result['method']]
+        # 长文本只回显开头，避免把整段文本再次放进对话
+        shown = text if len(text) <= 100 else f"{text[:100]}…"
+        message = f"已输入文本（{method_name}，{result['chars']} 个字符，{result['seconds']:.2f}s）: {shown}"
+        if result['note']:
+            message += f"\n{result['note']}"
+        if result['verified'] is False:
+            message += "\n注意: 输入位置附近的屏幕没有变化，请确认输入焦点在目标窗口中"
+        return message
     except Exception as e:
         return f"输入文本时出错: {str(e)}"
 
@@ -153,7 +176,9 @@ def hotkey(*keys: str) -> str:
         *keys: 要按下的按键列表，例如 hotkey('ctrl', 'c') 表示复制操作
     """
     try:
+        PACER.before_action()
         pyautogui.hotkey(*keys)
+        PACER.after_action('key')
         return f"已执行组合键: {', '.join(keys)}"
     except Exception as e:
         return f"执行组合键时出错: {str(e)}"
@@ -165,7 +190,9 @@ def scroll_mouse(amount: int) -> str:
         amount: 滚动的量，正数向上滚动，负数向下滚动
     """
     try:
+        PACER.before_action()
         pyautogui.scroll(amount)
+        PACER.after_action('scroll', *pyautogui.position())
         direction = "向上" if amount > 0 else "向下"
         return f"鼠标滚轮已{direction}滚动: {abs(amount)} 单位"
     except Exception as e:
@@ -181,8 +208,7 @@ def safe_click_sequence(clicks: List[Tuple[int, int, str]]) -> str:
     try:
         results = []
         for i, (x, y, button) in enumerate(clicks):
-            # 每次点击前短暂暂停
-            time.sleep(0.2)
+            # 每次点击后等待屏幕稳定（由click_mouse完成），不再固定暂停
             result = click_mouse(x, y, button=button)
             results.append(f"步骤 {i+1}: {result}")
         return "\n".join(results)
@@ -199,10 +225,8 @@ def safe_type_and_click(text: str, click_x: int, click_y: int, button: str = 'le
         button: 点击按钮
     """
     try:
-        # 先点击
+        # 先点击，click_mouse会等待界面响应并稳定，确保焦点已经切换
         click_result = click_mouse(click_x, click_y, button=button)
-        # 短暂暂停以确保焦点正确
-        time.sleep(0.3)
         # 然后输入文本
         type_result = type_text(text)
         return f"{click_result}\n{type_result}"
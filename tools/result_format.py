@@ -0,0 +1,142 @@
+import sys
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Sequence
+from tools.text_search import estimate_tokens
+
+class TableText(str):
+    """format_table 的输出：额外记录同样的内容按改为表格之前的逐行标注格式（“列名: 值, 列名: 值”）输出时的大小，
+    用于统计表格格式节省的token；该格式是对各工具原来输出的近似估算"""
+    legacy_chars = 0
+    legacy_tokens = 0
+
+def _table_text(text: str, legacy_chars: int, legacy_tokens: int) -> TableText:
+    result = TableText(text)
+    result.legacy_chars = legacy_chars
+    result.legacy_tokens = legacy_tokens
+    return result
+
+def format_table(title: str, columns: Sequence[str], rows: Iterable[Sequence]) -> TableText:
+    """把多行结果格式化为紧凑的表格：第一行是标题、行数和列名，之后每行一条记录，列之间用 | 分隔
+
+    例如 format_table('进程', ['名称', 'PID', '内存MB'], rows) 返回:
+        进程 (2): 名称|PID|内存MB
+        chrome.exe|1234|350.2
+        explorer.exe|567|80.1
+    """
+    rows = [[_cell(value) for value in row] for row in rows]
+    lines = [f"{title} ({len(rows)}): {'|'.join(columns)}"]
+    lines.extend('|'.join(row) for row in rows)
+    legacy = "\n".join([f"{title} ({len(rows)}):"] + [", ".join(f"{column}: {value}" for column, value in zip(columns, row))
+                                                      for row in rows])
+    return _table_text("\n".join(lines), len(legacy), estimate_tokens(legacy))
+
+def join_sections(*sections: str) -> str:
+    """按行拼接多段输出（例如摘要和若干表格），保留其中表格的原格式大小统计"""
+    text = "\n".join(sections)
+    if not any(isinstance(section, TableText) for section in sections):
+        return text
+    legacy_chars = len(sections) - 1 + sum(section.legacy_chars if isinstance(section, TableText) else len(section)
+                                           for section in sections)
+    legacy_tokens = sum(section.legacy_tokens if isinstance(section, TableText) else estimate_tokens(section)
+                        for section in sections)
+    return _table_text(text, legacy_chars, legacy_tokens)
+
+def _cell(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return f"{value:g}"
+    # 单元格中的分隔符和换行会破坏表格结构
+    return str(value).replace('|', '/').replace('\n', ' ')
+
+def format_size(size_bytes: float) -> str:
+    """紧凑的文件大小，例如 1.5MB"""
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size_bytes < 1024 or unit == 'TB':
+            break
+        size_bytes /= 1024
+    return f"{int(size_bytes)}B" if unit == 'B' else f"{size_bytes:.1f}{unit}"
+
+class OutputStore:
+    """保存被截断的工具输出全文，模型需要时用 read_tool_output 按句柄分段读取
+
+    参数:
+        max_entries: 最多保存的输出数量，超过时删除最早的
+        max_age: 保存时间（秒）
+    """
+
+    def __init__(self, max_entries: int = 50, max_age: float = 3600.0):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def put(self, tool_name: str, text: str) -> str:
+        handle = f"{tool_name}-{uuid.uuid4().hex[:6]}"
+        with self.lock:
+            self.entries[handle] = (time.time(), text)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return handle
+
+    def get(self, handle: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(handle)
+            if entry is None or time.time() - entry[0] > self.max_age:
+                self.entries.pop(handle, None)
+                return None
+            return entry[1]
+
+    def clear(self) -> int:
+        with self.lock:
+            count = len(self.entries)
+            self.entries.clear()
+        return count
+
+    @property
+    def total_chars(self) -> int:
+        with self.lock:
+            return sum(len(text) for _, text in self.entries.values())
+
+    def memory_bytes(self) -> int:
+        """保存的输出占用的内存（字节）"""
+        with self.lock:
+            return sum(sys.getsizeof(text) for _, text in self.entries.values())
+
+    def trim(self, max_bytes: int) -> int:
+        """删除最早保存的输出，直到占用的内存不超过 max_bytes，返回释放的字节数"""
+        freed = 0
+        with self.lock:
+            total = sum(sys.getsizeof(text) for _, text in self.entries.values())
+            while self.entries and total > max_bytes:
+                _, (_, text) = self.entries.popitem(last=False)
+                total -= sys.getsizeof(text)
+                freed += sys.getsizeof(text)
+        return freed
+
+# 所有工具共用的截断输出存储
+OUTPUT_STORE = OutputStore()
+
+def read_tool_output(handle: str, offset: int = 0, max_chars: int = 2000) -> str:
+    """读取之前被截断的工具输出的剩余部分
+
+    参数:
+        handle: 截断提示中给出的输出句柄
+        offset: 从第几个字符开始读取，截断提示中会给出
+        max_chars: 本次最多读取的字符数
+    """
+    try:
+        text = OUTPUT_STORE.get(handle)
+        if text is None:
+            return f"输出句柄 '{handle}' 不存在或已过期，请重新调用原来的工具"
+        offset = max(0, int(offset))
+        part = text[offset:offset + max_chars]
+        end = offset + len(part)
+        if end < len(text):
+            return f"{part}\n[第 {offset}-{end} 字符，共 {len(text)} 字符；继续读取: read_tool_output(handle='{handle}', offset={end})]"
+        return f"{part}\n[第 {offset}-{end} 字符，已读完]"
+    except Exception as e:
+        return f"读取工具输出时出错: {str(e)}"
@@ -0,0 +1,131 @@
+import sys
+import time
+import string
+from typing import Optional
+from tools.action_pacing import PACER
+
+# 超过该长度的文本优先粘贴；较短的文本直接发送按键，不改动剪贴板
+PASTE_MIN_CHARS = 64
+# 按键模式每批发送的字符数，批与批之间保留最小间隔，避免输入缓冲区溢出丢键
+KEY_CHUNK_CHARS = 200
+# 逐字输入模式每批的字符数，每批输入后等待屏幕稳定
+TYPED_CHUNK_CHARS = 20
+# pyautogui 可以直接发送按键的字符（其他字符，例如中文，只能通过剪贴板输入）
+TYPEABLE_CHARS = set(string.ascii_letters + string.digits + string.punctuation + ' \n\t')
+PASTE_KEYS = ('command', 'v') if sys.platform == 'darwin' else ('ctrl', 'v')
+# 按下粘贴键后至少等待这么久（秒）再恢复剪贴板：屏幕稳定检测可能关闭（ACTION_SETTLE=0）或截图失败而立即返回，
+# 目标程序可能还没有读取剪贴板
+PASTE_RESTORE_DELAY = 0.15
+
+STATS = {'calls': 0, 'chars': 0, 'seconds': 0.0, 'by_method': {}, 'unverified': 0}
+
+def is_typeable(text: str) -> bool:
+    return all(char in TYPEABLE_CHARS for char in text)
+
+def _clipboard():
+    # pyperclip 随 pyautogui 一起安装（pyautogui -> mouseinfo -> pyperclip）
+    import pyperclip
+    return pyperclip
+
+def _paste(text: str) -> Optional[str]:
+    """通过剪贴板粘贴文本，之后恢复原来的剪贴板内容；返回None表示成功，否则返回失败原因"""
+    import pyautogui
+    try:
+        clipboard = _clipboard()
+    except ImportError:
+        return "没有安装 pyperclip，无法使用剪贴板"
+    try:
+        previous = clipboard.paste()
+    except Exception:
+        previous = None
+    try:
+        clipboard.copy(text)
+        # 确认剪贴板中确实是要输入的文本，避免粘贴出其他内容
+        if clipboard.paste() != text:
+            return "写入剪贴板后读取的内容不一致"
+    except Exception as e:
+        return f"写入剪贴板失败: {str(e)}"
+    PACER.before_action()
+    pyautogui.hotkey(*PASTE_KEYS)
+    pasted_at = time.perf_counter()
+    # 等目标程序读取剪贴板（屏幕稳定，且不少于 PASTE_RESTORE_DELAY）之后再恢复原来的内容
+    PACER.after_action('type', *pyautogui.position())
+    remaining = PASTE_RESTORE_DELAY - (time.perf_counter() - pasted_at)
+    if remaining > 0:
+        time.sleep(remaining)
+    if previous is not None:
+        try:
+            clipboard.copy(previous)
+        except Exception:
+            pass
+    return None
+
+def _send_keys(text: str, chunk_chars: int, interval: float, settle: bool) -> None:
+    import pyautogui
+    for start in range(0, len(text), chunk_chars):
+        PACER.before_action()
+        pyautogui.write(text[start:start + chunk_chars], interval=interval)
+        if settle:
+            PACER.after_action('type', *pyautogui.position())
+        else:
+            PACER.mark_action()
+
+def choose_method(text: str, method: str = 'auto', interval: float = 0.0) -> str:
+    """选择输入方式：paste（剪贴板粘贴）、keys（连续发送按键）或 typed（分批逐字输入）
+
+    文本包含无法通过按键输入的字符（例如中文）时，即使指定了 keys 或 typed 也使用粘贴。
+    """
+    if not is_typeable(text):
+        return 'paste'
+    if method != 'auto':
+        return method
+    if interval > 0:
+        return 'typed'
+    return 'paste' if len(text) >= PASTE_MIN_CHARS else 'keys'
+
+def enter_text(text: str, method: str = 'auto', interval: float = 0.0) -> dict:
+    """用最快的可靠方式输入文本，返回 {'method', 'chars', 'seconds', 'verified', 'note'}
+
+    参数:
+        text: 要输入的文本
+        method: auto（自动选择）、paste、keys 或 typed
+        interval: 每个字符之间的间隔时间（秒），大于0时逐字输入，用于会丢键的程序
+    """
+    import pyautogui
+    start = time.perf_counter()
+    requested = method
+    method = choose_method(text, method, interval)
+    note = ''
+    if requested in ('keys', 'typed') and method == 'paste':
+        note = f"文本包含无法通过按键输入的字符，已改为粘贴（而不是 {requested}）"
+    # 文本出现在输入焦点处，而不是鼠标指针处；只有知道焦点位置（最后一次点击的位置）时才检查输入是否生效
+    focus = PACER.focus_point
+    x, y = focus or pyautogui.position()
+    before = PACER.snapshot(x, y) if focus else None
+    if method == 'paste':
+        error = _paste(text)
+        if error:
+            if not is_typeable(text):
+                raise RuntimeError(f"文本包含无法通过按键输入的字符（例如中文），且{error}")
+            note = f"剪贴板不可用（{error}），已改为发送按键"
+            method = 'keys'
+    if method == 'keys':
+        _send_keys(text, KEY_CHUNK_CHARS, 0.0, settle=False)
+        PACER.after_action('type', x, y)
+    elif method == 'typed':
+        _send_keys(text, TYPED_CHUNK_CHARS, interval or 0.01, settle=True)
+    elif method != 'paste':
+        raise ValueError(f"未知的输入方式: {method}")
+    # 输入点附近的屏幕没有任何变化时，文本可能没有输入到目标窗口
+    verified = PACER.has_changed(before, PACER.snapshot(x, y)) if focus and text.strip() else None
+    seconds = time.perf_counter() - start
+    STATS['calls'] += 1
+    STATS['chars'] += len(text)
+    STATS['seconds'] += seconds
+    method_stats = STATS['by_method'].setdefault(method, {'calls': 0, 'chars': 0, 'seconds': 0.0})
+    method_stats['calls'] += 1
+    method_stats['chars'] += len(text)
+    method_stats['seconds'] += seconds
+    if verified is False:
+        STATS['unverified'] += 1
+    return {'method': method, 'chars': len(text), 'seconds': seconds, 'verified': verified, 'note': note}
@@ -0,0 +1,119 @@
+import re
+import math
+from typing import Any, List, Optional, Tuple
+
+# 英文单词/数字，以及连续的中日韩字符
+_WORD_PATTERN = re.compile(r'[a-z0-9_]+|[\u3400-\u9fff\uf900-\ufaff]+')
+_CJK_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+_HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+
+def tokenize(text: str) -> List[str]:
+    """把文本切分为检索用的词：英文按单词，中文按相邻两字（单字片段保留单字）"""
+    tokens = []
+    for word in _WORD_PATTERN.findall(text.lower()):
+        if _CJK_PATTERN.match(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的模型token数：中文约每字一个token，其余约每4个字符一个token"""
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+def split_markdown_sections(content: str) -> List[Tuple[str, str]]:
+    """按标题把Markdown切分为章节，返回 (标题路径, 章节内容) 列表
+
+    标题路径包含所有上级标题，例如 'Windows系统操作教程 > 文件和文件夹操作 > 创建文件夹'。
+    没有正文的标题（只包含下级标题）不会单独成为章节。
+    """
+    sections = []
+    heading_stack = []
+    lines = []
+
+    def flush():
+        body = '\n'.join(lines).strip()
+        if body:
+            title = ' > '.join(text for _, text in heading_stack) or '(前言)'
+            sections.append((title, body))
+
+    in_code_block = False
+    for line in content.splitlines():
+        if line.lstrip().startswith('```'):
+            in_code_block = not in_code_block
+        match = None if in_code_block else _HEADING_PATTERN.match(line)
+        if match:
+            flush()
+            lines = []
+            level = len(match.group(1))
+            heading_stack = [(lv, text) for lv, text in heading_stack if lv < level]
+            heading_stack.append((level, match.group(2)))
+        else:
+            lines.append(line)
+    flush()
+    return sections
+
+class BM25Index:
+    """简单的BM25倒排索引，支持增量添加/删除文档以及序列化为字典"""
+
+    def __init__(self, documents: Optional[List[str]] = None, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = {}  # 文档ID -> 词数
+        self.postings = {}  # 词 -> {文档ID: 词频}
+        self.total_length = 0
+        for doc_id, document in enumerate(documents or []):
+            self.add(doc_id, document)
+
+    def add(self, doc_id, document: str) -> None:
+        """添加一个文档"""
+        tokens = tokenize(document)
+        self.doc_lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+        for token in tokens:
+            doc_counts = self.postings.setdefault(token, {})
+            doc_counts[doc_id] = doc_counts.get(doc_id, 0) + 1
+
+    def remove(self, doc_id, document: str) -> None:
+        """删除一个文档，document 需与添加时的内容一致"""
+        if doc_id not in self.doc_lengths:
+            return
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for token in set(tokenize(document)):
+            doc_counts = self.postings.get(token)
+            if doc_counts is not None:
+                doc_counts.pop(doc_id, None)
+                if not doc_counts:
+                    del self.postings[token]
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[Any, float]]:
+        """返回得分最高的 (文档ID, 得分) 列表，得分为0的文档不返回"""
+        doc_count = len(self.doc_lengths)
+        avg_length = (self.total_length / doc_count) if doc_count else 0.0
+        scores = {}
+        for token in set(tokenize(query)):
+            doc_counts = self.postings.get(token)
+            if not doc_counts:
+                continue
+            idf = math.log(1 + (doc_count - len(doc_counts) + 0.5) / (len(doc_counts) + 0.5))
+            for doc_id, frequency in doc_counts.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / (avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def to_dict(self) -> dict:
+        """序列化为可写入JSON的字典（文档ID需为字符串）"""
+        return {'k1': self.k1, 'b': self.b, 'doc_lengths': self.doc_lengths, 'postings': self.postings}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BM25Index':
+        """从 to_dict 的结果恢复索引"""
+        index = cls(k1=data['k1'], b=data['b'])
+        index.doc_lengths = data['doc_lengths']
+        index.postings = data['postings']
+        index.total_length = sum(index.doc_lengths.values())
+        return index
@@ -2,6 +2,8 @@ import pyautogui
 import time
 import os
 from typing import Optional, Tuple
+from tools.action_pacing import PACER
+from tools.result_format import format_table
 
 def get_screen_size() -> str:
     """获取屏幕尺寸信息"""
@@ -81,13 +83,8 @@ def locate_all_on_screen(image_path: str, confidence: float = 0.7, grayscale: bo
             positions = list(pyautogui.locateAllOnScreen(image_path, grayscale=grayscale))
         
         if positions:
-            results = []
-            for i, position in enumerate(positions):
-                x, y, width, height = position
-                center_x = x + width // 2
-                center_y = y + height // 2
-                results.append(f"匹配 {i+1}: X={x}, Y={y}, 宽度={width}, 高度={height}, 中心点: ({center_x}, {center_y})")
-            return f"找到 {len(positions)} 个匹配 '{image_path}' 的图像:\n" + "\n".join(results)
+            rows = [(x + width // 2, y + height // 2, x, y, width, height) for x, y, width, height in positions]
+            return format_table(f"匹配 '{image_path}' 的图像", ["中心X", "中心Y", "X", "Y", "宽度", "高度"], rows)
         else:
             return f"未在屏幕上找到图像 '{image_path}'"
     except Exception as e:
@@ -147,8 +144,10 @@ def click_on_image(image_path: str, confidence: float = 0.7, button: str = 'left
         if position:
             # 获取图像中心点
             center_x, center_y = pyautogui.center(position)
-            # 点击该位置
+            # 点击该位置，之后等待屏幕稳定
+            PACER.before_action()
             pyautogui.click(center_x, center_y, clicks=clicks, button=button)
+            PACER.after_action('click', center_x, center_y)
             return f"已在找到的图像 '{image_path}' 中心点 ({center_x}, {center_y}) 进行 {button}键点击 {clicks} 次"
         else:
             return f"未在屏幕上找到图像 '{image_path}'，无法进行点击操作"
@@ -179,7 +178,9 @@ def wait_and_click_image(image_path: str, timeout: int = 10, confidence: float =
             if position:
                 # 获取图像中心点并点击
                 center_x, center_y = pyautogui.center(position)
+                PACER.before_action()
                 pyautogui.click(center_x, center_y, button=button)
+                PACER.after_action('click', center_x, center_y)
                 elapsed_time = time.time() - start_time
                 return f"在 {elapsed_time:.2f} 秒后找到并点击了图像 '{image_path}'，位置: ({center_x}, {center_y})"
             time.sleep(0.5)
@@ -2,6 +2,7 @@ import os
 import subprocess
 import platform
 from typing import List, Optional
+from tools.result_format import format_table
 
 def get_system_info() -> str:
     """获取Windows系统的基本信息"""
@@ -81,13 +82,14 @@ def get_running_processes(max_count: int = 20) -> str:
             if len(parts) >= 3:
                 name = ' '.join(parts[:-2])
                 pid = parts[-2]
-                memory_mb = round(int(parts[-1]) / 1024 / 1024, 2)
-                processes.append(f"进程名: {name}, PID: {pid}, 内存: {memory_mb} MB")
+                memory_mb = round(int(parts[-1]) / 1024 / 1024, 1)
+                processes.append((name, pid, memory_mb))
         
         # 按内存使用量排序并限制数量
+        processes.sort(key=lambda process: process[2], reverse=True)
         processes = processes[:max_count]
         
-        return f"当前运行的进程 ({len(processes)}):\n" + "\n".join(processes)
+        return format_table("当前运行的进程（按内存排序）", ["进程名", "PID", "内存MB"], processes)
     except Exception as e:
         return f"获取进程列表时出错: {str(e)}"
 
@@ -111,9 +113,9 @@ def check_disk_space() -> str:
                 used_gb = total_gb - free_gb
                 usage_percent = round((used_gb / total_gb) * 100, 1)
                 
-                disk_info.append(f"驱动器 {drive}: 总计 {total_gb} GB, 已用 {used_gb} GB, 可用 {free_gb} GB ({usage_percent}%)")
+                disk_info.append((drive, total_gb, round(used_gb, 2), free_gb, usage_percent))
         
-        return f"磁盘空间使用情况:\n" + "\n".join(disk_info)
+        return format_table("磁盘空间使用情况", ["驱动器", "总计GB", "已用GB", "可用GB", "使用率%"], disk_info)
     except Exception as e:
         return f"检查磁盘空间时出错: {str(e)}"
 
@@ -132,9 +134,9 @@ def find_file(file_name: str, search_path: str = "C:") -> str:
         command = f'where /r "{search_path}" "{file_name}"'
         result = subprocess.check_output(command, shell=True, universal_newlines=True, stderr=subprocess.STDOUT)
         
-        files = result.strip().split('\n')
-        if files and files[0]:  # 确保有结果
-            return f"找到 {len(files)} 个匹配的文件:\n" + "\n".join(files)
+        files = [line.strip() for line in result.strip().split('\n') if line.strip()]
+        if files:  # 确保有结果
+            return format_table(f"匹配 '{file_name}' 的文件", ["路径"], [(path,) for path in files])
         else:
             return f"在 '{search_path}' 下未找到匹配 '{file_name}' 的文件"
     except subprocess.CalledProcessError as e: